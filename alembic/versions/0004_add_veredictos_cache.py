@@ -0,0 +1,26 @@
+"""
+Revision ID: 0004_add_veredictos_cache
+Revises: 0003_add_origen_to_analisis
+Create Date: 2026-10-17 10:00:00
+
+"""
+revision = '0004_add_veredictos_cache'
+down_revision = '0003_add_origen_to_analisis'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'veredictos_cache',
+        sa.Column('clave', sa.String(64), primary_key=True),
+        sa.Column('modelo', sa.String, nullable=False),
+        sa.Column('version_prompt', sa.String, nullable=False),
+        sa.Column('resultado', sa.Text, nullable=False),
+        sa.Column('fecha_creacion', sa.DateTime, nullable=False, server_default=sa.func.now()),
+    )
+
+def downgrade():
+    op.drop_table('veredictos_cache')
@@ -0,0 +1,19 @@
+"""
+Revision ID: 0005_add_analisis_historial_index
+Revises: 0004_add_veredictos_cache
+Create Date: 2026-10-17 12:00:00
+
+"""
+revision = '0005_add_analisis_historial_index'
+down_revision = '0004_add_veredictos_cache'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_index('ix_analisis_usuario_fecha_id', 'analisis', ['usuario_id', 'fecha', 'id'])
+
+def downgrade():
+    op.drop_index('ix_analisis_usuario_fecha_id', table_name='analisis')
@@ -0,0 +1,36 @@
+"""
+Revision ID: 0006_add_sesiones
+Revises: 0005_add_analisis_historial_index
+Create Date: 2026-10-17 14:00:00
+
+"""
+revision = '0006_add_sesiones'
+down_revision = '0005_add_analisis_historial_index'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'sesiones',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('usuario_id', sa.Integer, sa.ForeignKey('usuarios.id'), nullable=False),
+        sa.Column('session_id', sa.String, nullable=False),
+        sa.Column('origen', sa.String, nullable=True),
+        sa.Column('transcripcion', sa.Text, nullable=False, server_default=''),
+        sa.Column('ultimo_resultado', sa.Text, nullable=True),
+        sa.Column('riesgo_max', sa.Integer, nullable=True),
+        sa.Column('fragmentos', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('fecha_inicio', sa.DateTime, nullable=False, server_default=sa.func.now()),
+        sa.Column('fecha_actualizacion', sa.DateTime, nullable=False, server_default=sa.func.now()),
+        sa.UniqueConstraint('usuario_id', 'session_id', name='uq_sesiones_usuario_session'),
+    )
+    op.create_index('ix_sesiones_id', 'sesiones', ['id'])
+    op.create_index('ix_sesiones_usuario_actualizacion_id', 'sesiones', ['usuario_id', 'fecha_actualizacion', 'id'])
+
+def downgrade():
+    op.drop_index('ix_sesiones_usuario_actualizacion_id', table_name='sesiones')
+    op.drop_index('ix_sesiones_id', table_name='sesiones')
+    op.drop_table('sesiones')
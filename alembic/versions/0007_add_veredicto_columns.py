@@ -0,0 +1,76 @@
+"""
+Revision ID: 0007_add_veredicto_columns
+Revises: 0006_add_sesiones
+Create Date: 2026-10-17 16:00:00
+
+"""
+revision = '0007_add_veredicto_columns'
+down_revision = '0006_add_sesiones'
+branch_labels = None
+depends_on = None
+
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+LOTE = 1000
+
+
+def _campos(texto):
+    # Misma lectura que Veredicto.desde_texto; se copia para no importar la aplicación desde la migración
+    diagnostico = re.search(r"Diagn[oó]stico:\s*(.+)", texto or "")
+    explicacion = re.search(r"Explicaci[oó]n:\s*(.+?)(?:\n\s*\n|\Z)", texto or "", re.S)
+    riesgo = re.search(r"Riesgo:\s*([0-9]{1,3})\s*/\s*100", texto or "")
+    valor = " ".join(diagnostico.group(1).lower().split()) if diagnostico else ""
+    if valor.startswith("no"):
+        valor = "No Estafa" if "estafa" in valor else None
+    else:
+        valor = "Estafa" if "estafa" in valor else None
+    return {
+        "diagnostico": valor,
+        "riesgo": min(100, int(riesgo.group(1))) if riesgo else None,
+        "explicacion": explicacion.group(1).strip() if explicacion else None,
+    }
+
+
+def _rellenar(tabla, columna_texto):
+    # Por lotes de id para no cargar la tabla entera ni mantener una transacción enorme abierta
+    conexion = op.get_bind()
+    t = sa.table(tabla, sa.column('id', sa.Integer), sa.column(columna_texto, sa.Text),
+                 sa.column('diagnostico', sa.String), sa.column('riesgo', sa.Integer), sa.column('explicacion', sa.Text))
+    actualizar = t.update().where(t.c.id == sa.bindparam('_id')).values(
+        diagnostico=sa.bindparam('diagnostico'), riesgo=sa.bindparam('riesgo'), explicacion=sa.bindparam('explicacion'))
+    ultimo = 0
+    while True:
+        filas = conexion.execute(
+            sa.select(t.c.id, t.c[columna_texto])
+            .where(t.c.id > ultimo, t.c[columna_texto].isnot(None))
+            .order_by(t.c.id).limit(LOTE)
+        ).all()
+        if not filas:
+            break
+        cambios = [{"_id": fila[0], **_campos(fila[1])} for fila in filas]
+        cambios = [c for c in cambios if c["diagnostico"] or c["riesgo"] is not None]
+        if cambios:
+            conexion.execute(actualizar, cambios)
+        ultimo = filas[-1][0]
+
+
+def upgrade():
+    for tabla in ('analisis', 'sesiones'):
+        op.add_column(tabla, sa.Column('diagnostico', sa.String(16), nullable=True))
+        op.add_column(tabla, sa.Column('riesgo', sa.Integer(), nullable=True))
+        op.add_column(tabla, sa.Column('explicacion', sa.Text(), nullable=True))
+    _rellenar('analisis', 'resultado')
+    _rellenar('sesiones', 'ultimo_resultado')
+    op.create_index('ix_analisis_fecha_riesgo', 'analisis', ['fecha', 'riesgo'])
+    op.create_index('ix_analisis_diagnostico_fecha', 'analisis', ['diagnostico', 'fecha'])
+
+def downgrade():
+    op.drop_index('ix_analisis_diagnostico_fecha', table_name='analisis')
+    op.drop_index('ix_analisis_fecha_riesgo', table_name='analisis')
+    for tabla in ('sesiones', 'analisis'):
+        op.drop_column(tabla, 'explicacion')
+        op.drop_column(tabla, 'riesgo')
+        op.drop_column(tabla, 'diagnostico')
@@ -0,0 +1,38 @@
+"""
+Revision ID: 0008_add_analisis_diarios
+Revises: 0007_add_veredicto_columns
+Create Date: 2026-10-17 18:00:00
+
+"""
+revision = '0008_add_analisis_diarios'
+down_revision = '0007_add_veredicto_columns'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table(
+        'analisis_diarios',
+        sa.Column('usuario_id', sa.Integer, sa.ForeignKey('usuarios.id'), primary_key=True),
+        sa.Column('dia', sa.Date, primary_key=True),
+        sa.Column('origen', sa.String, primary_key=True),
+        sa.Column('diagnostico', sa.String(16), primary_key=True),
+        sa.Column('tramo_riesgo', sa.Integer, primary_key=True),
+        sa.Column('total', sa.Integer, nullable=False),
+        sa.Column('suma_riesgo', sa.Integer, nullable=False),
+    )
+    # Mismas claves que app/analitica.py: '' sin origen/diagnóstico, -1 sin riesgo, el 100 en el tramo 9
+    op.execute(
+        "INSERT INTO analisis_diarios (usuario_id, dia, origen, diagnostico, tramo_riesgo, total, suma_riesgo) "
+        "SELECT usuario_id, date(fecha), coalesce(origen, ''), coalesce(diagnostico, ''), "
+        "CASE WHEN riesgo IS NULL THEN -1 WHEN riesgo >= 90 THEN 9 ELSE riesgo / 10 END, "
+        "count(*), coalesce(sum(riesgo), 0) "
+        "FROM analisis WHERE fecha IS NOT NULL GROUP BY 1, 2, 3, 4, 5"
+    )
+    op.create_index('ix_sesiones_usuario_riesgo_max', 'sesiones', ['usuario_id', 'riesgo_max'])
+
+def downgrade():
+    op.drop_index('ix_sesiones_usuario_riesgo_max', table_name='sesiones')
+    op.drop_table('analisis_diarios')
@@ -0,0 +1,38 @@
+"""
+Revision ID: 0009_sesiones_en_analisis_diarios
+Revises: 0008_add_analisis_diarios
+Create Date: 2026-10-17 21:00:00
+
+"""
+revision = '0009_sesiones_en_analisis_diarios'
+down_revision = '0008_add_analisis_diarios'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+# Aportación de las sesiones con veredicto: una por sesión, el día en que empezó (ver app/analitica.py)
+_APORTES = (
+    "SELECT usuario_id, date(fecha_inicio) AS dia, coalesce(origen, '') AS origen, coalesce(diagnostico, '') AS diagnostico, "
+    "CASE WHEN riesgo IS NULL THEN -1 WHEN riesgo >= 90 THEN 9 ELSE riesgo / 10 END AS tramo_riesgo, "
+    "count(*) AS total, coalesce(sum(riesgo), 0) AS suma_riesgo "
+    "FROM sesiones WHERE diagnostico IS NOT NULL OR riesgo IS NOT NULL GROUP BY 1, 2, 3, 4, 5"
+)
+
+def upgrade():
+    op.execute(
+        "INSERT INTO analisis_diarios (usuario_id, dia, origen, diagnostico, tramo_riesgo, total, suma_riesgo) "
+        f"SELECT * FROM ({_APORTES}) AS aportes WHERE true "
+        "ON CONFLICT (usuario_id, dia, origen, diagnostico, tramo_riesgo) DO UPDATE SET "
+        "total = analisis_diarios.total + excluded.total, suma_riesgo = analisis_diarios.suma_riesgo + excluded.suma_riesgo"
+    )
+
+def downgrade():
+    op.execute(
+        f"UPDATE analisis_diarios SET total = analisis_diarios.total - aportes.total, "
+        "suma_riesgo = analisis_diarios.suma_riesgo - aportes.suma_riesgo "
+        f"FROM ({_APORTES}) AS aportes "
+        "WHERE analisis_diarios.usuario_id = aportes.usuario_id AND analisis_diarios.dia = aportes.dia "
+        "AND analisis_diarios.origen = aportes.origen AND analisis_diarios.diagnostico = aportes.diagnostico "
+        "AND analisis_diarios.tramo_riesgo = aportes.tramo_riesgo"
+    )
@@ -0,0 +1,19 @@
+"""
+Revision ID: 0010_add_veredictos_cache_fecha_index
+Revises: 0009_sesiones_en_analisis_diarios
+Create Date: 2026-10-18 10:00:00
+
+"""
+revision = '0010_add_veredictos_cache_fecha_index'
+down_revision = '0009_sesiones_en_analisis_diarios'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_index('ix_veredictos_cache_fecha_creacion', 'veredictos_cache', ['fecha_creacion'])
+
+def downgrade():
+    op.drop_index('ix_veredictos_cache_fecha_creacion', table_name='veredictos_cache')
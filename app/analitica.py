@@ -0,0 +1,243 @@
+"""Agregados de riesgo por usuario para los paneles (``/estadisticas/*``).
+
+Los conteos se leen de ``analisis_diarios``, una tabla resumen con una fila por
+usuario, día, origen, diagnóstico y tramo de riesgo. Se mantiene de forma incremental
+en la misma transacción que inserta o borra los análisis (escritor diferido, ``POST``
+y ``DELETE /analisis``), así que siempre cuadra con ``analisis`` y un panel de meses
+agrupa unos cientos de filas en lugar de todo el historial.
+
+Las llamadas en vivo se guardan en ``sesiones`` y cuentan como un análisis más, con el
+último veredicto de la sesión y el día en que empezó: cada upsert del escritor resta
+la aportación anterior de la sesión y suma la nueva (``registrar_sesiones``). Para que
+dos escritores no sumen dos veces la primera aportación de una sesión nueva, la fila
+se crea vacía (sin veredicto, no aporta nada) antes de bloquearla.
+"""
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, case, tuple_
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database import engine
+from app import models
+from app.core.veredicto import Diagnostico
+
+ANALITICA_DIAS = int(os.getenv("ANALITICA_DIAS", "30"))      # Ventana por defecto de los paneles
+ANALITICA_RIESGO_ALTO = int(os.getenv("ANALITICA_RIESGO_ALTO", "80"))  # Se redondea al tramo de 10 puntos
+
+# Claves de la tabla resumen: en la clave primaria no caben NULL, se guardan como '' y -1
+SIN_VALOR = ""
+SIN_RIESGO = -1
+
+
+def tramo_riesgo(riesgo):
+    """Tramo de 10 puntos (0-9 ... 90-100); el 100 cae en el último."""
+    if riesgo is None:
+        return SIN_RIESGO
+    return min(int(riesgo) // 10, 9)
+
+
+def deltas(filas, signo=1):
+    """Incrementos de la tabla resumen para unas filas de ``Analisis`` (dicts), ordenados por clave."""
+    totales, sumas = Counter(), Counter()
+    for fila in filas:
+        fecha = fila.get("fecha") or datetime.utcnow()
+        clave = (
+            fila["usuario_id"],
+            fecha.date(),
+            fila.get("origen") or SIN_VALOR,
+            fila.get("diagnostico") or SIN_VALOR,
+            tramo_riesgo(fila.get("riesgo")),
+        )
+        totales[clave] += signo
+        sumas[clave] += signo * (fila.get("riesgo") or 0)
+    # Mismo orden de claves en todas las transacciones para no provocar interbloqueos
+    return [
+        {"usuario_id": u, "dia": d, "origen": o, "diagnostico": g, "tramo_riesgo": t,
+         "total": totales[(u, d, o, g, t)], "suma_riesgo": sumas[(u, d, o, g, t)]}
+        for u, d, o, g, t in sorted(totales)
+    ]
+
+
+def sumar(incrementos):
+    """Upsert que suma los incrementos a las filas existentes de la tabla resumen."""
+    D = models.AnalisisDiario
+    insertar = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    consulta = insertar(D).values(incrementos)
+    return consulta.on_conflict_do_update(
+        index_elements=[D.usuario_id, D.dia, D.origen, D.diagnostico, D.tramo_riesgo],
+        set_={
+            "total": D.total + consulta.excluded.total,
+            "suma_riesgo": D.suma_riesgo + consulta.excluded.suma_riesgo,
+        },
+    )
+
+
+async def registrar(db, filas, signo=1):
+    """Aplica a la tabla resumen, dentro de la transacción de ``db``, el alta (o baja) de unas filas."""
+    incrementos = deltas(filas, signo)
+    if incrementos:
+        await db.execute(sumar(incrementos))
+
+
+def aporte_sesion(sesion):
+    """Fila equivalente de una sesión (dict) para la tabla resumen; ``None`` si aún no tiene veredicto."""
+    if sesion is None or (sesion.get("diagnostico") is None and sesion.get("riesgo") is None):
+        return None
+    return {
+        "usuario_id": sesion["usuario_id"],
+        "fecha": sesion["fecha_inicio"],
+        "origen": sesion.get("origen"),
+        "diagnostico": sesion.get("diagnostico"),
+        "riesgo": sesion.get("riesgo"),
+    }
+
+
+async def registrar_sesiones(db, estados):
+    """Antes del upsert de ``estados`` (ver app/escritura.py): cambia en la tabla resumen la
+    aportación de cada sesión por la que tendrá tras el upsert, dentro de la misma transacción."""
+    if not estados:
+        return
+    S = models.Sesion
+    estados_ordenados = sorted(estados, key=lambda e: (e["usuario_id"], e["session_id"]))
+    claves = [(e["usuario_id"], e["session_id"]) for e in estados_ordenados]
+    # SELECT ... FOR UPDATE no bloquea una fila que aún no existe: se crean vacías las que falten.
+    # Si otro escritor está creando la misma sesión, el INSERT espera a su commit y no hace nada
+    insertar = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    await db.execute(insertar(S).values([
+        {"usuario_id": e["usuario_id"], "session_id": e["session_id"], "origen": e.get("origen"),
+         "transcripcion": "", "fragmentos": 0, "fecha_inicio": e["fecha_inicio"],
+         "fecha_actualizacion": e["fecha_actualizacion"]}
+        for e in estados_ordenados
+    ]).on_conflict_do_nothing(index_elements=[S.usuario_id, S.session_id]))
+    # Bloquear las filas hasta el commit (siempre en el mismo orden): dos escritores no pueden restar la misma aportación
+    consulta = (
+        select(S.usuario_id, S.session_id, S.origen, S.diagnostico, S.riesgo, S.fecha_inicio)
+        .where(tuple_(S.usuario_id, S.session_id).in_(claves))
+        .order_by(S.usuario_id, S.session_id)
+        .with_for_update()
+    )
+    actuales = {(f["usuario_id"], f["session_id"]): dict(f) for f in (await db.execute(consulta)).mappings()}
+    bajas, altas = [], []
+    for estado in estados:
+        actual = actuales.get((estado["usuario_id"], estado["session_id"]))
+        # Mismo resultado que el upsert: el veredicto ausente conserva el guardado y fecha_inicio no cambia
+        nueva = {
+            "usuario_id": estado["usuario_id"],
+            "origen": estado.get("origen"),
+            "fecha_inicio": actual["fecha_inicio"] if actual else estado["fecha_inicio"],
+            **{campo: estado.get(campo) if estado.get(campo) is not None else (actual or {}).get(campo)
+               for campo in ("diagnostico", "riesgo")},
+        }
+        antes, despues = aporte_sesion(actual), aporte_sesion(nueva)
+        if antes == despues:
+            continue
+        if antes is not None:
+            bajas.append(antes)
+        if despues is not None:
+            altas.append(despues)
+    await registrar(db, bajas, signo=-1)
+    await registrar(db, altas)
+
+
+def ventana(desde=None, hasta=None):
+    """Intervalo de días [desde, hasta]; por defecto los últimos ``ANALITICA_DIAS``."""
+    hasta = hasta or datetime.utcnow().date()
+    desde = desde or hasta - timedelta(days=ANALITICA_DIAS - 1)
+    if desde > hasta:
+        raise ValueError("desde debe ser anterior o igual a hasta")
+    return desde, hasta
+
+
+def _filtrar(consulta, usuario_id, desde, hasta, origen):
+    D = models.AnalisisDiario
+    # Recorre la clave primaria (usuario_id, dia, ...) solo en el rango pedido
+    consulta = consulta.where(D.usuario_id == usuario_id, D.dia >= desde, D.dia <= hasta)
+    if origen is not None:
+        consulta = consulta.where(D.origen == (origen or SIN_VALOR))
+    return consulta
+
+
+def _riesgo_medio(suma, con_riesgo):
+    return round(suma / con_riesgo, 1) if con_riesgo else None
+
+
+async def resumen(db, usuario_id, desde, hasta, origen=None):
+    D = models.AnalisisDiario
+    con_riesgo = func.sum(case((D.tramo_riesgo != SIN_RIESGO, D.total), else_=0))
+    alto = func.sum(case((D.tramo_riesgo >= tramo_riesgo(ANALITICA_RIESGO_ALTO), D.total), else_=0))
+    consulta = _filtrar(
+        select(D.diagnostico, func.sum(D.total).label("total"), func.sum(D.suma_riesgo).label("suma"),
+               con_riesgo.label("con_riesgo"), alto.label("alto")).group_by(D.diagnostico),
+        usuario_id, desde, hasta, origen,
+    )
+    filas = (await db.execute(consulta)).all()
+    total = sum(f.total for f in filas)
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "total": total,
+        "por_diagnostico": {(f.diagnostico or "sin_diagnostico"): f.total for f in filas if f.total},
+        "riesgo_alto": sum(f.alto for f in filas),
+        "riesgo_medio": _riesgo_medio(sum(f.suma for f in filas), sum(f.con_riesgo for f in filas)),
+    }
+
+
+async def histograma(db, usuario_id, desde, hasta, origen=None, diagnostico=None):
+    D = models.AnalisisDiario
+    consulta = _filtrar(
+        select(D.tramo_riesgo, func.sum(D.total).label("total")).group_by(D.tramo_riesgo),
+        usuario_id, desde, hasta, origen,
+    )
+    if diagnostico is not None:
+        consulta = consulta.where(D.diagnostico == diagnostico)
+    totales = {f.tramo_riesgo: f.total for f in (await db.execute(consulta)).all()}
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "tramos": [
+            {"desde": t * 10, "hasta": 100 if t == 9 else t * 10 + 9, "total": totales.get(t, 0)}
+            for t in range(10)
+        ],
+        "sin_riesgo": totales.get(SIN_RIESGO, 0),
+    }
+
+
+async def tendencia(db, usuario_id, desde, hasta, origen=None, por_origen=False):
+    D = models.AnalisisDiario
+    columnas = [D.dia, D.origen] if por_origen else [D.dia]
+    con_riesgo = func.sum(case((D.tramo_riesgo != SIN_RIESGO, D.total), else_=0))
+    estafas = func.sum(case((D.diagnostico == Diagnostico.ESTAFA.value, D.total), else_=0))
+    consulta = _filtrar(
+        select(*columnas, func.sum(D.total).label("total"), estafas.label("estafas"),
+               func.sum(D.suma_riesgo).label("suma"), con_riesgo.label("con_riesgo"))
+        .group_by(*columnas).order_by(*columnas),
+        usuario_id, desde, hasta, origen,
+    )
+    return [
+        {
+            "dia": f.dia,
+            "origen": (f.origen or None) if por_origen else None,
+            "total": f.total,
+            "estafas": f.estafas,
+            "riesgo_medio": _riesgo_medio(f.suma, f.con_riesgo),
+        }
+        for f in (await db.execute(consulta)).all()
+        if f.total
+    ]
+
+
+async def sesiones_mas_riesgo(db, usuario_id, limite, desde=None):
+    S = models.Sesion
+    consulta = (
+        select(S.session_id, S.origen, S.diagnostico, S.riesgo_max, S.fragmentos, S.fecha_inicio, S.fecha_actualizacion)
+        .where(S.usuario_id == usuario_id, S.riesgo_max.isnot(None))
+        .order_by(S.riesgo_max.desc(), S.fecha_actualizacion.desc())
+        .limit(limite)
+    )
+    if desde is not None:
+        consulta = consulta.where(S.fecha_actualizacion >= datetime.combine(desde, datetime.min.time()))
+    return (await db.execute(consulta)).mappings().all()
@@ -0,0 +1,56 @@
+"""Caché de principales autenticados para ``get_current_user``.
+
+El token lleva el id del usuario (claim ``uid``), así que una petición con un token
+válido se resuelve con la verificación de la firma y una búsqueda en memoria, sin
+consultar la base de datos. Las entradas caducan tras ``PRINCIPAL_CACHE_TTL`` y se
+invalidan al modificar o borrar el usuario a través del ORM; para cambios hechos con
+sentencias masivas (``update()``/``delete()``) hay que llamar a ``invalidar_principal``.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app import models
+from app.core.cache import CacheTTL
+
+PRINCIPAL_CACHE_MAX = int(os.getenv("PRINCIPAL_CACHE_MAX", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+
+
+class Principal:
+    """Datos del usuario autenticado que necesitan los endpoints, sin sesión de base de datos."""
+
+    __slots__ = ("id", "username", "email")
+
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    @classmethod
+    def desde_usuario(cls, usuario):
+        return cls(usuario.id, usuario.username, usuario.email)
+
+
+cache_principales = CacheTTL(PRINCIPAL_CACHE_MAX, PRINCIPAL_CACHE_TTL)
+
+
+def invalidar_principal(usuario_id):
+    cache_principales.invalidar(usuario_id)
+
+
+@event.listens_for(models.Usuario, "after_update")
+@event.listens_for(models.Usuario, "after_delete")
+def _usuario_modificado(mapper, connection, usuario):
+    invalidar_principal(usuario.id)
+    # Hasta el commit otra petición podría volver a cachear la fila anterior: se invalida de nuevo al confirmar
+    sesion = object_session(usuario)
+    if sesion is not None:
+        sesion.info.setdefault("principales_modificados", set()).add(usuario.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _confirmar_invalidaciones(sesion):
+    for usuario_id in sesion.info.pop("principales_modificados", ()):
+        invalidar_principal(usuario_id)
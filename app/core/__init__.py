@@ -0,0 +1,6 @@
+"""Núcleo de inferencia compartido por la API REST y el servidor gRPC.
+
+No depende de FastAPI ni de la base de datos: el servidor gRPC lo importa sin
+arrastrar el resto del backend. Los módulos pesados (cliente de OpenAI, SQLAlchemy)
+se importan la primera vez que se usan.
+"""
@@ -0,0 +1,336 @@
+"""Preprocesado de audio en memoria con NumPy.
+
+Decodificación de WAV PCM, remuestreo polifásico a 16 kHz mono, detección de voz
+por energía y cruces por cero, y segmentación de voz para audio que llega en streaming.
+"""
+import io
+import os
+import struct
+import wave
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.core.metricas import medir
+
+# Formato asumido cuando el cliente envía PCM sin cabecera
+FORMATO_PCM_POR_DEFECTO = (16000, 1, 2)  # (sample_rate, canales, bytes por muestra)
+SAMPLE_RATE_WHISPER = 16000
+
+# Parámetros de la detección de voz (VAD)
+VAD_UMBRAL_DB = float(os.getenv("VAD_UMBRAL_DB", "-50"))   # Energía mínima absoluta (dBFS)
+VAD_MARGEN_DB = float(os.getenv("VAD_MARGEN_DB", "10"))    # Margen sobre el ruido de fondo
+VAD_PISO_MAX_DB = -35.0                                    # Ruido de fondo máximo asumido
+VAD_ZCR_MAX = float(os.getenv("VAD_ZCR_MAX", "0.35"))      # Cruces por cero por muestra (ruido blanco ~0.5)
+
+
+def es_wav(datos):
+    return len(datos) >= 12 and datos[:4] == b'RIFF' and datos[8:12] == b'WAVE'
+
+
+def leer_cabecera_wav(datos):
+    """Devuelve ``(sample_rate, canales, ancho, offset_datos)`` o ``None`` si faltan bytes.
+
+    Recorre los chunks RIFF hasta encontrar ``data``; lanza ``ValueError`` si el
+    contenido no es un WAV PCM.
+    """
+    if len(datos) < 12:
+        return None
+    if not es_wav(datos):
+        raise ValueError("El audio no es un WAV válido")
+    offset = 12
+    formato = None
+    while offset + 8 <= len(datos):
+        chunk_id, tamano = struct.unpack_from('<4sI', datos, offset)
+        offset += 8
+        if chunk_id == b'fmt ':
+            if offset + 16 > len(datos):
+                return None
+            codec, canales, sample_rate, _, _, bits = struct.unpack_from('<HHIIHH', datos, offset)
+            if codec not in (1, 0xFFFE):
+                raise ValueError("Solo se admite audio WAV PCM")
+            formato = (sample_rate, canales, bits // 8)
+        elif chunk_id == b'data':
+            if formato is None:
+                raise ValueError("WAV sin chunk 'fmt '")
+            return formato + (offset,)
+        offset += tamano + (tamano & 1)
+    return None
+
+
+def pcm_a_wav(pcm, sample_rate, canales=1, ancho=2):
+    """Empaqueta PCM crudo en un WAV en memoria."""
+    salida = io.BytesIO()
+    with wave.open(salida, 'wb') as wav:
+        wav.setnchannels(canales)
+        wav.setsampwidth(ancho)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return salida.getvalue()
+
+
+def decodificar_wav(datos):
+    """Decodifica un WAV PCM a ``(muestras, sample_rate)`` con muestras float32 mono en [-1, 1]."""
+    cabecera = leer_cabecera_wav(datos)
+    if cabecera is None:
+        raise ValueError("WAV incompleto")
+    sample_rate, canales, ancho, offset = cabecera
+    muestras = pcm_a_float(memoryview(datos)[offset:], ancho, canales)
+    return muestras, sample_rate
+
+
+def pcm_a_float(pcm, ancho=2, canales=1):
+    """Convierte PCM entero intercalado a float32 mono normalizado."""
+    pcm = memoryview(pcm)
+    utiles = len(pcm) - len(pcm) % (ancho * canales)
+    if ancho == 1:
+        x = (np.frombuffer(pcm[:utiles], dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif ancho == 2:
+        x = np.frombuffer(pcm[:utiles], dtype='<i2').astype(np.float32) / 32768.0
+    elif ancho == 3:
+        crudo = np.frombuffer(pcm[:utiles], dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        enteros = crudo[:, 0] | (crudo[:, 1] << 8) | (crudo[:, 2] << 16)
+        enteros = np.where(enteros & 0x800000, enteros - 0x1000000, enteros)
+        x = enteros.astype(np.float32) / 8388608.0
+    elif ancho == 4:
+        x = np.frombuffer(pcm[:utiles], dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Ancho de muestra no soportado: {ancho}")
+    if canales > 1:
+        x = x.reshape(-1, canales).mean(axis=1)
+    return x
+
+
+def float_a_pcm16(muestras):
+    return (np.clip(muestras, -1.0, 1.0) * 32767.0).astype('<i2').tobytes()
+
+
+@lru_cache(maxsize=32)
+def _filtro_polifasico(arriba, abajo):
+    """Filtro paso bajo (sinc con ventana Kaiser) descompuesto en ``arriba`` fases.
+
+    Cada fase se devuelve invertida y contigua, lista para el producto con ventanas
+    de entrada en orden creciente.
+    """
+    max_ratio = max(arriba, abajo)
+    semi = 10 * max_ratio
+    n = np.arange(-semi, semi + 1, dtype=np.float64)
+    corte = 1.0 / max_ratio
+    h = corte * np.sinc(corte * n) * np.kaiser(len(n), 5.0) * arriba
+    taps = -(-len(h) // arriba)
+    h = np.concatenate([h, np.zeros(taps * arriba - len(h))])
+    # fases[p, j] = h[p + j * arriba]
+    fases = h.reshape(taps, arriba).T
+    return np.ascontiguousarray(fases[:, ::-1], dtype=np.float32), semi
+
+
+def resamplear(muestras, sr_origen, sr_destino=SAMPLE_RATE_WHISPER):
+    """Remuestreo polifásico racional (equivalente a ``scipy.signal.resample_poly``).
+
+    Solo se calculan las muestras de salida. Las salidas ``n ≡ r (mod arriba)`` usan
+    todas la misma fase del filtro y ventanas de entrada separadas ``abajo`` muestras,
+    así que cada residuo se resuelve con un único producto matriz-vector sobre una
+    vista deslizante, sin copiar la señal.
+    """
+    if sr_origen == sr_destino or not len(muestras):
+        return muestras.astype(np.float32, copy=False)
+    g = gcd(sr_origen, sr_destino)
+    arriba, abajo = sr_destino // g, sr_origen // g
+    invertidas, semi = _filtro_polifasico(arriba, abajo)
+    taps = invertidas.shape[1]
+    n_salida = -(-len(muestras) * arriba // abajo)
+    relleno = np.concatenate([
+        np.zeros(taps, np.float32),
+        muestras.astype(np.float32, copy=False),
+        np.zeros(taps + abajo, np.float32),
+    ])
+    ventanas = sliding_window_view(relleno, taps)
+    salida = np.empty(n_salida, dtype=np.float32)
+    for r in range(min(arriba, n_salida)):
+        t = r * abajo + semi
+        cantidad = len(range(r, n_salida, arriba))
+        inicio = t // arriba + 1
+        salida[r::arriba] = ventanas[inicio:inicio + (cantidad - 1) * abajo + 1:abajo] @ invertidas[t % arriba]
+    return salida
+
+
+def caracteristicas_frames(muestras, sample_rate, frame_ms=30):
+    """Energía (dBFS) y tasa de cruces por cero de cada frame completo."""
+    tam = int(sample_rate * frame_ms / 1000)
+    n_frames = len(muestras) // tam
+    if not n_frames:
+        return np.empty(0, np.float32), np.empty(0, np.float32)
+    frames = muestras[:n_frames * tam].reshape(n_frames, tam)
+    energia_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    signos = np.signbit(frames)
+    zcr = np.count_nonzero(signos[:, 1:] != signos[:, :-1], axis=1) / tam
+    return energia_db, zcr
+
+
+def clasificar_frames(energia_db, zcr, piso_db=None):
+    """Marca como voz los frames con energía suficiente y cruces por cero propios del habla."""
+    if piso_db is None:
+        piso_db = np.percentile(energia_db, 10) if len(energia_db) else VAD_UMBRAL_DB
+    umbral = max(VAD_UMBRAL_DB, min(piso_db, VAD_PISO_MAX_DB) + VAD_MARGEN_DB)
+    return (energia_db > umbral) & (zcr < VAD_ZCR_MAX)
+
+
+def detectar_voz(muestras, sample_rate, frame_ms=30, min_voz_ms=200, max_pausa_ms=300):
+    """Devuelve los segmentos de voz como lista de ``(inicio, fin)`` en muestras.
+
+    Las pausas más cortas que ``max_pausa_ms`` se unen al segmento y los tramos de
+    voz más cortos que ``min_voz_ms`` se descartan como ruido.
+    """
+    energia_db, zcr = caracteristicas_frames(muestras, sample_rate, frame_ms)
+    voz = clasificar_frames(energia_db, zcr)
+    if not voz.any():
+        return []
+    bordes = np.diff(np.concatenate([[0], voz.astype(np.int8), [0]]))
+    inicios = np.flatnonzero(bordes == 1)
+    fines = np.flatnonzero(bordes == -1)
+    max_pausa = max_pausa_ms // frame_ms
+    min_voz = max(1, min_voz_ms // frame_ms)
+    segmentos = []
+    for inicio, fin in zip(inicios, fines):
+        if segmentos and inicio - segmentos[-1][1] <= max_pausa:
+            segmentos[-1][1] = fin
+        else:
+            segmentos.append([inicio, fin])
+    tam = int(sample_rate * frame_ms / 1000)
+    return [(int(i * tam), int(f * tam)) for i, f in segmentos if f - i >= min_voz]
+
+
+def preparar_para_whisper(datos):
+    """WAV recibido -> ``(wav_16k_mono, segmentos_de_voz)``; sin voz devuelve ``(None, [])``."""
+    with medir("decodificar"):
+        muestras, sample_rate = decodificar_wav(datos)
+    # La detección se hace a la frecuencia original: los fragmentos en silencio no se remuestrean
+    with medir("vad"):
+        segmentos = detectar_voz(muestras, sample_rate)
+    if not segmentos:
+        return None, []
+    with medir("remuestrear"):
+        muestras = resamplear(muestras, sample_rate, SAMPLE_RATE_WHISPER)
+    escala = SAMPLE_RATE_WHISPER / sample_rate
+    segmentos = [(int(inicio * escala), int(fin * escala)) for inicio, fin in segmentos]
+    return pcm_a_wav(float_a_pcm16(muestras), SAMPLE_RATE_WHISPER), segmentos
+
+
+class Segmento(bytes):
+    """WAV de un segmento cerrado por ``SegmentadorVoz``.
+
+    ``solapa`` indica que el segmento anterior se cortó sin pausa (al alcanzar
+    ``max_segundos``) y que este empieza repitiendo sus últimos ``solape_ms``.
+    """
+
+    def __new__(cls, wav, solapa=False):
+        segmento = super().__new__(cls, wav)
+        segmento.solapa = solapa
+        return segmento
+
+
+class SegmentadorVoz:
+    """Acumula audio recibido por fragmentos y lo corta en segmentos de voz.
+
+    Un segmento se cierra tras ``silencio_ms`` de silencio después de haber detectado
+    voz (y de acumular al menos ``min_segundos``), o al alcanzar ``max_segundos``. En este
+    último caso el corte cae en mitad de la voz: los últimos ``solape_ms`` se repiten al
+    principio del segmento siguiente para no perder la palabra cortada. Los datos se
+    guardan en un ``bytearray`` que crece sin recopiar lo ya recibido; los segmentos
+    cerrados se devuelven como WAV (``Segmento``, que indica si solapa con el anterior).
+    Si no se indica ``formato`` (sample_rate, canales, bytes por muestra), se toma de la
+    cabecera WAV del primer fragmento o se asume ``FORMATO_PCM_POR_DEFECTO``.
+    """
+
+    def __init__(self, silencio_ms=700, max_segundos=15, min_voz_ms=300, frame_ms=30, formato=None,
+                 min_segundos=0, solape_ms=0):
+        self.silencio_ms = silencio_ms
+        self.max_segundos = max_segundos
+        self.min_segundos = min_segundos
+        self.solape_ms = solape_ms
+        self.min_voz_ms = min_voz_ms
+        self.frame_ms = frame_ms
+        self.formato = formato
+        self._cabecera = bytearray()
+        self._buffer = bytearray()
+        self._analizado = 0
+        self._voz_ms = 0
+        self._silencio_actual_ms = 0
+        self._solapa = False         # El próximo segmento empieza con el final del anterior
+
+    def agregar(self, datos):
+        """Añade un fragmento y devuelve la lista de segmentos WAV que quedaron cerrados."""
+        if self.formato is None:
+            self._cabecera += datos
+            if len(self._cabecera) < 12:
+                return []
+            if es_wav(self._cabecera):
+                cabecera = leer_cabecera_wav(self._cabecera)
+                if cabecera is None:
+                    return []
+                self.formato = cabecera[:3]
+                datos = bytes(self._cabecera[cabecera[3]:])
+            else:
+                self.formato = FORMATO_PCM_POR_DEFECTO
+                datos = bytes(self._cabecera)
+            self._cabecera = bytearray()
+        self._buffer += datos
+        return self._procesar_frames()
+
+    def cerrar(self):
+        """Cierra el stream y devuelve el último segmento si contiene voz."""
+        segmentos = self._procesar_frames()
+        if self._voz_ms >= self.min_voz_ms:
+            segmentos.append(self._cortar(len(self._buffer)))
+        return segmentos
+
+    def _procesar_frames(self):
+        sample_rate, canales, ancho = self.formato or FORMATO_PCM_POR_DEFECTO
+        bytes_por_ms = sample_rate * canales * ancho / 1000
+        tam_frame = int(bytes_por_ms * self.frame_ms) // (canales * ancho) * (canales * ancho)
+        max_bytes = int(bytes_por_ms * self.max_segundos * 1000)
+        min_bytes = int(bytes_por_ms * self.min_segundos * 1000)
+        solape = int(bytes_por_ms * self.solape_ms) // (canales * ancho) * (canales * ancho)
+        segmentos = []
+        n_frames = (len(self._buffer) - self._analizado) // tam_frame
+        if not n_frames:
+            return segmentos
+        # Clasificar de una vez todos los frames nuevos; el ruido de fondo del stream es
+        # desconocido, así que solo se aplica el umbral absoluto
+        with medir("vad"):
+            nuevos = pcm_a_float(self._buffer[self._analizado:self._analizado + n_frames * tam_frame], ancho, canales)
+            energia_db, zcr = caracteristicas_frames(nuevos, sample_rate, self.frame_ms)
+            voz = clasificar_frames(energia_db, zcr, piso_db=VAD_UMBRAL_DB - VAD_MARGEN_DB)
+        for es_voz in voz:
+            self._analizado += tam_frame
+            if es_voz:
+                self._voz_ms += self.frame_ms
+                self._silencio_actual_ms = 0
+            else:
+                self._silencio_actual_ms += self.frame_ms
+            if self._voz_ms >= self.min_voz_ms and self._silencio_actual_ms >= self.silencio_ms and self._analizado >= min_bytes:
+                segmentos.append(self._cortar(self._analizado))
+            elif self._analizado >= max_bytes:
+                if self._voz_ms >= self.min_voz_ms:
+                    segmentos.append(self._cortar(self._analizado, solape))
+                else:
+                    self._descartar(self._analizado)
+            elif not self._voz_ms and self._silencio_actual_ms >= self.silencio_ms:
+                # Silencio inicial: no se acumula
+                self._descartar(self._analizado)
+        return segmentos
+
+    def _cortar(self, hasta, solape=0):
+        segmento = Segmento(pcm_a_wav(self._buffer[:hasta], *self.formato), solapa=self._solapa)
+        self._descartar(hasta - solape)
+        self._solapa = solape > 0
+        return segmento
+
+    def _descartar(self, hasta):
+        del self._buffer[:hasta]
+        self._analizado -= hasta
+        self._voz_ms = 0
+        self._silencio_actual_ms = 0
+        self._solapa = False
@@ -0,0 +1,202 @@
+"""Caché de veredictos de ``analizar_con_ia``.
+
+La clave es un hash del texto normalizado junto con el modelo y la versión del
+prompt, de forma que el mismo mensaje (con distinto espaciado o mayúsculas) se
+resuelve sin volver a llamar a OpenAI. Hay un nivel en memoria (LRU con TTL) y un
+nivel opcional compartido en la base de datos (``VEREDICTO_CACHE_DB=1``).
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+VEREDICTO_CACHE_MAX = int(os.getenv("VEREDICTO_CACHE_MAX", "10000"))
+VEREDICTO_CACHE_TTL = float(os.getenv("VEREDICTO_CACHE_TTL", "86400"))
+# Los veredictos caducados de la tabla se borran al escribir en ella, como mucho una vez
+# cada VEREDICTO_CACHE_LIMPIEZA segundos por proceso; al leer solo se ignoran
+VEREDICTO_CACHE_LIMPIEZA = float(os.getenv("VEREDICTO_CACHE_LIMPIEZA", "600"))
+VEREDICTO_CACHE_DB = os.getenv("VEREDICTO_CACHE_DB", "0") == "1"
+
+
+class CacheTTL:
+    """Diccionario LRU acotado con expiración por entrada, seguro entre hilos."""
+
+    def __init__(self, max_entradas, ttl):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            valor, expira = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return valor
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+def normalizar_texto(texto):
+    """Normaliza unicode, mayúsculas y espacios para que variaciones triviales compartan clave."""
+    texto = unicodedata.normalize("NFKC", texto or "")
+    return " ".join(texto.lower().split())
+
+
+def clave_veredicto(texto, modelo, version_prompt):
+    contenido = f"{modelo}\x1f{version_prompt}\x1f{normalizar_texto(texto)}"
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+class CacheVeredictos:
+    """Caché de dos niveles: memoria del proceso y, opcionalmente, la base de datos."""
+
+    def __init__(self, max_entradas=VEREDICTO_CACHE_MAX, ttl=VEREDICTO_CACHE_TTL, usar_db=VEREDICTO_CACHE_DB):
+        self.memoria = CacheTTL(max_entradas, ttl)
+        self.ttl = ttl
+        self.usar_db = usar_db
+        self.hits_db = 0
+        self.errores_db = 0
+        self.borrados_db = 0
+        self._ultima_limpieza = None
+
+    def get(self, clave):
+        """Consulta solo el nivel en memoria (utilizable desde cualquier hilo)."""
+        return self.memoria.get(clave)
+
+    def set(self, clave, resultado):
+        self.memoria.set(clave, resultado)
+
+    async def get_async(self, clave):
+        resultado = self.memoria.get(clave)
+        if resultado is not None or not self.usar_db:
+            return resultado
+        resultado = await self._leer_db(clave)
+        if resultado is not None:
+            self.hits_db += 1
+            self.memoria.set(clave, resultado)
+        return resultado
+
+    async def get_varios_async(self, claves):
+        """Como ``get_async`` para varias claves a la vez: las que no están en memoria se
+        leen de la base de datos en una sola consulta. Devuelve ``{clave: resultado o None}``."""
+        resultados = {clave: self.memoria.get(clave) for clave in claves}
+        faltan = [clave for clave, resultado in resultados.items() if resultado is None]
+        if faltan and self.usar_db:
+            for clave, resultado in (await self._leer_varios_db(faltan)).items():
+                self.hits_db += 1
+                self.memoria.set(clave, resultado)
+                resultados[clave] = resultado
+        return resultados
+
+    async def set_async(self, clave, resultado, modelo, version_prompt):
+        self.memoria.set(clave, resultado)
+        if self.usar_db:
+            await self._escribir_db(clave, resultado, modelo, version_prompt)
+
+    async def _leer_db(self, clave):
+        # Import diferido: el nivel compartido es opcional y no debe arrastrar SQLAlchemy
+        from app.database import SessionLocal
+        from app.models import VeredictoCache
+        try:
+            async with SessionLocal() as db:
+                fila = await db.get(VeredictoCache, clave)
+                if fila is None or fila.fecha_creacion < datetime.utcnow() - timedelta(seconds=self.ttl):
+                    return None
+                return fila.resultado
+        except Exception:
+            self.errores_db += 1
+            logging.exception("Error al leer la caché de veredictos en la base de datos")
+            return None
+
+    async def _leer_varios_db(self, claves):
+        from sqlalchemy import select
+        from app.database import SessionLocal
+        from app.models import VeredictoCache
+        try:
+            async with SessionLocal() as db:
+                filas = await db.execute(
+                    select(VeredictoCache.clave, VeredictoCache.resultado).where(
+                        VeredictoCache.clave.in_(claves),
+                        VeredictoCache.fecha_creacion >= datetime.utcnow() - timedelta(seconds=self.ttl),
+                    )
+                )
+                return dict(filas.all())
+        except Exception:
+            self.errores_db += 1
+            logging.exception("Error al leer la caché de veredictos en la base de datos")
+            return {}
+
+    async def _escribir_db(self, clave, resultado, modelo, version_prompt):
+        from app.database import SessionLocal
+        from app.models import VeredictoCache
+        from sqlalchemy import delete
+        ahora = time.monotonic()
+        limpiar = self._ultima_limpieza is None or ahora - self._ultima_limpieza >= VEREDICTO_CACHE_LIMPIEZA
+        if limpiar:
+            # Se anota antes de esperar: las escrituras concurrentes no repiten el borrado
+            self._ultima_limpieza = ahora
+        try:
+            async with SessionLocal() as db:
+                await db.merge(VeredictoCache(
+                    clave=clave,
+                    modelo=modelo,
+                    version_prompt=version_prompt,
+                    resultado=resultado,
+                    fecha_creacion=datetime.utcnow()
+                ))
+                if limpiar:
+                    caducados = await db.execute(
+                        delete(VeredictoCache).where(VeredictoCache.fecha_creacion < datetime.utcnow() - timedelta(seconds=self.ttl))
+                    )
+                    self.borrados_db += caducados.rowcount or 0
+                await db.commit()
+        except Exception:
+            self.errores_db += 1
+            logging.exception("Error al guardar la caché de veredictos en la base de datos")
+
+    def stats(self):
+        total = self.memoria.hits + self.memoria.misses
+        return {
+            "entradas_memoria": len(self.memoria),
+            "hits_memoria": self.memoria.hits,
+            "hits_db": self.hits_db,
+            "misses": self.memoria.misses - self.hits_db,
+            "errores_db": self.errores_db,
+            "borrados_db": self.borrados_db,
+            "ratio_hits": round((self.memoria.hits + self.hits_db) / total, 4) if total else 0.0,
+            "nivel_db": self.usar_db,
+        }
+
+
+cache_veredictos = CacheVeredictos()
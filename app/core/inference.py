@@ -0,0 +1,393 @@
+"""Capa de inferencia compartida por la API REST y el servidor gRPC.
+
+Las llamadas a OpenAI (Whisper y GPT) son bloqueantes, así que se ejecutan en un
+pool de hilos acotado por modelo. Los endpoints async las esperan sin bloquear el
+event loop y el servidor gRPC con hilos usa las variantes ``*_sync``, que pasan por
+los mismos pools y por tanto respetan los mismos límites de concurrencia.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+from dotenv import load_dotenv
+
+from app.core.cache import cache_veredictos, clave_veredicto
+from app.core.veredicto import Veredicto, veredictos_desde_lote
+from app.core.preclasificador import preclasificador
+from app.core.metricas import medir, INFERENCIAS_EN_CURSO, LLAMADAS_OPENAI, TOKENS_OPENAI
+
+load_dotenv()
+
+MODELO_TRANSCRIPCION = os.getenv("OPENAI_MODELO_TRANSCRIPCION", "whisper-1")
+MODELO_ANALISIS = os.getenv("OPENAI_MODELO_ANALISIS", "gpt-4o-mini")
+
+# Timeout de cada petición HTTP a OpenAI y timeout total (cola + llamada) por inferencia
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+INFERENCIA_TIMEOUT = float(os.getenv("INFERENCIA_TIMEOUT", "60"))
+OPENAI_MAX_REINTENTOS = int(os.getenv("OPENAI_MAX_REINTENTOS", "2"))
+
+# Análisis por lotes: mensajes cortos agrupados en una sola llamada al modelo
+ANALISIS_LOTE_MENSAJES = int(os.getenv("ANALISIS_LOTE_MENSAJES", "10"))         # Mensajes por llamada
+ANALISIS_LOTE_CARACTERES = int(os.getenv("ANALISIS_LOTE_CARACTERES", "6000"))   # Caracteres por llamada
+ANALISIS_LOTE_MENSAJE_MAX = int(os.getenv("ANALISIS_LOTE_MENSAJE_MAX", "1500"))  # Los más largos van solos
+ANALISIS_LOTE_CONCURRENCIA = int(os.getenv("ANALISIS_LOTE_CONCURRENCIA", "4"))  # Llamadas en vuelo por lote
+
+# Llamadas simultáneas permitidas por modelo
+LIMITES_CONCURRENCIA = {
+    MODELO_TRANSCRIPCION: int(os.getenv("WHISPER_MAX_CONCURRENCIA", "8")),
+    MODELO_ANALISIS: int(os.getenv("GPT_MAX_CONCURRENCIA", "32")),
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def cliente():
+    """Cliente de OpenAI compartido; se crea (e importa el SDK) en la primera llamada."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI, DefaultHttpxClient
+
+                # Un único cliente HTTP con keep-alive para reutilizar las conexiones TLS con OpenAI
+                max_conexiones = sum(LIMITES_CONCURRENCIA.values())
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY", ""),
+                    timeout=OPENAI_TIMEOUT,
+                    max_retries=OPENAI_MAX_REINTENTOS,
+                    http_client=DefaultHttpxClient(
+                        limits=httpx.Limits(max_connections=max_conexiones, max_keepalive_connections=max_conexiones)
+                    ),
+                )
+    return _client
+
+
+# Instante (time.monotonic) en que vence la inferencia que está ejecutando cada hilo del pool
+_limites = threading.local()
+
+
+def _cliente_con_limite():
+    """Cliente para la llamada en curso, con timeout y reintentos ajustados a lo que queda de
+    ``INFERENCIA_TIMEOUT``: cuando el llamador deja de esperar, la llamada a OpenAI también
+    termina y el hilo vuelve al pool en lugar de quedarse ocupado hasta ``OPENAI_TIMEOUT``."""
+    limite = getattr(_limites, "valor", None)
+    if limite is None:
+        return cliente()
+    restante = limite - time.monotonic()
+    if restante <= 0:
+        # La petición esperó en la cola más que el timeout total: ya nadie espera la respuesta
+        raise TimeoutError("tiempo de espera agotado")
+    timeout = min(OPENAI_TIMEOUT, restante)
+    # Solo los reintentos que caben enteros en el tiempo restante
+    reintentos = max(0, min(OPENAI_MAX_REINTENTOS, int(restante // timeout) - 1))
+    return cliente().with_options(timeout=timeout, max_retries=reintentos)
+
+
+def _con_limite(limite, funcion, *args):
+    _limites.valor = limite
+    try:
+        return funcion(*args)
+    finally:
+        _limites.valor = None
+
+
+_executors = {
+    modelo: ThreadPoolExecutor(max_workers=limite, thread_name_prefix=f"inferencia-{modelo}")
+    for modelo, limite in LIMITES_CONCURRENCIA.items()
+}
+
+# Cambiar la versión al modificar el prompt invalida los veredictos cacheados
+VERSION_PROMPT = "v2"
+PROMPT_ANALISIS = """
+Eres un analista de seguridad. Evalúa si el siguiente mensaje es potencialmente una estafa.
+Devuelve tu respuesta SOLO en este formato JSON exacto sin añadir ningún otro texto:
+{{"diagnostico": "Estafa" o "No Estafa", "explicacion": "tu explicación aquí", "riesgo": número entre 0 y 100}}
+
+Mensaje:
+{texto}
+"""
+
+
+PROMPT_ANALISIS_LOTE = """
+Eres un analista de seguridad. Evalúa por separado si cada uno de los siguientes mensajes es potencialmente una estafa.
+Cada mensaje es independiente: no uses el contenido de uno para juzgar otro.
+Devuelve tu respuesta SOLO en este formato JSON exacto sin añadir ningún otro texto, con un resultado por mensaje:
+{{"resultados": [{{"id": id del mensaje, "diagnostico": "Estafa" o "No Estafa", "explicacion": "tu explicación aquí", "riesgo": número entre 0 y 100}}]}}
+
+Mensajes (lista JSON):
+{mensajes}
+"""
+
+
+def _transcribir(audio):
+    with INFERENCIAS_EN_CURSO.en_curso(MODELO_TRANSCRIPCION), medir("transcribir"):
+        texto = _transcribir_openai(audio)
+    LLAMADAS_OPENAI.sumar(MODELO_TRANSCRIPCION, "error" if texto.startswith("Error") else "ok")
+    return texto
+
+
+def _transcribir_openai(audio):
+    try:
+        if isinstance(audio, (bytes, bytearray)):
+            # Audio ya en memoria: se envía sin pasar por disco
+            transcript = _cliente_con_limite().audio.transcriptions.create(
+                model=MODELO_TRANSCRIPCION,
+                file=("audio.wav", bytes(audio)),
+                language="es"
+            )
+        else:
+            with open(audio, "rb") as audio_file:
+                transcript = _cliente_con_limite().audio.transcriptions.create(
+                    model=MODELO_TRANSCRIPCION,
+                    file=audio_file,
+                    language="es"
+                )
+        return transcript.text
+    except Exception as e:
+        return f"Error en la transcripción con Whisper: {e}"
+
+
+def _completar(prompt):
+    with INFERENCIAS_EN_CURSO.en_curso(MODELO_ANALISIS), medir("analizar"):
+        try:
+            response = _cliente_con_limite().chat.completions.create(
+                model=MODELO_ANALISIS,
+                messages=[
+                    {"role": "system", "content": "Eres un analista de seguridad de ciberfraudes que responde solo en formato JSON estructurado."},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format={"type": "json_object"}
+            )
+        except Exception:
+            LLAMADAS_OPENAI.sumar(MODELO_ANALISIS, "error")
+            raise
+    LLAMADAS_OPENAI.sumar(MODELO_ANALISIS, "ok")
+    if response.usage is not None:
+        TOKENS_OPENAI.sumar(MODELO_ANALISIS, "entrada", cantidad=response.usage.prompt_tokens)
+        TOKENS_OPENAI.sumar(MODELO_ANALISIS, "salida", cantidad=response.usage.completion_tokens)
+    return response.choices[0].message.content.strip()
+
+
+def _analizar(texto):
+    try:
+        # Los campos se validan y se conservan tipados; el texto legible se genera al mostrarlo
+        return Veredicto.desde_respuesta(_completar(PROMPT_ANALISIS.format(texto=texto)))
+    except Exception as e:
+        return Veredicto.de_error(f"Error en el análisis con OpenAI: {e}")
+
+
+def _analizar_varios(textos):
+    """Una sola llamada para varios mensajes; ``None`` en los que haya que repetir por separado."""
+    # Los mensajes van como lista JSON: un mensaje no puede cerrar el suyo y hacerse pasar por el siguiente
+    mensajes = json.dumps([{"id": i, "texto": texto} for i, texto in enumerate(textos, start=1)], ensure_ascii=False)
+    try:
+        return veredictos_desde_lote(_completar(PROMPT_ANALISIS_LOTE.format(mensajes=mensajes)), len(textos))
+    except Exception:
+        # Si falla la llamada empaquetada, cada mensaje se repite solo: un error no contamina al resto
+        return [None] * len(textos)
+
+
+async def _ejecutar(modelo, funcion, *args):
+    loop = asyncio.get_running_loop()
+    limite = time.monotonic() + INFERENCIA_TIMEOUT
+    return await asyncio.wait_for(loop.run_in_executor(_executors[modelo], _con_limite, limite, funcion, *args), INFERENCIA_TIMEOUT)
+
+
+def _ejecutar_sync(modelo, funcion, *args):
+    limite = time.monotonic() + INFERENCIA_TIMEOUT
+    futuro = _executors[modelo].submit(_con_limite, limite, funcion, *args)
+    try:
+        return futuro.result(timeout=INFERENCIA_TIMEOUT)
+    except FuturesTimeoutError:
+        futuro.cancel()
+        raise
+
+
+async def transcribir_audio(audio):
+    """Transcribe con Whisper sin bloquear el event loop; acepta una ruta o los bytes de un WAV."""
+    try:
+        return await _ejecutar(MODELO_TRANSCRIPCION, _transcribir, audio)
+    except asyncio.TimeoutError:
+        return "Error en la transcripción con Whisper: tiempo de espera agotado"
+
+
+def _es_cacheable(veredicto):
+    # Ni los errores ni las respuestas que no siguen el formato: se reintentan en la próxima petición
+    return not veredicto.es_error and veredicto.estructurado
+
+
+# Análisis en curso por clave: peticiones idénticas simultáneas esperan la misma llamada
+_en_vuelo = {}
+
+
+async def _analizar_y_cachear(texto, clave):
+    try:
+        veredicto = await _ejecutar(MODELO_ANALISIS, _analizar, texto)
+    except asyncio.TimeoutError:
+        return Veredicto.de_error("Error en el análisis con OpenAI: tiempo de espera agotado")
+    if _es_cacheable(veredicto):
+        await cache_veredictos.set_async(clave, veredicto.a_json(), MODELO_ANALISIS, VERSION_PROMPT)
+    return veredicto
+
+
+async def analizar_con_ia(texto):
+    """Analiza un texto con GPT sin bloquear el event loop, reutilizando veredictos cacheados.
+
+    Devuelve un ``Veredicto``; si falla la llamada, ``veredicto.error`` trae el mensaje.
+    Los casos claros los resuelve antes el preclasificador local, sin salir a la red.
+    """
+    local = preclasificador.clasificar(texto)
+    if local is not None:
+        return local
+    clave = clave_veredicto(texto, MODELO_ANALISIS, VERSION_PROMPT)
+    cacheado = await cache_veredictos.get_async(clave)
+    if cacheado is not None:
+        return Veredicto.desde_json(cacheado)
+    tarea = _en_vuelo.get(clave)
+    if tarea is None:
+        tarea = asyncio.ensure_future(_analizar_y_cachear(texto, clave))
+        _en_vuelo[clave] = tarea
+        tarea.add_done_callback(lambda _: _en_vuelo.pop(clave, None))
+    return await asyncio.shield(tarea)
+
+
+def _empaquetar(pendientes):
+    """Agrupa ``(clave, texto)`` en paquetes por número de mensajes y caracteres; los largos van solos."""
+    paquetes, actual, caracteres = [], [], 0
+    for clave, texto in pendientes:
+        if len(texto) > ANALISIS_LOTE_MENSAJE_MAX:
+            paquetes.append([(clave, texto)])
+            continue
+        if actual and (len(actual) >= ANALISIS_LOTE_MENSAJES or caracteres + len(texto) > ANALISIS_LOTE_CARACTERES):
+            paquetes.append(actual)
+            actual, caracteres = [], 0
+        actual.append((clave, texto))
+        caracteres += len(texto)
+    if actual:
+        paquetes.append(actual)
+    return paquetes
+
+
+# Referencias a las tareas de los paquetes: siguen hasta el final aunque el cliente se desconecte
+_paquetes = set()
+
+
+async def _resolver_paquete(paquete, futuros, limite):
+    veredictos = [None] * len(paquete)
+    try:
+        if len(paquete) > 1:
+            async with limite:
+                try:
+                    veredictos = await _ejecutar(MODELO_ANALISIS, _analizar_varios, [texto for _, texto in paquete])
+                except asyncio.TimeoutError:
+                    # El paquete entero se repite mensaje a mensaje, cada uno con su propio timeout
+                    pass
+
+        async def por_separado(i):
+            async with limite:
+                try:
+                    veredictos[i] = await _ejecutar(MODELO_ANALISIS, _analizar, paquete[i][1])
+                except asyncio.TimeoutError:
+                    veredictos[i] = Veredicto.de_error("Error en el análisis con OpenAI: tiempo de espera agotado")
+
+        await asyncio.gather(*(por_separado(i) for i, v in enumerate(veredictos) if v is None))
+    finally:
+        for (clave, _), futuro, veredicto in zip(paquete, futuros, veredictos):
+            veredicto = veredicto or Veredicto.de_error("Error en el análisis con OpenAI: sin respuesta")
+            if _es_cacheable(veredicto):
+                await cache_veredictos.set_async(clave, veredicto.a_json(), MODELO_ANALISIS, VERSION_PROMPT)
+            if not futuro.done():
+                futuro.set_result(veredicto)
+
+
+async def analizar_lote(textos):
+    """Analiza varios mensajes y devuelve ``(indice, veredicto)`` a medida que terminan.
+
+    Los mensajes repetidos (tras normalizar) se analizan una vez, y los que resuelve el
+    preclasificador local, los que están en caché o los ya en curso en otra petición no
+    generan llamadas. El resto se agrupa con
+    ``_empaquetar`` y se analiza con hasta ``ANALISIS_LOTE_CONCURRENCIA`` llamadas a la vez.
+    """
+    indices, textos_por_clave = {}, {}
+    for i, texto in enumerate(textos):
+        clave = clave_veredicto(texto, MODELO_ANALISIS, VERSION_PROMPT)
+        indices.setdefault(clave, []).append(i)
+        textos_por_clave.setdefault(clave, texto)
+
+    locales = {clave: preclasificador.clasificar(texto) for clave, texto in textos_por_clave.items()}
+    # Una sola consulta a la caché para todo el lote, no una por mensaje
+    cacheados = await cache_veredictos.get_varios_async([clave for clave, local in locales.items() if local is None])
+
+    esperas, pendientes = {}, []
+    for clave, texto in textos_por_clave.items():
+        local, cacheado = locales[clave], cacheados.get(clave)
+        if local is not None or cacheado is not None:
+            veredicto = local or Veredicto.desde_json(cacheado)
+            for i in indices[clave]:
+                yield i, veredicto
+        elif clave in _en_vuelo:
+            esperas[clave] = asyncio.shield(_en_vuelo[clave])
+        else:
+            pendientes.append((clave, texto))
+
+    loop = asyncio.get_running_loop()
+    limite = asyncio.Semaphore(ANALISIS_LOTE_CONCURRENCIA)
+    for paquete in _empaquetar(pendientes):
+        futuros = []
+        for clave, _ in paquete:
+            futuro = loop.create_future()
+            # Otras peticiones con el mismo texto esperan este análisis en lugar de lanzar otro
+            _en_vuelo[clave] = futuro
+            futuro.add_done_callback(lambda _, clave=clave: _en_vuelo.pop(clave, None))
+            esperas[clave] = asyncio.shield(futuro)
+            futuros.append(futuro)
+        tarea = asyncio.ensure_future(_resolver_paquete(paquete, futuros, limite))
+        _paquetes.add(tarea)
+        tarea.add_done_callback(_paquetes.discard)
+
+    async def con_clave(clave, espera):
+        return clave, await espera
+
+    for siguiente in asyncio.as_completed([con_clave(clave, espera) for clave, espera in esperas.items()]):
+        clave, veredicto = await siguiente
+        for i in indices[clave]:
+            yield i, veredicto
+
+
+def transcribir_audio_sync(audio):
+    """Variante bloqueante para llamadores que ya corren en su propio hilo."""
+    try:
+        return _ejecutar_sync(MODELO_TRANSCRIPCION, _transcribir, audio)
+    except FuturesTimeoutError:
+        return "Error en la transcripción con Whisper: tiempo de espera agotado"
+
+
+def analizar_con_ia_sync(texto):
+    """Variante bloqueante para llamadores que ya corren en su propio hilo (solo caché en memoria)."""
+    local = preclasificador.clasificar(texto)
+    if local is not None:
+        return local
+    clave = clave_veredicto(texto, MODELO_ANALISIS, VERSION_PROMPT)
+    cacheado = cache_veredictos.get(clave)
+    if cacheado is not None:
+        return Veredicto.desde_json(cacheado)
+    try:
+        veredicto = _ejecutar_sync(MODELO_ANALISIS, _analizar, texto)
+    except FuturesTimeoutError:
+        return Veredicto.de_error("Error en el análisis con OpenAI: tiempo de espera agotado")
+    if _es_cacheable(veredicto):
+        cache_veredictos.set(clave, veredicto.a_json())
+    return veredicto
+
+
+def cerrar():
+    """Libera los pools de hilos y las conexiones HTTP al apagar el proceso."""
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    if _client is not None:
+        _client.close()
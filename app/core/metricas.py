@@ -0,0 +1,234 @@
+"""Métricas del proceso en el formato de texto de Prometheus, sin dependencias.
+
+Histogramas de latencia por etapa del camino caliente (decodificar, remuestrear, vad,
+transcribir, analizar, persistir, auth...), indicadores de trabajo en curso y
+contadores de tokens de OpenAI. Registrar una observación es una búsqueda binaria en
+los límites del histograma y una suma bajo un lock (alrededor de 1 µs), así que la
+instrumentación queda siempre activa.
+
+Cada proceso tiene su propio registro: la API lo publica en ``GET /metrics`` y el
+supervisor gRPC combina las instantáneas de sus workers (``combinar``) antes de publicarlas.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIJO = "fraudwatch_"
+# Límites de los cubos en segundos: del VAD de un fragmento (~ms) a una llamada lenta a OpenAI
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registro = []
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = PREFIJO + nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def instantanea(self):
+        with self._lock:
+            series = {clave: self._copiar(valor) for clave, valor in self._series.items()}
+        return {"tipo": self.tipo, "ayuda": self.ayuda, "etiquetas": self.etiquetas, "series": series}
+
+    @staticmethod
+    def _copiar(valor):
+        return valor
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def sumar(self, *etiquetas, cantidad=1):
+        with self._lock:
+            self._series[etiquetas] = self._series.get(etiquetas, 0) + cantidad
+
+
+class Indicador(_Metrica):
+    """Valor que sube y baja (trabajo en curso); con ``funcion`` se lee al exportar."""
+
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+
+    def sumar(self, *etiquetas, cantidad=1):
+        with self._lock:
+            self._series[etiquetas] = self._series.get(etiquetas, 0) + cantidad
+
+    @contextmanager
+    def en_curso(self, *etiquetas):
+        self.sumar(*etiquetas)
+        try:
+            yield
+        finally:
+            self.sumar(*etiquetas, cantidad=-1)
+
+    def instantanea(self):
+        datos = super().instantanea()
+        if self.funcion is not None:
+            try:
+                datos["series"].update(self.funcion())
+            except Exception:
+                pass
+        return datos
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+
+    def observar(self, valor, *etiquetas):
+        cubo = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                # Cuentas por cubo (sin acumular; el último es +Inf) y suma de los valores
+                serie = self._series[etiquetas] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][cubo] += 1
+            serie[1] += valor
+
+    def medir(self, *etiquetas):
+        return _Cronometro(self, etiquetas)
+
+    def instantanea(self):
+        datos = super().instantanea()
+        datos["limites"] = self.limites
+        return datos
+
+    @staticmethod
+    def _copiar(valor):
+        return [list(valor[0]), valor[1]]
+
+
+class _Cronometro:
+    # Clase con __slots__ en lugar de @contextmanager: menos de la mitad de coste por medición
+    __slots__ = ("histograma", "etiquetas", "inicio")
+
+    def __init__(self, histograma, etiquetas):
+        self.histograma = histograma
+        self.etiquetas = etiquetas
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.histograma.observar(time.perf_counter() - self.inicio, *self.etiquetas)
+
+
+# Métricas compartidas por la API y el servidor gRPC
+ETAPAS = Histograma("etapa_segundos", "Duración de cada etapa del procesamiento", ("etapa",))
+INFERENCIAS_EN_CURSO = Indicador("openai_en_curso", "Llamadas a OpenAI en curso", ("modelo",))
+LLAMADAS_OPENAI = Contador("openai_llamadas_total", "Llamadas a OpenAI por resultado", ("modelo", "resultado"))
+TOKENS_OPENAI = Contador("openai_tokens_total", "Tokens consumidos en OpenAI", ("modelo", "tipo"))
+HTTP_SEGUNDOS = Histograma("http_segundos", "Duración de las peticiones HTTP", ("metodo", "ruta", "estado"))
+HTTP_EN_CURSO = Indicador("http_en_curso", "Peticiones HTTP en curso")
+
+
+def medir(etapa):
+    """Context manager que registra la duración de ``etapa`` en ``fraudwatch_etapa_segundos``."""
+    return ETAPAS.medir(etapa)
+
+
+def instantanea():
+    """Estado de todas las métricas del proceso, serializable para enviarlo entre procesos."""
+    return {metrica.nombre: metrica.instantanea() for metrica in _registro}
+
+
+def combinar(instantaneas):
+    """Suma series de varios procesos (contadores, indicadores y cubos de histogramas)."""
+    total = {}
+    for datos in instantaneas:
+        for nombre, metrica in datos.items():
+            destino = total.setdefault(nombre, {**metrica, "series": {}})
+            for clave, valor in metrica["series"].items():
+                previo = destino["series"].get(clave)
+                if previo is None:
+                    destino["series"][clave] = [list(valor[0]), valor[1]] if metrica["tipo"] == "histogram" else valor
+                elif metrica["tipo"] == "histogram":
+                    previo[0] = [a + b for a, b in zip(previo[0], valor[0])]
+                    previo[1] += valor[1]
+                else:
+                    destino["series"][clave] = previo + valor
+    return total
+
+
+def _etiquetas(nombres, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def formatear(datos=None):
+    """Texto de exposición de Prometheus (versión 0.0.4)."""
+    datos = instantanea() if datos is None else datos
+    lineas = []
+    for nombre, metrica in sorted(datos.items()):
+        lineas.append(f"# HELP {nombre} {metrica['ayuda']}")
+        lineas.append(f"# TYPE {nombre} {metrica['tipo']}")
+        nombres = metrica["etiquetas"]
+        for valores, valor in sorted(metrica["series"].items()):
+            if metrica["tipo"] != "histogram":
+                lineas.append(f"{nombre}{_etiquetas(nombres, valores)} {_numero(valor)}")
+                continue
+            cuentas, suma = valor
+            acumulado = 0
+            for limite, cuenta in zip(metrica["limites"] + ("+Inf",), cuentas):
+                acumulado += cuenta
+                le = 'le="%s"' % limite
+                lineas.append(f"{nombre}_bucket{_etiquetas(nombres, valores, le)} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(nombres, valores)} {_numero(suma)}")
+            lineas.append(f"{nombre}_count{_etiquetas(nombres, valores)} {acumulado}")
+    return "\n".join(lineas) + "\n"
+
+
+class MedirPeticiones:
+    """Middleware ASGI: duración de cada petición HTTP por ruta y peticiones en curso.
+
+    La ruta es la plantilla (``/analisis/{analisis_id}``), no la URL, para acotar las
+    series. La duración incluye la lectura del cuerpo (p. ej. el multipart) y termina
+    con el último byte de la respuesta, también en las respuestas en streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        HTTP_EN_CURSO.sumar()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            HTTP_EN_CURSO.sumar(cantidad=-1)
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            HTTP_SEGUNDOS.observar(time.perf_counter() - inicio, scope["method"], ruta, str(estado[0]))
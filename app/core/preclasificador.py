@@ -0,0 +1,214 @@
+"""Preclasificador local: resuelve sin llamar a la IA los mensajes claramente benignos o claramente estafa.
+
+Dos piezas, ambas en CPU y sin dependencias:
+
+- Un autómata de expresiones regulares (una sola alternancia con grupos con nombre)
+  que marca indicios típicos: petición de claves, enlaces, urgencia, premios, pagos...
+- Un modelo lineal (regresión logística) sobre rasgos con hashing: palabras, pares de
+  palabras y los indicios anteriores. Se entrena con las filas de ``Analisis`` que ya
+  tienen veredicto (``python entrenar_preclasificador.py``) y se guarda en JSON.
+
+``clasificar`` devuelve un ``Veredicto`` solo si la probabilidad supera
+``PRECLASIFICADOR_UMBRAL_ESTAFA`` o queda por debajo de ``PRECLASIFICADOR_UMBRAL_BENIGNO``;
+en otro caso devuelve ``None`` y el texto sigue hacia el modelo de OpenAI.
+"""
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import unicodedata
+import zlib
+
+from app.core.veredicto import Veredicto, Diagnostico
+
+# auto: activo si existe el fichero del modelo entrenado; 1: siempre; 0: nunca
+PRECLASIFICADOR = os.getenv("PRECLASIFICADOR", "auto")
+PRECLASIFICADOR_MODELO = os.getenv("PRECLASIFICADOR_MODELO", "preclasificador.json")
+PRECLASIFICADOR_UMBRAL_ESTAFA = float(os.getenv("PRECLASIFICADOR_UMBRAL_ESTAFA", "0.97"))
+PRECLASIFICADOR_UMBRAL_BENIGNO = float(os.getenv("PRECLASIFICADOR_UMBRAL_BENIGNO", "0.03"))
+BITS_HASH = 20
+
+logger = logging.getLogger(__name__)
+
+# Indicios sobre el texto sin tildes y en minúsculas
+INDICIOS = {
+    "datos_sensibles": r"\b(?:clave|contrasena|pin|cvv|codigo (?:de )?(?:verificacion|seguridad|acceso|sms)|numero de (?:tarjeta|cuenta)|datos bancarios)\b",
+    "enlace": r"(?:https?://|www\.|\b[a-z0-9-]+\.(?:com|es|net|org|info|xyz|top|ly|link|site)\b)",
+    "urgencia": r"\b(?:urgente|inmediatamente|de inmediato|ultimo aviso|hoy mismo|en las proximas \d+ horas|antes de \d+ horas)\b",
+    "bloqueo": r"\b(?:cuenta|tarjeta|acceso)\b.{0,40}?\b(?:bloquead|suspendid|desactivad|cancelad)",
+    "premio": r"\b(?:premio|ganador|ganado|sorteo|regalo|reembolso)\b",
+    "pago": r"\b(?:transferencia|bizum|pague|pagar|abonar|tasa|deposito|ingreso|ingresar)\b",
+    "suplantacion": r"\b(?:banco|hacienda|agencia tributaria|seguridad social|correos|policia|soporte tecnico)\b",
+    "paquete": r"\b(?:paquete|envio|pedido)\b.{0,40}?\b(?:retenid|pendiente|aduana|no entregad)",
+    "familiar": r"\b(?:mama|papa|hijo|hija)\b.{0,60}?\b(?:numero nuevo|movil nuevo|se me ha roto|este es mi nuevo)",
+    "inversion": r"\b(?:cripto\w*|bitcoin|inversion|rentabilidad garantizada|duplica tu dinero)\b",
+    "importe": r"\b\d+(?:[.,]\d+)?\s?(?:€|eur|euros|usd|\$)",
+}
+_AUTOMATA = re.compile("|".join(f"(?P<{nombre}>{patron})" for nombre, patron in INDICIOS.items()))
+_PALABRAS = re.compile(r"\w+")
+
+# Pesos iniciales de los indicios, usados mientras no hay un modelo entrenado
+PESOS_INDICIOS = {
+    "datos_sensibles": 2.5, "enlace": 1.5, "urgencia": 1.2, "bloqueo": 2.0, "premio": 1.5, "pago": 1.0,
+    "suplantacion": 0.8, "paquete": 1.5, "familiar": 2.5, "inversion": 1.5, "importe": 0.7,
+}
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def indicios(texto_normalizado):
+    """Nombres de los indicios presentes (una pasada por el texto)."""
+    return {m.lastgroup for m in _AUTOMATA.finditer(texto_normalizado)}
+
+
+def _indice(rasgo):
+    return zlib.crc32(rasgo.encode("utf-8")) & ((1 << BITS_HASH) - 1)
+
+
+def rasgos(texto):
+    """Índices de los rasgos del texto (sin repetir) y los indicios encontrados."""
+    normalizado = normalizar(texto)
+    encontrados = indicios(normalizado)
+    palabras = _PALABRAS.findall(normalizado)
+    claves = {f"i:{nombre}" for nombre in encontrados}
+    claves.update(f"p:{p}" for p in palabras)
+    claves.update(f"b:{a} {b}" for a, b in zip(palabras, palabras[1:]))
+    return {_indice(clave) for clave in claves}, encontrados
+
+
+class ModeloLineal:
+    """Regresión logística sobre rasgos con hashing; los pesos se guardan dispersos."""
+
+    def __init__(self, pesos=None, sesgo=0.0, entrenado=False):
+        self.pesos = pesos or {}
+        self.sesgo = sesgo
+        self.entrenado = entrenado
+
+    @classmethod
+    def inicial(cls):
+        """Modelo sin entrenar: solo los indicios, con un sesgo hacia escalar a la IA."""
+        return cls({_indice(f"i:{nombre}"): peso for nombre, peso in PESOS_INDICIOS.items()}, sesgo=-2.0)
+
+    def probabilidad(self, indices):
+        z = self.sesgo + sum(self.pesos.get(i, 0.0) for i in indices)
+        z = max(-30.0, min(30.0, z))
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def guardar(self, ruta):
+        datos = {"version": 1, "bits": BITS_HASH, "sesgo": self.sesgo, "pesos": {str(i): round(p, 5) for i, p in self.pesos.items() if p}}
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+        if datos.get("bits") != BITS_HASH:
+            raise ValueError(f"Modelo con {datos.get('bits')} bits de hash; se esperaban {BITS_HASH}")
+        return cls({int(i): p for i, p in datos["pesos"].items()}, datos["sesgo"], entrenado=True)
+
+
+def entrenar(ejemplos, epocas=8, tasa=0.2, l2=1e-5, semilla=0):
+    """Entrena con ``(texto, es_estafa)`` por descenso de gradiente estocástico."""
+    datos = [(rasgos(texto)[0], 1.0 if es_estafa else 0.0) for texto, es_estafa in ejemplos]
+    aleatorio = random.Random(semilla)
+    modelo = ModeloLineal(entrenado=True)
+    pesos = modelo.pesos
+    for epoca in range(epocas):
+        aleatorio.shuffle(datos)
+        paso = tasa / (1 + epoca)
+        for indices, etiqueta in datos:
+            error = modelo.probabilidad(indices) - etiqueta
+            modelo.sesgo -= paso * error
+            for i in indices:
+                peso = pesos.get(i, 0.0)
+                pesos[i] = peso - paso * (error + l2 * peso)
+    return modelo
+
+
+def evaluar(modelo, ejemplos, umbral_estafa=None, umbral_benigno=None):
+    """Cobertura (casos resueltos en local) y precisión de cada decisión sobre ``(texto, es_estafa)``."""
+    umbral_estafa = PRECLASIFICADOR_UMBRAL_ESTAFA if umbral_estafa is None else umbral_estafa
+    umbral_benigno = PRECLASIFICADOR_UMBRAL_BENIGNO if umbral_benigno is None else umbral_benigno
+    estafa = [0, 0]    # [aciertos, decisiones]
+    benigno = [0, 0]
+    for texto, es_estafa in ejemplos:
+        probabilidad = modelo.probabilidad(rasgos(texto)[0])
+        if probabilidad >= umbral_estafa:
+            estafa[0] += bool(es_estafa)
+            estafa[1] += 1
+        elif probabilidad <= umbral_benigno:
+            benigno[0] += not es_estafa
+            benigno[1] += 1
+    total = len(ejemplos)
+    return {
+        "ejemplos": total,
+        "cobertura": round((estafa[1] + benigno[1]) / total, 4) if total else 0.0,
+        "precision_estafa": round(estafa[0] / estafa[1], 4) if estafa[1] else None,
+        "precision_benigno": round(benigno[0] / benigno[1], 4) if benigno[1] else None,
+    }
+
+
+class Preclasificador:
+    def __init__(self, modelo=None, activo=False):
+        self.modelo = modelo or ModeloLineal.inicial()
+        self.activo = activo
+        self.stats = {"estafa": 0, "benigno": 0, "escalados": 0}
+        self._lock = threading.Lock()
+
+    def _contar(self, clave):
+        with self._lock:
+            self.stats[clave] += 1
+
+    def probabilidad(self, texto):
+        indices, encontrados = rasgos(texto)
+        return self.modelo.probabilidad(indices), encontrados
+
+    def clasificar(self, texto):
+        """``Veredicto`` local si el caso es claro; ``None`` para escalar a la IA."""
+        if not self.activo:
+            return None
+        probabilidad, encontrados = self.probabilidad(texto)
+        riesgo = round(probabilidad * 100)
+        if probabilidad >= PRECLASIFICADOR_UMBRAL_ESTAFA:
+            self._contar("estafa")
+            detalle = ", ".join(sorted(encontrados)) or "patrón aprendido"
+            return Veredicto(Diagnostico.ESTAFA, riesgo, f"Clasificación local: indicios típicos de estafa ({detalle}).")
+        if probabilidad <= PRECLASIFICADOR_UMBRAL_BENIGNO:
+            self._contar("benigno")
+            return Veredicto(Diagnostico.NO_ESTAFA, riesgo, "Clasificación local: sin indicios de estafa.")
+        self._contar("escalados")
+        return None
+
+    def estado(self):
+        total = sum(self.stats.values())
+        return {
+            "activo": self.activo,
+            "entrenado": self.modelo.entrenado,
+            **self.stats,
+            "ratio_local": round((self.stats["estafa"] + self.stats["benigno"]) / total, 4) if total else 0.0,
+        }
+
+
+def _cargar():
+    if PRECLASIFICADOR == "0":
+        return Preclasificador(activo=False)
+    try:
+        modelo = ModeloLineal.cargar(PRECLASIFICADOR_MODELO)
+    except FileNotFoundError:
+        return Preclasificador(activo=PRECLASIFICADOR == "1")
+    except (ValueError, KeyError, json.JSONDecodeError):
+        logger.exception("No se pudo cargar el modelo del preclasificador %s", PRECLASIFICADOR_MODELO)
+        return Preclasificador(activo=PRECLASIFICADOR == "1")
+    return Preclasificador(modelo, activo=True)
+
+
+preclasificador = _cargar()
@@ -0,0 +1,95 @@
+"""Estado por sesión para el análisis incremental de audio en vivo.
+
+En lugar de reenviar todo el texto acumulado a la IA en cada fragmento, el servidor
+guarda por ``session_id`` la transcripción, una ventana deslizante con las últimas
+palabras y el último veredicto. Solo se vuelve a analizar cuando llega suficiente
+texto nuevo, y siempre sobre la ventana, así que el coste por fragmento no crece
+con la duración de la llamada.
+"""
+import asyncio
+import os
+from collections import deque
+
+from app.core.cache import CacheTTL
+
+SESION_VENTANA_PALABRAS = int(os.getenv("SESION_VENTANA_PALABRAS", "300"))
+SESION_UMBRAL_PALABRAS = int(os.getenv("SESION_UMBRAL_PALABRAS", "20"))
+SESION_MAX_PALABRAS = int(os.getenv("SESION_MAX_PALABRAS", "20000"))
+SESION_TTL = float(os.getenv("SESION_TTL", "3600"))
+SESION_MAX = int(os.getenv("SESION_MAX", "10000"))
+
+
+class EstadoSesion:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.palabras = deque(maxlen=SESION_MAX_PALABRAS)
+        self.palabras_pendientes = 0
+        self.veredicto = None        # Último veredicto válido (``Veredicto``)
+        self.riesgo_max = None
+        self.fragmentos = 0
+
+    def agregar(self, texto):
+        nuevas = (texto or "").split()
+        self.palabras.extend(nuevas)
+        self.palabras_pendientes += len(nuevas)
+        self.fragmentos += 1
+
+    def requiere_analisis(self):
+        if not self.palabras_pendientes:
+            return False
+        return self.veredicto is None or self.palabras_pendientes >= SESION_UMBRAL_PALABRAS
+
+    def ventana(self):
+        inicio = max(0, len(self.palabras) - SESION_VENTANA_PALABRAS)
+        return " ".join(self.palabras[i] for i in range(inicio, len(self.palabras)))
+
+    def transcripcion(self):
+        return " ".join(self.palabras)
+
+    @property
+    def ultimo_resultado(self):
+        """Texto legible del último veredicto, o ``None`` si aún no hay ninguno."""
+        return self.veredicto.texto if self.veredicto is not None else None
+
+    def restaurar(self, transcripcion, veredicto, riesgo_max, fragmentos):
+        """Recupera una sesión guardada (p. ej. tras reiniciar el proceso) sin volver a analizarla."""
+        self.palabras.extend((transcripcion or "").split())
+        self.veredicto = veredicto
+        self.riesgo_max = riesgo_max
+        self.fragmentos = fragmentos or 0
+        self.palabras_pendientes = 0
+
+    def registrar_veredicto(self, veredicto):
+        # Los errores no sustituyen al veredicto previo y se reintenta en el próximo fragmento
+        if veredicto is not None and not veredicto.es_error:
+            self.veredicto = veredicto
+            self.palabras_pendientes = 0
+            if veredicto.riesgo is not None:
+                self.riesgo_max = max(self.riesgo_max or 0, veredicto.riesgo)
+
+
+class GestorSesiones:
+    """Registro acotado de sesiones activas; las inactivas expiran tras ``SESION_TTL``."""
+
+    def __init__(self, max_sesiones=SESION_MAX, ttl=SESION_TTL):
+        self._sesiones = CacheTTL(max_sesiones, ttl)
+
+    def obtener(self, usuario_id, session_id):
+        """Devuelve ``(estado, nueva)``; el estado se crea si no existe o había expirado."""
+        clave = (usuario_id, session_id)
+        estado = self._sesiones.get(clave)
+        nueva = estado is None
+        if nueva:
+            estado = EstadoSesion()
+        # Renovar la expiración en cada uso
+        self._sesiones.set(clave, estado)
+        return estado, nueva
+
+    def cerrar(self, usuario_id, session_id):
+        self._sesiones.invalidar((usuario_id, session_id))
+
+    def __len__(self):
+        return len(self._sesiones)
+
+
+sesiones = GestorSesiones()
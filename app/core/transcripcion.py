@@ -0,0 +1,121 @@
+"""Transcripción de grabaciones largas: segmentos en paralelo y unión en orden.
+
+Whisper recibe el archivo en una sola petición, así que una llamada de 30 minutos
+choca con el límite de tamaño de la API y tarda lo que tarde transcribirla entera.
+``transcribir_por_segmentos`` corta el audio a medida que se lee (``SegmentadorVoz``)
+en las pausas, en segmentos de ``TRANSCRIPCION_MIN_SEGUNDOS`` a
+``TRANSCRIPCION_MAX_SEGUNDOS``, y lanza cada uno a Whisper en cuanto se cierra, con
+como mucho ``TRANSCRIPCION_PARALELO`` en vuelo. Con suficientes llamadas en paralelo,
+la grabación completa tarda aproximadamente lo que el segmento más lento.
+
+Cuando no hay pausa y el corte cae en mitad de una frase, el segmento siguiente repite
+los últimos ``TRANSCRIPCION_SOLAPE_MS``; ``unir_transcripciones`` quita del texto las
+palabras que ambos segmentos transcribieron.
+"""
+import asyncio
+import os
+import re
+import unicodedata
+
+from app.core.audio import SegmentadorVoz, preparar_para_whisper
+from app.core.inference import transcribir_audio
+
+TRANSCRIPCION_MIN_SEGUNDOS = float(os.getenv("TRANSCRIPCION_MIN_SEGUNDOS", "20"))    # No cortar en pausas antes de esto
+TRANSCRIPCION_MAX_SEGUNDOS = float(os.getenv("TRANSCRIPCION_MAX_SEGUNDOS", "60"))    # Corte forzado sin pausa
+TRANSCRIPCION_SILENCIO_MS = int(os.getenv("TRANSCRIPCION_SILENCIO_MS", "500"))        # Pausa que se considera frontera
+TRANSCRIPCION_SOLAPE_MS = int(os.getenv("TRANSCRIPCION_SOLAPE_MS", "1500"))           # Audio repetido en los cortes forzados
+TRANSCRIPCION_PARALELO = int(os.getenv("TRANSCRIPCION_PARALELO", "8"))                # Segmentos en vuelo por grabación
+
+_PALABRA = re.compile(r"\w+")
+
+
+def _normalizar(palabra):
+    palabra = unicodedata.normalize("NFKD", palabra.lower())
+    return "".join(_PALABRA.findall("".join(c for c in palabra if not unicodedata.combining(c))))
+
+
+def _quitar_solape(anterior, siguiente, max_palabras):
+    """Palabras de ``siguiente`` sin las que repiten el final de ``anterior``.
+
+    Whisper puede transcribir a medias la palabra cortada en cada extremo, así que se
+    admite descartar la última palabra de ``anterior`` y hasta dos al principio de
+    ``siguiente``; con un descarte, la coincidencia debe ser de dos palabras o más.
+    """
+    fin = [_normalizar(p) for p in anterior[-max_palabras - 1:]]
+    inicio = [_normalizar(p) for p in siguiente[:max_palabras + 2]]
+    for k in range(min(max_palabras, len(fin), len(inicio)), 0, -1):
+        for recorte in (0, 1):
+            cola = fin[len(fin) - k - recorte:len(fin) - recorte]
+            if len(cola) < k:
+                continue
+            for salto in range(3):
+                if (recorte or salto) and k < 2:
+                    continue
+                if inicio[salto:salto + k] == cola:
+                    return recorte, siguiente[salto + k:]
+    return 0, siguiente
+
+
+def unir_transcripciones(partes, max_palabras=None):
+    """Une en orden ``(texto, solapa_con_anterior)``; en las fronteras solapadas quita lo repetido."""
+    max_palabras = max_palabras or max(4, round(TRANSCRIPCION_SOLAPE_MS / 1000 * 4))
+    palabras = []
+    for texto, solapa in partes:
+        nuevas = texto.split()
+        if solapa and palabras and nuevas:
+            recorte, nuevas = _quitar_solape(palabras, nuevas, max_palabras)
+            if recorte:
+                del palabras[-recorte:]
+        palabras.extend(nuevas)
+    return " ".join(palabras)
+
+
+async def _transcribir_segmento(segmento):
+    loop = asyncio.get_running_loop()
+    # Remuestreo a 16 kHz mono y VAD fuera del event loop; un segmento sin voz no llega a Whisper
+    wav_16k, voz = await loop.run_in_executor(None, preparar_para_whisper, segmento)
+    if not voz:
+        return ""
+    return await transcribir_audio(wav_16k)
+
+
+async def transcribir_por_segmentos(bloques, paralelo=None):
+    """Transcribe un WAV (o PCM) que llega por ``bloques`` (iterable asíncrono de bytes).
+
+    La lectura se detiene mientras haya ``paralelo`` segmentos en vuelo, así que la
+    memoria depende del tamaño de segmento y no de la duración de la grabación.
+    Devuelve el texto unido o el primer error de Whisper.
+    """
+    limite = asyncio.Semaphore(paralelo or TRANSCRIPCION_PARALELO)
+    segmentador = SegmentadorVoz(
+        silencio_ms=TRANSCRIPCION_SILENCIO_MS,
+        min_segundos=TRANSCRIPCION_MIN_SEGUNDOS,
+        max_segundos=TRANSCRIPCION_MAX_SEGUNDOS,
+        solape_ms=TRANSCRIPCION_SOLAPE_MS,
+    )
+    tareas = []
+
+    async def con_limite(segmento):
+        try:
+            return await _transcribir_segmento(segmento)
+        finally:
+            limite.release()
+
+    async def lanzar(segmentos):
+        for segmento in segmentos:
+            await limite.acquire()
+            # El segmentador marca los que empiezan con el final de un corte sin pausa
+            tareas.append((asyncio.ensure_future(con_limite(segmento)), segmento.solapa))
+
+    try:
+        async for bloque in bloques:
+            await lanzar(segmentador.agregar(bloque))
+        await lanzar(segmentador.cerrar())
+        textos = await asyncio.gather(*(tarea for tarea, _ in tareas))
+    finally:
+        for tarea, _ in tareas:
+            tarea.cancel()
+    errores = [texto for texto in textos if texto.startswith("Error")]
+    if errores:
+        return errores[0]
+    return unir_transcripciones((texto, solapa) for texto, (_, solapa) in zip(textos, tareas))
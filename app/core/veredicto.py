@@ -0,0 +1,160 @@
+"""Veredicto tipado de un análisis de fraude.
+
+El modelo responde un JSON con diagnóstico, explicación y riesgo; aquí se valida y
+se guarda tal cual en campos tipados en lugar de formatearlo como texto y volver a
+extraer el riesgo con expresiones regulares. El texto legible (``Veredicto.texto``)
+solo se genera para mostrarlo y para la columna ``resultado``.
+"""
+import enum
+import json
+import re
+
+
+class Diagnostico(str, enum.Enum):
+    ESTAFA = "Estafa"
+    NO_ESTAFA = "No Estafa"
+
+    @classmethod
+    def normalizar(cls, valor):
+        """Convierte lo que devuelva el modelo ("estafa", "No es estafa", ...) al enum, o ``None``."""
+        if isinstance(valor, cls):
+            return valor
+        if not isinstance(valor, str):
+            return None
+        valor = " ".join(valor.lower().split())
+        if valor.startswith("no"):
+            return cls.NO_ESTAFA if "estafa" in valor else None
+        return cls.ESTAFA if "estafa" in valor else None
+
+
+def normalizar_riesgo(valor):
+    """Riesgo entero entre 0 y 100, o ``None`` si el valor no es un número."""
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, str):
+        valor = valor.strip().rstrip("%")
+    try:
+        return max(0, min(100, int(round(float(valor)))))
+    except (TypeError, ValueError):
+        return None
+
+
+class Veredicto:
+    """Diagnóstico, riesgo (0-100) y explicación; ``error`` indica que no hubo veredicto."""
+
+    __slots__ = ("diagnostico", "riesgo", "explicacion", "error")
+
+    def __init__(self, diagnostico=None, riesgo=None, explicacion=None, error=None):
+        self.diagnostico = Diagnostico.normalizar(diagnostico)
+        self.riesgo = normalizar_riesgo(riesgo)
+        self.explicacion = explicacion
+        self.error = error
+
+    @classmethod
+    def de_error(cls, mensaje):
+        return cls(error=mensaje)
+
+    @classmethod
+    def desde_respuesta(cls, respuesta):
+        """Veredicto a partir de la respuesta JSON del modelo; si no es JSON se conserva como explicación."""
+        try:
+            datos = json.loads(respuesta)
+        except (TypeError, json.JSONDecodeError):
+            return cls(explicacion=respuesta)
+        if not isinstance(datos, dict):
+            return cls(explicacion=respuesta)
+        return cls(datos.get("diagnostico"), datos.get("riesgo"), datos.get("explicacion"))
+
+    @classmethod
+    def desde_json(cls, texto):
+        return cls(**json.loads(texto))
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """Compatibilidad: recupera los campos del texto formateado que guardaban las versiones anteriores."""
+        if not texto:
+            return cls()
+        diagnostico = re.search(r"Diagn[oó]stico:\s*(.+)", texto)
+        explicacion = re.search(r"Explicaci[oó]n:\s*(.+?)(?:\n\s*\n|\Z)", texto, re.S)
+        riesgo = re.search(r"Riesgo:\s*([0-9]{1,3})\s*/\s*100", texto)
+        return cls(
+            diagnostico.group(1) if diagnostico else None,
+            riesgo.group(1) if riesgo else None,
+            explicacion.group(1).strip() if explicacion else None,
+        )
+
+    @property
+    def es_error(self):
+        return self.error is not None
+
+    @property
+    def estructurado(self):
+        return self.diagnostico is not None and self.riesgo is not None
+
+    @property
+    def texto(self):
+        """Texto legible, con el mismo formato que devolvía la API antes de los campos tipados."""
+        if self.es_error:
+            return self.error
+        if self.diagnostico is None and self.riesgo is None:
+            return self.explicacion or ""
+        return (
+            f"Diagnóstico: {self.diagnostico.value if self.diagnostico else '?'}\n\n"
+            f"Explicación: {self.explicacion or '?'}\n\n"
+            f"Riesgo: {self.riesgo if self.riesgo is not None else '?'}/100"
+        )
+
+    def a_dict(self):
+        return {
+            "diagnostico": self.diagnostico.value if self.diagnostico else None,
+            "riesgo": self.riesgo,
+            "explicacion": self.explicacion,
+        }
+
+    def a_json(self):
+        return json.dumps(self.a_dict(), ensure_ascii=False)
+
+    def columnas(self):
+        """Campos para las filas de ``Analisis``: los tipados más el texto legible."""
+        return {**self.a_dict(), "resultado": self.texto}
+
+    def __eq__(self, otro):
+        if not isinstance(otro, Veredicto):
+            return NotImplemented
+        return self.a_dict() == otro.a_dict() and self.error == otro.error
+
+    def __hash__(self):
+        return hash((self.diagnostico, self.riesgo, self.explicacion, self.error))
+
+    def __repr__(self):
+        if self.es_error:
+            return f"Veredicto(error={self.error!r})"
+        return f"Veredicto({self.diagnostico and self.diagnostico.value!r}, {self.riesgo!r}, {self.explicacion!r})"
+
+
+def veredictos_desde_lote(respuesta, cantidad):
+    """Veredictos de una respuesta con varios mensajes (``{"resultados": [{"id": 1, ...}, ...]}``).
+
+    Devuelve ``cantidad`` elementos en el orden de los mensajes; los que el modelo omita,
+    repita o no devuelva completos quedan a ``None`` para analizarlos por separado.
+    """
+    veredictos = [None] * cantidad
+    try:
+        datos = json.loads(respuesta)
+    except (TypeError, json.JSONDecodeError):
+        return veredictos
+    resultados = datos.get("resultados") if isinstance(datos, dict) else None
+    if not isinstance(resultados, list):
+        return veredictos
+    for resultado in resultados:
+        if not isinstance(resultado, dict):
+            continue
+        try:
+            indice = int(resultado.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= indice < cantidad and veredictos[indice] is None:
+            veredicto = Veredicto(resultado.get("diagnostico"), resultado.get("riesgo"), resultado.get("explicacion"))
+            if veredicto.estructurado:
+                veredictos[indice] = veredicto
+    return veredictos
@@ -1,16 +1,108 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import exc
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from app.core.metricas import Indicador
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Configuración del engine y del pool; el tamaño se ajusta al número de pods/workers
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"                       # Log de cada sentencia SQL (solo para depurar)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))       # Espera máxima por una conexión libre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))       # Renovar conexiones antes de que las corte el servidor
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))  # 0 = sin límite
+# Sentencias preparadas cacheadas por conexión (asyncpg); 0 si hay un pgbouncer en modo transacción
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "100"))
+
+
+class PoolMedido(AsyncAdaptedQueuePool):
+    """Pool que además registra cuánto tarda cada checkout y cuántos agotan el timeout."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metricas_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._metricas_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._metricas_lock:
+                self.checkouts += 1
+                self.espera_total += espera
+                self.espera_max = max(self.espera_max, espera)
+
+
+def _opciones_engine(url):
+    opciones = {"echo": DB_ECHO}
+    if ":memory:" in url:
+        # SQLite en memoria usa su propio pool de una sola conexión
+        return opciones
+    opciones.update(
+        poolclass=PoolMedido,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    if url.startswith("postgresql+asyncpg"):
+        # La caché de sentencias preparadas la gestiona el adaptador asyncpg de SQLAlchemy
+        connect_args = {"prepared_statement_cache_size": DB_STATEMENT_CACHE}
+        if DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+        opciones["connect_args"] = connect_args
+    return opciones
+
+
+engine = create_async_engine(DATABASE_URL, **_opciones_engine(DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
 async def get_db():
     async with SessionLocal() as session:
         yield session
+
+
+def metricas_pool():
+    """Estado del pool de conexiones: en uso, overflow y tiempos de espera del checkout."""
+    pool = engine.pool
+    if not isinstance(pool, PoolMedido):
+        return {"pool": type(pool).__name__, "estado": pool.status()}
+    with pool._metricas_lock:
+        return {
+            "pool": type(pool).__name__,
+            "tamano": pool.size(),
+            "en_uso": pool.checkedout(),
+            "libres": pool.checkedin(),
+            # overflow() cuenta desde -pool_size; aquí solo las conexiones por encima de pool_size
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "espera_media_ms": round(pool.espera_total / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            "espera_max_ms": round(pool.espera_max * 1000, 3),
+        }
+
+
+Indicador("db_conexiones_en_uso", "Conexiones del pool prestadas en este momento",
+          funcion=lambda: {(): engine.pool.checkedout()} if isinstance(engine.pool, PoolMedido) else {})
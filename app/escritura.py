@@ -0,0 +1,303 @@
+"""Escritura diferida (write-behind) de filas ``Analisis`` y ``Sesion``.
+
+Los endpoints de análisis encolan la fila y responden en cuanto tienen el veredicto;
+una tarea en segundo plano las inserta por lotes de hasta ``ESCRITURA_LOTE_MAX`` filas
+o cada ``ESCRITURA_INTERVALO`` segundos, en una sola transacción por lote. El estado
+de las sesiones en vivo se guarda con upsert: de todos los fragmentos de una sesión
+que llegan entre dos lotes solo se escribe el último.
+
+La cola está acotada: si se llena, ``encolar`` espera hasta ``ESCRITURA_ESPERA_MAX``
+segundos a que haya hueco y, si no lo hay, escribe la fila en el fichero de respaldo
+(``ESCRITURA_SPOOL``, JSON por líneas). Lo mismo ocurre con lo que quede pendiente
+al apagar. El fichero se reinserta al arrancar.
+
+Un lote que la base de datos rechaza tras varios reintentos se escribe fila a fila:
+las filas que fallan por un error que no se arregla reintentando (restricción violada,
+usuario borrado) van al fichero de descartes (``ESCRITURA_DESCARTES``), que no se
+reinserta; las que fallan por otro motivo (base de datos caída) van al de respaldo.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import exc, insert, case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database import SessionLocal, engine
+from app import models, analitica
+from app.core.metricas import medir, Indicador
+
+ESCRITURA_LOTE_MAX = int(os.getenv("ESCRITURA_LOTE_MAX", "200"))
+ESCRITURA_INTERVALO = float(os.getenv("ESCRITURA_INTERVALO", "0.25"))
+ESCRITURA_COLA_MAX = int(os.getenv("ESCRITURA_COLA_MAX", "10000"))
+ESCRITURA_ESPERA_MAX = float(os.getenv("ESCRITURA_ESPERA_MAX", "2"))
+ESCRITURA_SPOOL = os.getenv("ESCRITURA_SPOOL", "analisis_pendientes.jsonl")
+ESCRITURA_DESCARTES = os.getenv("ESCRITURA_DESCARTES", "analisis_descartados.jsonl")
+ESCRITURA_REINTENTOS = 3
+# Errores de una fila que se repetirían en cada reintento: la fila va al fichero de descartes
+ERRORES_PERMANENTES = (exc.IntegrityError, exc.DataError)
+# Todas las filas de un lote llevan las mismas columnas (las líneas antiguas del fichero de respaldo no traen el veredicto)
+CAMPOS_VEREDICTO = ("diagnostico", "riesgo", "explicacion")
+
+logger = logging.getLogger(__name__)
+
+
+def _upsert_sesiones(filas):
+    S = models.Sesion
+    insertar = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    consulta = insertar(S).values(filas)
+    nuevo = consulta.excluded
+    # fecha_inicio solo se escribe al crear la fila; el riesgo máximo nunca baja
+    return consulta.on_conflict_do_update(
+        index_elements=[S.usuario_id, S.session_id],
+        set_={
+            "transcripcion": nuevo.transcripcion,
+            "ultimo_resultado": func.coalesce(nuevo.ultimo_resultado, S.ultimo_resultado),
+            **{campo: func.coalesce(getattr(nuevo, campo), getattr(S, campo)) for campo in CAMPOS_VEREDICTO},
+            "riesgo_max": case(
+                (S.riesgo_max.is_(None), nuevo.riesgo_max),
+                (nuevo.riesgo_max > S.riesgo_max, nuevo.riesgo_max),
+                else_=S.riesgo_max,
+            ),
+            "fragmentos": nuevo.fragmentos,
+            "origen": nuevo.origen,
+            "fecha_actualizacion": nuevo.fecha_actualizacion,
+        },
+    )
+
+
+def _escribir_lineas(fichero, filas, tabla):
+    if not filas:
+        return
+    with open(fichero, "a", encoding="utf-8") as f:
+        for campos in filas:
+            linea = {k: v.isoformat() if isinstance(v, datetime) else v for k, v in campos.items()}
+            f.write(json.dumps({"tabla": tabla, **linea}, ensure_ascii=False) + "\n")
+
+
+class EscritorAnalisis:
+    def __init__(self):
+        self._filas = deque()
+        self._sesiones = {}          # (usuario_id, session_id) -> (número, último estado)
+        self._secuencia = 0          # Número de la última fila encolada
+        self._escrito_hasta = 0      # Todas las filas con número <= este ya están en la base de datos
+        self._ultima_por_usuario = {}
+        self._loop = None
+        self._tarea = None
+        self._hay_filas = None
+        self._hay_hueco = None
+        self._escrito = None
+        self._cerrando = False
+        self.stats = {"encoladas": 0, "escritas": 0, "sesiones_encoladas": 0, "sesiones_escritas": 0, "lotes": 0, "a_spool": 0, "descartadas": 0, "errores": 0}
+
+    def _asegurar_tarea(self):
+        # Los eventos y la tarea pertenecen al event loop en el que se crean
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._hay_filas = asyncio.Event()
+            self._hay_hueco = asyncio.Event()
+            self._escrito = asyncio.Condition()
+            self._tarea = None
+        if self._tarea is None or self._tarea.done():
+            self._tarea = loop.create_task(self._bucle())
+
+    async def encolar(self, **campos):
+        """Encola una fila de ``Analisis``; la fecha es la del momento de encolar."""
+        campos.setdefault("fecha", datetime.utcnow())
+        for campo in CAMPOS_VEREDICTO:
+            campos.setdefault(campo, None)
+        if self._cerrando:
+            self._a_spool([campos])
+            return
+        self._asegurar_tarea()
+        if len(self._filas) >= ESCRITURA_COLA_MAX:
+            # Contrapresión: la petición espera a que el escritor libere hueco
+            self._hay_hueco.clear()
+            try:
+                await asyncio.wait_for(self._hay_hueco.wait(), ESCRITURA_ESPERA_MAX)
+            except asyncio.TimeoutError:
+                pass
+            if len(self._filas) >= ESCRITURA_COLA_MAX:
+                self._a_spool([campos])
+                return
+        despertar = self._vacio()
+        self._secuencia += 1
+        self._filas.append((self._secuencia, campos))
+        self._ultima_por_usuario[campos["usuario_id"]] = self._secuencia
+        self.stats["encoladas"] += 1
+        # Despertar al escritor si estaba parado (empieza a contar el intervalo) o si el lote ya está lleno
+        if despertar or len(self._filas) >= ESCRITURA_LOTE_MAX:
+            self._hay_filas.set()
+
+    async def encolar_sesion(self, **campos):
+        """Encola el estado completo de una sesión; sustituye al pendiente de la misma sesión."""
+        ahora = datetime.utcnow()
+        campos.setdefault("fecha_inicio", ahora)
+        campos.setdefault("fecha_actualizacion", ahora)
+        for campo in CAMPOS_VEREDICTO:
+            campos.setdefault(campo, None)
+        if self._cerrando:
+            self._a_spool([campos], tabla="sesiones")
+            return
+        self._asegurar_tarea()
+        despertar = self._vacio()
+        self._secuencia += 1
+        self._sesiones[(campos["usuario_id"], campos["session_id"])] = (self._secuencia, campos)
+        self._ultima_por_usuario[campos["usuario_id"]] = self._secuencia
+        self.stats["sesiones_encoladas"] += 1
+        if despertar:
+            self._hay_filas.set()
+
+    def _vacio(self):
+        return not self._filas and not self._sesiones
+
+    async def esperar_usuario(self, usuario_id, timeout=None):
+        """Espera a que estén escritas las filas ya encoladas de un usuario (lectura de lo propio)."""
+        objetivo = self._ultima_por_usuario.get(usuario_id, 0)
+        if objetivo <= self._escrito_hasta or self._tarea is None:
+            return
+        self._asegurar_tarea()
+        self._hay_filas.set()
+        async with self._escrito:
+            try:
+                await asyncio.wait_for(
+                    self._escrito.wait_for(lambda: self._escrito_hasta >= objetivo),
+                    timeout if timeout is not None else ESCRITURA_INTERVALO * 8,
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _bucle(self):
+        while True:
+            if self._vacio():
+                self._hay_filas.clear()
+                await self._hay_filas.wait()
+            if len(self._filas) < ESCRITURA_LOTE_MAX and not self._cerrando:
+                # Dar tiempo a que se acumule un lote; se adelanta si se llena o si alguien espera
+                self._hay_filas.clear()
+                try:
+                    await asyncio.wait_for(self._hay_filas.wait(), ESCRITURA_INTERVALO)
+                except asyncio.TimeoutError:
+                    pass
+            await self._vaciar_lote()
+
+    async def _vaciar_lote(self):
+        lote = [self._filas[i] for i in range(min(ESCRITURA_LOTE_MAX, len(self._filas)))]
+        sesiones, self._sesiones = self._sesiones, {}
+        if not lote and not sesiones:
+            return
+        filas = [campos for _, campos in lote]
+        estados = [campos for _, campos in sesiones.values()]
+        for intento in range(ESCRITURA_REINTENTOS):
+            try:
+                await self._escribir(filas, estados)
+                self.stats["lotes"] += 1
+                break
+            except Exception:
+                self.stats["errores"] += 1
+                logger.exception("Error al escribir un lote de %d análisis y %d sesiones (intento %d)", len(filas), len(estados), intento + 1)
+                await asyncio.sleep(0.5 * 2 ** intento)
+        else:
+            await self._escribir_por_separado(filas, estados)
+        # Solo se retiran de la cola después de escribirlas (o de pasarlas al fichero de respaldo)
+        for _ in lote:
+            self._filas.popleft()
+        self._hay_hueco.set()
+        async with self._escrito:
+            pendientes = [numero for numero, _ in self._sesiones.values()]
+            if self._filas:
+                pendientes.append(self._filas[0][0])
+            self._escrito_hasta = min(pendientes, default=self._secuencia + 1) - 1
+            self._escrito.notify_all()
+
+    async def _escribir(self, filas, estados):
+        with medir("persistir"):
+            async with SessionLocal() as db:
+                if filas:
+                    await db.execute(insert(models.Analisis), filas)
+                    await analitica.registrar(db, filas)
+                if estados:
+                    await analitica.registrar_sesiones(db, estados)
+                    await db.execute(_upsert_sesiones(estados))
+                await db.commit()
+        self.stats["escritas"] += len(filas)
+        self.stats["sesiones_escritas"] += len(estados)
+
+    async def _escribir_por_separado(self, filas, estados):
+        """Aísla las filas que hacen fallar un lote: cada una en su propia transacción."""
+        for tabla, pendientes in (("analisis", filas), ("sesiones", estados)):
+            for campos in pendientes:
+                try:
+                    if tabla == "sesiones":
+                        await self._escribir([], [campos])
+                    else:
+                        await self._escribir([campos], [])
+                except ERRORES_PERMANENTES:
+                    logger.exception("Fila de %s descartada: la base de datos no la acepta", tabla)
+                    self._a_descartes([campos], tabla=tabla)
+                except Exception:
+                    self._a_spool([campos], tabla=tabla)
+
+    def _a_spool(self, filas, tabla="analisis"):
+        _escribir_lineas(ESCRITURA_SPOOL, filas, tabla)
+        self.stats["a_spool"] += len(filas)
+
+    def _a_descartes(self, filas, tabla="analisis"):
+        _escribir_lineas(ESCRITURA_DESCARTES, filas, tabla)
+        self.stats["descartadas"] += len(filas)
+
+    async def iniciar(self):
+        """Arranca el escritor y reinserta las filas que quedaron en el fichero de respaldo."""
+        self._cerrando = False
+        self._asegurar_tarea()
+        pendiente = f"{ESCRITURA_SPOOL}.{os.getpid()}"
+        try:
+            # Con varios workers solo uno se queda con el fichero
+            os.replace(ESCRITURA_SPOOL, pendiente)
+        except FileNotFoundError:
+            return
+        with open(pendiente, encoding="utf-8") as f:
+            filas = [json.loads(linea) for linea in f if linea.strip()]
+        for campos in filas:
+            tabla = campos.pop("tabla", "analisis")
+            for clave in ("fecha", "fecha_inicio", "fecha_actualizacion"):
+                if campos.get(clave):
+                    campos[clave] = datetime.fromisoformat(campos[clave])
+            if tabla == "sesiones":
+                await self.encolar_sesion(**campos)
+            else:
+                await self.encolar(**campos)
+        os.remove(pendiente)
+        logger.info("Reinsertados %d análisis del fichero de respaldo", len(filas))
+
+    async def cerrar(self, timeout=10):
+        """Vacía la cola al apagar; lo que no se pueda escribir a tiempo va al fichero de respaldo."""
+        self._cerrando = True
+        if self._tarea is not None and not self._tarea.done() and self._loop is asyncio.get_running_loop():
+            self._hay_filas.set()
+            async with self._escrito:
+                try:
+                    await asyncio.wait_for(self._escrito.wait_for(self._vacio), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self._tarea.cancel()
+        self._a_spool([campos for _, campos in self._filas])
+        self._a_spool([campos for _, campos in self._sesiones.values()], tabla="sesiones")
+        self._filas.clear()
+        self._sesiones.clear()
+
+    def estado(self):
+        return {**self.stats, "pendientes": len(self._filas), "sesiones_pendientes": len(self._sesiones)}
+
+
+escritor_analisis = EscritorAnalisis()
+
+Indicador("escritura_pendientes", "Filas y sesiones en cola para la base de datos", ("tabla",), funcion=lambda: {
+    ("analisis",): len(escritor_analisis._filas),
+    ("sesiones",): len(escritor_analisis._sesiones),
+})
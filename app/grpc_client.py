@@ -18,10 +18,16 @@ import app.proto.fraud_detection_pb2_grpc as fraud_detection_pb2_grpc
 AUDIO_PATH = sys.argv[1] if len(sys.argv) > 1 else 'prueba.wav'
 SESSION_ID = sys.argv[2] if len(sys.argv) > 2 else 'demo-session-1'
 
-def audio_chunks_from_file(path, session_id=SESSION_ID):
+CHUNK_BYTES = 64 * 1024
+
+def audio_chunks_from_file(path, session_id=SESSION_ID, chunk_bytes=CHUNK_BYTES):
+    # Se envía por bloques: el archivo nunca está entero en memoria ni en un único mensaje
     with open(path, "rb") as f:
-        data = f.read()
-        yield fraud_detection_pb2.AudioChunk(data=data, session_id=session_id)
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            yield fraud_detection_pb2.AudioChunk(data=data, session_id=session_id)
 
 def main():
     channel = grpc.insecure_channel("localhost:50051")
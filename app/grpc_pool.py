@@ -0,0 +1,92 @@
+"""Pool de canales ``grpc.aio`` reutilizables hacia el microservicio de detección.
+
+Los canales se crean la primera vez que se usan y se comparten entre peticiones,
+así que la conexión HTTP/2 (y su handshake) se paga una sola vez por proceso. Se
+reparten en round-robin, se mantienen vivos con keepalive y se saltan los que
+están en fallo mientras haya alguno sano.
+"""
+import asyncio
+import itertools
+import os
+
+import grpc
+
+import app.proto.fraud_detection_pb2_grpc as fraud_detection_pb2_grpc
+
+GRPC_SERVER_URL = os.getenv("GRPC_SERVER_URL", "localhost:50051")
+GRPC_CANALES = int(os.getenv("GRPC_CANALES", "2"))
+GRPC_DEADLINE = float(os.getenv("GRPC_DEADLINE", "120"))           # Segundos por llamada StreamAudio
+GRPC_TIMEOUT_CONEXION = float(os.getenv("GRPC_TIMEOUT_CONEXION", "5"))
+GRPC_CHUNK_BYTES = int(os.getenv("GRPC_CHUNK_BYTES", str(64 * 1024)))
+
+OPCIONES_CANAL = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_send_message_length", 4 * 1024 * 1024),
+    ("grpc.max_receive_message_length", 4 * 1024 * 1024),
+]
+
+
+class GrpcNoDisponible(Exception):
+    """Ningún canal del pool pudo conectar con el servidor gRPC."""
+
+
+class PoolCanales:
+    def __init__(self, destino=GRPC_SERVER_URL, tamano=GRPC_CANALES, opciones=OPCIONES_CANAL):
+        self.destino = destino
+        self.tamano = tamano
+        self.opciones = opciones
+        self._canales = []
+        self._stubs = []
+        self._turno = itertools.count()
+        self._loop = None
+
+    async def _crear(self):
+        # Los canales aio pertenecen al event loop en el que se crean: al cambiar de loop
+        # (reinicio de la app en el mismo proceso, tests) se cierran los anteriores; si no,
+        # sus conexiones quedan abiertas. Los nuevos se publican antes de esperar al cierre
+        # para que las peticiones concurrentes no creen otro juego de canales.
+        anterior, anteriores = self._loop, self._canales
+        self._loop = asyncio.get_running_loop()
+        self._canales = [grpc.aio.insecure_channel(self.destino, options=self.opciones) for _ in range(self.tamano)]
+        self._stubs = [fraud_detection_pb2_grpc.FraudDetectionStub(canal) for canal in self._canales]
+        for canal in anteriores:
+            if anterior is not None and anterior.is_running():
+                asyncio.run_coroutine_threadsafe(canal.close(), anterior)
+            else:
+                await canal.close()
+
+    async def stub(self):
+        """Devuelve un stub sobre un canal listo; lanza ``GrpcNoDisponible`` si ninguno conecta."""
+        if not self._canales or self._loop is not asyncio.get_running_loop():
+            await self._crear()
+        inicio = next(self._turno)
+        indices = [(inicio + i) % self.tamano for i in range(self.tamano)]
+        for i in indices:
+            estado = self._canales[i].get_state(try_to_connect=True)
+            if estado == grpc.ChannelConnectivity.READY:
+                return self._stubs[i]
+        # Ninguno listo todavía (arranque o reconexión): esperar al primero que conecte
+        esperas = {asyncio.ensure_future(self._canales[i].channel_ready()): i for i in indices}
+        listos, pendientes = await asyncio.wait(esperas, timeout=GRPC_TIMEOUT_CONEXION, return_when=asyncio.FIRST_COMPLETED)
+        for espera in pendientes:
+            espera.cancel()
+        if not listos:
+            raise GrpcNoDisponible(f"No se pudo conectar con el servidor gRPC en {self.destino}")
+        return self._stubs[esperas[listos.pop()]]
+
+    def estado(self):
+        return {
+            "destino": self.destino,
+            "canales": [canal.get_state().name for canal in self._canales],
+        }
+
+    async def cerrar(self):
+        canales, self._canales, self._stubs = self._canales, [], []
+        for canal in canales:
+            await canal.close()
+
+
+canales_grpc = PoolCanales()
@@ -3,69 +3,241 @@ import os
 # Añadir la raíz del proyecto al path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import asyncio
+import logging
+import signal
+import threading
 import grpc
+from collections import deque
 from concurrent import futures
 import app.proto.fraud_detection_pb2 as fraud_detection_pb2
 import app.proto.fraud_detection_pb2_grpc as fraud_detection_pb2_grpc
 
-# Importa las funciones del backend REST
-from app.main import transcribir_audio, analizar_con_ia
+# Capa de inferencia compartida con el backend REST (variantes bloqueantes para el pool de hilos)
+from app.core.inference import transcribir_audio_sync, analizar_con_ia_sync, transcribir_audio, analizar_con_ia, cliente
+from app.core.audio import SegmentadorVoz, SAMPLE_RATE_WHISPER, detectar_voz, resamplear
+from app.core.cache import cache_veredictos
+from app.core.sesiones import EstadoSesion
+
+# Modo del servidor: "aio" (asyncio, por defecto) o "hilos" (ThreadPoolExecutor, modo anterior)
+GRPC_MODO = os.getenv("GRPC_MODO", "aio")
+GRPC_PUERTO = int(os.getenv("GRPC_PUERTO", "50051"))
+GRPC_MAX_STREAMS = int(os.getenv("GRPC_MAX_STREAMS", "500"))        # Llamadas simultáneas antes de RESOURCE_EXHAUSTED
+GRPC_MAX_MENSAJE_MB = int(os.getenv("GRPC_MAX_MENSAJE_MB", "4"))
+GRPC_GRACIA = float(os.getenv("GRPC_GRACIA", "30"))                # Segundos para drenar streams al apagar
+GRPC_HILOS = int(os.getenv("GRPC_HILOS", "10"))
+
+OPCIONES_SERVIDOR = [
+    ("grpc.max_receive_message_length", GRPC_MAX_MENSAJE_MB * 1024 * 1024),
+    ("grpc.max_send_message_length", GRPC_MAX_MENSAJE_MB * 1024 * 1024),
+    # Con varios workers (app/grpc_supervisor.py) todos escuchan en el mismo puerto y el kernel reparte conexiones
+    ("grpc.so_reuseport", 1 if os.getenv("GRPC_REUSEPORT", "0") == "1" else 0),
+]
+
+# Contadores del proceso; el supervisor los agrega entre workers
+METRICAS = {
+    "streams_totales": 0,
+    "streams_activos": 0,
+    "segmentos_procesados": 0,
+}
+_metricas_lock = threading.Lock()
+
+
+def _sumar(clave, cantidad=1):
+    with _metricas_lock:
+        METRICAS[clave] += cantidad
+
+# Segmentos en proceso simultáneamente (transcripción + análisis) entre todos los streams del modo hilos
+SEGMENTOS_MAX_CONCURRENCIA = int(os.getenv("SEGMENTOS_MAX_CONCURRENCIA", "16"))
+_segmentos_executor = futures.ThreadPoolExecutor(max_workers=SEGMENTOS_MAX_CONCURRENCIA, thread_name_prefix="segmento")
+
 
 class FraudDetectionServicer(fraud_detection_pb2_grpc.FraudDetectionServicer):
     def StreamAudio(self, request_iterator, context):
-        # Recibe fragmentos de audio, los guarda, y responde con la transcripción y diagnóstico
-        session_id = None
-        audio_data = b""
-        for audio_chunk in request_iterator:
-            session_id = audio_chunk.session_id
-            audio_data += audio_chunk.data
-            # Aquí podrías guardar el audio a un archivo temporal y transcribirlo
-            # Por simplicidad, asumimos que el audio está completo al final del stream
-        # Guardar el audio recibido a un archivo temporal
-        temp_path = f"temp_{session_id or 'audio'}.wav"
-        with open(temp_path, "wb") as f:
-            f.write(audio_data)
-        texto = transcribir_audio(temp_path)
-        if texto is None:
-            texto = ""
-        diagnostico = analizar_con_ia(texto)
-        if diagnostico is None:
-            diagnostico = ""
-        # Devuelve el resultado al cliente, nunca None
-        yield fraud_detection_pb2.TranscriptionResult(
-            transcripcion=texto or "",
-            diagnostico=diagnostico or "",
-            riesgo=extraer_riesgo(diagnostico or "")
-        )
+        # Recibe fragmentos de audio, los corta en segmentos de voz a medida que llegan y
+        # responde con un resultado por segmento mientras el cliente sigue enviando.
+        _sumar("streams_totales")
+        _sumar("streams_activos")
+        try:
+            yield from self._stream(request_iterator)
+        finally:
+            _sumar("streams_activos", -1)
 
-def extraer_riesgo(diagnostico):
-    import re
-    import json
-    
-    # Para el nuevo formato JSON estructurado
-    if diagnostico and "Riesgo:" in diagnostico:
-        match = re.search(r"Riesgo:\s*([0-9]{1,3})/100", diagnostico)
-        if match:
-            return int(match.group(1))
-    
-    # Para respuestas no estructuradas
-    match = re.search(r"([0-9]{1,3})%", diagnostico)
-    if match:
-        return int(match.group(1))
-    match = re.search(r"Puntuación de riesgo:\s*([0-9]{1,3})", diagnostico)
-    if match:
-        return int(match.group(1))
-    
-    # Valor por defecto si no se encuentra ningún patrón
-    return 50  # Riesgo moderado como valor predeterminado
+    def _stream(self, request_iterator):
+        segmentador = SegmentadorVoz()
+        estado = EstadoSesion()
+        pendientes = deque()
+        anterior = None
+        # Se activa al lanzar o terminar un segmento y al acabar la lectura
+        aviso = threading.Event()
+        lectura = {"terminada": False, "error": None}
 
-def serve():
+        def lanzar(segmentos):
+            nonlocal anterior
+            for segmento in segmentos:
+                anterior = _segmentos_executor.submit(self._procesar_segmento, segmento, estado, anterior)
+                anterior.add_done_callback(lambda _: aviso.set())
+                pendientes.append(anterior)
+                aviso.set()
+
+        def leer():
+            try:
+                for audio_chunk in request_iterator:
+                    lanzar(segmentador.agregar(audio_chunk.data))
+                lanzar(segmentador.cerrar())
+            except Exception as e:
+                lectura["error"] = e
+            finally:
+                lectura["terminada"] = True
+                aviso.set()
+
+        # El audio se lee en otro hilo: cada resultado sale en cuanto su segmento termina,
+        # aunque el cliente no envíe más fragmentos
+        threading.Thread(target=leer, daemon=True, name="lector-stream").start()
+        enviados = 0
+        while True:
+            aviso.clear()
+            # Devolver en orden los segmentos que ya terminaron, sin esperar a los demás
+            while pendientes and pendientes[0].done():
+                resultado = _resultado_segmento_terminado(pendientes.popleft())
+                if resultado is not None:
+                    enviados += 1
+                    yield resultado
+            if lectura["terminada"] and not pendientes:
+                break
+            aviso.wait()
+        if lectura["error"] is not None:
+            raise lectura["error"]
+        if not enviados:
+            # Stream sin voz: se responde igualmente para que el cliente no quede sin resultado
+            yield fraud_detection_pb2.TranscriptionResult(transcripcion="", diagnostico="", riesgo=0)
+
+    @staticmethod
+    def _procesar_segmento(segmento, estado, anterior):
+        texto = transcribir_audio_sync(segmento) or ""
+        # Las transcripciones corren en paralelo, pero el estado de la sesión se actualiza en orden;
+        # se espera al segmento anterior sin heredar su excepción
+        if anterior is not None:
+            futures.wait([anterior])
+        if not texto.strip() or texto.startswith("Error"):
+            return None
+        estado.agregar(texto)
+        if estado.requiere_analisis():
+            estado.registrar_veredicto(analizar_con_ia_sync(estado.ventana()))
+        return _resultado_segmento(texto, estado)
+
+
+class AsyncFraudDetectionServicer(fraud_detection_pb2_grpc.FraudDetectionServicer):
+    """Misma lógica que ``FraudDetectionServicer`` sobre asyncio: cada stream es una
+    corrutina y los segmentos se procesan como tareas, sin ocupar un hilo por llamada."""
+
+    async def StreamAudio(self, request_iterator, context):
+        _sumar("streams_totales")
+        _sumar("streams_activos")
+        segmentador = SegmentadorVoz()
+        estado = EstadoSesion()
+        pendientes = deque()
+        anterior = None
+        aviso = asyncio.Event()
+
+        def lanzar(segmentos):
+            nonlocal anterior
+            for segmento in segmentos:
+                anterior = asyncio.ensure_future(self._procesar_segmento(segmento, estado, anterior))
+                anterior.add_done_callback(lambda _: aviso.set())
+                pendientes.append(anterior)
+                aviso.set()
+
+        async def leer():
+            async for audio_chunk in request_iterator:
+                lanzar(segmentador.agregar(audio_chunk.data))
+            lanzar(segmentador.cerrar())
+
+        # La lectura va en su propia tarea: cada resultado sale en cuanto su segmento termina
+        lector = asyncio.ensure_future(leer())
+        lector.add_done_callback(lambda _: aviso.set())
+        enviados = 0
+        try:
+            while True:
+                aviso.clear()
+                while pendientes and pendientes[0].done():
+                    resultado = _resultado_segmento_terminado(pendientes.popleft())
+                    if resultado is not None:
+                        enviados += 1
+                        yield resultado
+                if lector.done() and not pendientes:
+                    break
+                await aviso.wait()
+            lector.result()
+            if not enviados:
+                yield fraud_detection_pb2.TranscriptionResult(transcripcion="", diagnostico="", riesgo=0)
+        finally:
+            _sumar("streams_activos", -1)
+            # Si el cliente cancela, no seguir leyendo ni transcribiendo segmentos que nadie va a leer
+            lector.cancel()
+            for tarea in pendientes:
+                tarea.cancel()
+
+    @staticmethod
+    async def _procesar_segmento(segmento, estado, anterior):
+        texto = await transcribir_audio(segmento) or ""
+        # En orden con el segmento anterior, pero sin heredar su excepción (como /ws/analizar-audio)
+        if anterior is not None:
+            await asyncio.wait([anterior])
+        if not texto.strip() or texto.startswith("Error"):
+            return None
+        estado.agregar(texto)
+        if estado.requiere_analisis():
+            estado.registrar_veredicto(await analizar_con_ia(estado.ventana()))
+        return _resultado_segmento(texto, estado)
+
+
+def _resultado_segmento_terminado(futuro):
+    """Resultado de un segmento ya terminado; si falló se registra y se omite sin cortar el stream."""
+    error = futuro.exception()
+    if error is not None:
+        logging.error("Error procesando un segmento del stream de audio", exc_info=error)
+        return None
+    return futuro.result()
+
+
+def _resultado_segmento(texto, estado):
+    _sumar("segmentos_procesados")
+    veredicto = estado.veredicto
+    riesgo = veredicto.riesgo if veredicto is not None else None
+    # Devuelve el resultado al cliente, nunca None; sin riesgo conocido se envía 0 como en los streams sin voz
+    return fraud_detection_pb2.TranscriptionResult(
+        transcripcion=texto,
+        diagnostico=estado.ultimo_resultado or "",
+        riesgo=riesgo if riesgo is not None else 0
+    )
+
+def metricas():
+    """Instantánea de los contadores del proceso (streams y caché de veredictos)."""
+    return {**METRICAS, **{f"cache_{k}": v for k, v in cache_veredictos.stats().items()}}
+
+
+def calentar():
+    """Deja listo el proceso antes de aceptar tráfico: cliente de OpenAI, filtros de remuestreo y VAD."""
+    import numpy as np
+    cliente()
+    for sample_rate in (8000, 22050, 44100, 48000):
+        muestras = np.zeros(sample_rate // 10, dtype=np.float32)
+        detectar_voz(resamplear(muestras, sample_rate), SAMPLE_RATE_WHISPER)
+
+
+def serve_hilos():
     try:
-        server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+        server = grpc.server(
+            futures.ThreadPoolExecutor(max_workers=GRPC_HILOS),
+            maximum_concurrent_rpcs=GRPC_MAX_STREAMS,
+            options=OPCIONES_SERVIDOR
+        )
         fraud_detection_pb2_grpc.add_FraudDetectionServicer_to_server(FraudDetectionServicer(), server)
-        server.add_insecure_port('[::]:50051')
+        server.add_insecure_port(f'[::]:{GRPC_PUERTO}')
         server.start()
-        print("gRPC server running on port 50051...")
+        signal.signal(signal.SIGTERM, lambda *_: server.stop(GRPC_GRACIA))
+        print(f"gRPC server running on port {GRPC_PUERTO} (modo hilos)...")
         print("Presiona Ctrl+C para terminar el servidor")
         server.wait_for_termination()
     except KeyboardInterrupt:
@@ -73,5 +245,35 @@ def serve():
     except Exception as e:
         print(f"Error en el servidor gRPC: {e}")
 
+
+async def serve_aio():
+    server = grpc.aio.server(maximum_concurrent_rpcs=GRPC_MAX_STREAMS, options=OPCIONES_SERVIDOR)
+    fraud_detection_pb2_grpc.add_FraudDetectionServicer_to_server(AsyncFraudDetectionServicer(), server)
+    server.add_insecure_port(f'[::]:{GRPC_PUERTO}')
+    await server.start()
+    parada = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(senal, parada.set)
+    print(f"gRPC server running on port {GRPC_PUERTO} (modo aio)...")
+    print("Presiona Ctrl+C para terminar el servidor")
+    await parada.wait()
+    # Drenado: no se aceptan llamadas nuevas y las activas tienen GRPC_GRACIA segundos para terminar
+    print(f"\nDeteniendo servidor gRPC (gracia de {GRPC_GRACIA:.0f}s)...")
+    await server.stop(GRPC_GRACIA)
+    print("Servidor gRPC detenido")
+
+
+def serve():
+    # El puerto se abre sin esperar al SDK de OpenAI; se importa en segundo plano mientras tanto
+    threading.Thread(target=cliente, daemon=True, name="precarga-openai").start()
+    if GRPC_MODO == "hilos":
+        serve_hilos()
+    else:
+        try:
+            asyncio.run(serve_aio())
+        except Exception as e:
+            print(f"Error en el servidor gRPC: {e}")
+
 if __name__ == '__main__':
     serve()
@@ -0,0 +1,218 @@
+"""Supervisor del servicio gRPC: N procesos worker compartiendo el mismo puerto.
+
+Ejecuta con python app/grpc_supervisor.py
+
+Cada worker es un proceso independiente (sin GIL compartido) que abre el puerto
+con SO_REUSEPORT, así que el kernel reparte las conexiones entre ellos y el
+preprocesado de audio y la serialización escalan con los núcleos. El supervisor
+anota cuándo termina el calentamiento de cada worker, reinicia los que se caen y
+publica en ``GRPC_METRICAS_PUERTO`` las métricas de todos los workers agregadas:
+en JSON en ``/metricas`` y en formato Prometheus en ``/metrics``.
+"""
+import sys
+import os
+# Añadir la raíz del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.core import metricas as registro_metricas
+
+GRPC_WORKERS = int(os.getenv("GRPC_WORKERS", str(os.cpu_count() or 1)))
+GRPC_METRICAS_PUERTO = int(os.getenv("GRPC_METRICAS_PUERTO", "9100"))
+GRPC_METRICAS_INTERVALO = float(os.getenv("GRPC_METRICAS_INTERVALO", "5"))
+GRPC_GRACIA = float(os.getenv("GRPC_GRACIA", "30"))
+TIMEOUT_CALENTAMIENTO = 60
+REINICIO_MAX_ESPERA = 30
+
+# gRPC no tolera bien fork() después de haberse inicializado: los workers arrancan con spawn
+_ctx = multiprocessing.get_context("spawn")
+
+
+def _worker(indice, listo, cola_metricas):
+    os.environ["GRPC_REUSEPORT"] = "1"
+    from app import grpc_server
+
+    grpc_server.calentar()
+
+    def reportar():
+        while True:
+            try:
+                cola_metricas.put_nowait((indice, os.getpid(), grpc_server.metricas(), registro_metricas.instantanea()))
+            except queue.Full:
+                pass
+            time.sleep(GRPC_METRICAS_INTERVALO)
+
+    threading.Thread(target=reportar, daemon=True, name="metricas").start()
+    listo.set()
+    grpc_server.serve()
+
+
+def agregar_metricas(por_worker):
+    """Suma los contadores enteros de todos los workers (los ratios no se pueden sumar)."""
+    total = {}
+    for metricas in por_worker.values():
+        for clave, valor in metricas.items():
+            if isinstance(valor, int) and not isinstance(valor, bool):
+                total[clave] = total.get(clave, 0) + valor
+    return total
+
+
+class Supervisor:
+    def __init__(self, workers=GRPC_WORKERS):
+        self.workers = workers
+        self.procesos = {}       # indice -> (proceso, inicio, evento de calentamiento terminado)
+        self.listos = set()
+        self.lentos = set()      # Avisados por no terminar el calentamiento en TIMEOUT_CALENTAMIENTO
+        self.reinicios = {}
+        self.reinicio_en = {}    # indice -> momento en que toca relanzar un worker caído
+        self.metricas = {}
+        self.histogramas = {}    # Instantáneas de app/core/metricas.py por worker
+        self.cola_metricas = _ctx.Queue(maxsize=1000)
+        self.deteniendo = threading.Event()
+        # El bucle principal y cada petición al servidor de métricas (un hilo por petición)
+        # leen y modifican procesos, listos, reinicios, metricas e histogramas
+        self._lock = threading.Lock()
+
+    def arrancar(self, indice):
+        """Lanza el worker sin esperar a su calentamiento; ``vigilar`` anota cuándo queda listo."""
+        listo = _ctx.Event()
+        proceso = _ctx.Process(target=_worker, args=(indice, listo, self.cola_metricas), name=f"grpc-worker-{indice}")
+        proceso.start()
+        with self._lock:
+            self.procesos[indice] = (proceso, time.monotonic(), listo)
+
+    def vigilar(self):
+        """Una pasada sin bloquear: un worker lento o caído no retrasa a los demás ni a la parada."""
+        ahora = time.monotonic()
+        with self._lock:
+            procesos = list(self.procesos.items())
+        for indice, (proceso, inicio, listo) in procesos:
+            if self.deteniendo.is_set():
+                return
+            if indice in self.reinicio_en:
+                if ahora >= self.reinicio_en[indice]:
+                    del self.reinicio_en[indice]
+                    self.arrancar(indice)
+                continue
+            if proceso.is_alive():
+                if indice not in self.listos and listo.is_set():
+                    with self._lock:
+                        self.listos.add(indice)
+                    print(f"[supervisor] worker {indice} listo (pid {proceso.pid})")
+                elif indice not in self.listos | self.lentos and ahora - inicio > TIMEOUT_CALENTAMIENTO:
+                    self.lentos.add(indice)
+                    print(f"[supervisor] worker {indice} (pid {proceso.pid}) no terminó el calentamiento a tiempo")
+                continue
+            # Si el worker se cae nada más arrancar, esperar cada vez más antes de reintentar
+            fallos = self.reinicios.get(indice, 0) + 1 if ahora - inicio < 60 else 1
+            with self._lock:
+                self.listos.discard(indice)
+                self.metricas.pop(indice, None)
+                self.histogramas.pop(indice, None)
+                self.reinicios[indice] = fallos
+            self.lentos.discard(indice)
+            espera = min(REINICIO_MAX_ESPERA, 2 ** (fallos - 1) - 1)
+            print(f"[supervisor] worker {indice} terminó con código {proceso.exitcode}; reinicio en {espera}s")
+            self.reinicio_en[indice] = ahora + espera
+
+    def recoger_metricas(self):
+        with self._lock:
+            while True:
+                try:
+                    indice, pid, metricas, instantanea = self.cola_metricas.get_nowait()
+                except queue.Empty:
+                    return
+                self.metricas[indice] = {"pid": pid, **metricas}
+                self.histogramas[indice] = instantanea
+
+    def resumen(self):
+        self.recoger_metricas()
+        # Copia bajo el lock: la respuesta se serializa sin tocar los dicts que cambia el bucle principal
+        with self._lock:
+            procesos = [proceso for proceso, _, _ in self.procesos.values()]
+            por_worker = {indice: dict(metricas) for indice, metricas in self.metricas.items()}
+            listos, reinicios = len(self.listos), sum(self.reinicios.values())
+        return {
+            "workers": len(procesos),
+            "vivos": sum(1 for proceso in procesos if proceso.is_alive()),
+            "listos": listos,
+            "reinicios": reinicios,
+            "total": agregar_metricas({i: {k: v for k, v in m.items() if k != "pid"} for i, m in por_worker.items()}),
+            "por_worker": por_worker,
+        }
+
+    def prometheus(self):
+        """Texto Prometheus con las series de todos los workers sumadas y los contadores del servicio."""
+        resumen = self.resumen()
+        with self._lock:
+            histogramas = list(self.histogramas.values())
+        datos = registro_metricas.combinar(histogramas)
+        contadores = {"workers_vivos": resumen["vivos"], "workers_listos": resumen["listos"], "reinicios": resumen["reinicios"], **resumen["total"]}
+        for clave, valor in contadores.items():
+            datos[f"{registro_metricas.PREFIJO}grpc_{clave}"] = {
+                "tipo": "untyped", "ayuda": f"gRPC: {clave}", "etiquetas": (), "series": {(): valor},
+            }
+        return registro_metricas.formatear(datos)
+
+    def detener(self, *_):
+        self.deteniendo.set()
+
+    def ejecutar(self):
+        signal.signal(signal.SIGTERM, self.detener)
+        signal.signal(signal.SIGINT, self.detener)
+        for indice in range(self.workers):
+            self.arrancar(indice)
+        servidor_metricas = _servidor_metricas(self)
+        print(f"[supervisor] {self.workers} workers gRPC; métricas en http://0.0.0.0:{GRPC_METRICAS_PUERTO}/metricas y /metrics")
+        # Calentamientos, caídas y reinicios se atienden en el mismo bucle: SIGTERM nunca espera a un worker
+        while not self.deteniendo.wait(1):
+            self.vigilar()
+            self.recoger_metricas()
+        # Drenado: cada worker recibe SIGTERM y termina sus streams dentro de la gracia
+        print("[supervisor] deteniendo workers...")
+        for proceso, _, _ in self.procesos.values():
+            if proceso.is_alive():
+                proceso.terminate()
+        limite = time.monotonic() + GRPC_GRACIA + 5
+        for proceso, _, _ in self.procesos.values():
+            proceso.join(max(0, limite - time.monotonic()))
+            if proceso.is_alive():
+                proceso.kill()
+        servidor_metricas.shutdown()
+        print("[supervisor] detenido")
+
+
+def _servidor_metricas(supervisor):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            ruta = self.path.rstrip("/")
+            if ruta == "/metrics":
+                cuerpo, tipo = supervisor.prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+            elif ruta in ("", "/metricas"):
+                cuerpo, tipo = json.dumps(supervisor.resumen()).encode("utf-8"), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("0.0.0.0", GRPC_METRICAS_PUERTO), Handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="metricas-http").start()
+    return servidor
+
+
+if __name__ == '__main__':
+    Supervisor().ejecutar()
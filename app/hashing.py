@@ -0,0 +1,124 @@
+"""Hash y verificación de contraseñas fuera del event loop.
+
+bcrypt consume ~200-300 ms de CPU por llamada y, ejecutado dentro de un handler
+async, congela el resto de peticiones del worker. Aquí se ejecuta en un pool de
+procesos acotado (``HASH_PROCESOS``). Si hay más de ``HASH_MAX_COLA`` operaciones
+pendientes se rechazan con ``HashingSaturado``, que indica cuántos segundos
+esperar según el ritmo al que el pool está despachando.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.context import CryptContext
+
+from app.core.metricas import medir, Indicador
+
+HASH_PROCESOS = int(os.getenv("HASH_PROCESOS", str(min(2, os.cpu_count() or 1))))
+HASH_MAX_COLA = int(os.getenv("HASH_MAX_COLA", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashingSaturado(Exception):
+    """Hay demasiadas operaciones de hash pendientes; ``reintentar_en`` son segundos sugeridos."""
+
+    def __init__(self, reintentar_en):
+        super().__init__("Demasiadas operaciones de autenticación en curso")
+        self.reintentar_en = reintentar_en
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verificar(password, hashed_password):
+    return pwd_context.verify(password, hashed_password)
+
+
+def _medido(funcion, *args):
+    # Se ejecuta en el proceso hijo: devuelve también el tiempo de servicio, sin la espera en cola
+    inicio = time.perf_counter()
+    return funcion(*args), time.perf_counter() - inicio
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pendientes = 0
+# Media móvil del tiempo de servicio de cada operación, para estimar la espera en cola
+_duracion_media = 0.25
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: los procesos hijos no heredan el event loop ni los hilos del servidor
+                _executor = ProcessPoolExecutor(max_workers=HASH_PROCESOS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def _descartar_pool(roto):
+    global _executor
+    with _executor_lock:
+        if _executor is roto:
+            _executor = None
+    roto.shutdown(wait=False, cancel_futures=True)
+
+
+def estimar_espera():
+    """Segundos que tardaría en despacharse una operación encolada ahora."""
+    return _pendientes * _duracion_media / HASH_PROCESOS
+
+
+async def _ejecutar(funcion, *args):
+    global _pendientes, _duracion_media
+    if _pendientes >= HASH_MAX_COLA:
+        raise HashingSaturado(max(1, round(estimar_espera())))
+    _pendientes += 1
+    loop = asyncio.get_running_loop()
+    try:
+        pool = _pool()
+        # Incluye la espera en la cola del pool, que es lo que nota el cliente
+        with medir("hash"):
+            try:
+                resultado, duracion = await loop.run_in_executor(pool, _medido, funcion, *args)
+            except BrokenProcessPool:
+                # Un proceso hijo murió (OOM, kill): el pool queda inservible, se recrea y se reintenta una vez
+                _descartar_pool(pool)
+                resultado, duracion = await loop.run_in_executor(_pool(), _medido, funcion, *args)
+    finally:
+        _pendientes -= 1
+    _duracion_media = 0.9 * _duracion_media + 0.1 * duracion
+    return resultado
+
+
+async def hash_password(password):
+    return await _ejecutar(_hash, password)
+
+
+async def verificar_password(password, hashed_password):
+    return await _ejecutar(_verificar, password, hashed_password)
+
+
+def iniciar():
+    """Arranca los procesos del pool sin esperar, para que el primer login no pague su creación."""
+    for _ in range(HASH_PROCESOS):
+        _pool().submit(int)
+
+
+def estado():
+    return {"procesos": HASH_PROCESOS, "pendientes": _pendientes, "max_cola": HASH_MAX_COLA, "espera_estimada": round(estimar_espera(), 3)}
+
+
+def cerrar():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+
+Indicador("hash_pendientes", "Operaciones de hash de contraseñas en cola o en curso", funcion=lambda: {(): _pendientes})
@@ -1,27 +1,40 @@
-from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException, Depends, status
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Response, UploadFile, File, Form, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import func, tuple_
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from typing import List
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+import asyncio
+import base64
+import json
 import os
+import uuid
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 
-from app.database import get_db
-from app import models, schemas
+from app.database import get_db, metricas_pool, SessionLocal
+from app import models, schemas, analitica
+from app.auth import Principal, cache_principales
+from app.escritura import escritor_analisis
+from app.subidas import abrir_wav, LimitarSubidas
+from app.hashing import hash_password, verificar_password, HashingSaturado, estado as estado_hashing, iniciar as iniciar_hashing, cerrar as cerrar_hashing
 
 import grpc
 import app.proto.fraud_detection_pb2 as fraud_detection_pb2
-import app.proto.fraud_detection_pb2_grpc as fraud_detection_pb2_grpc
-import speech_recognition as sr
-from openai import OpenAI
-from pydub import AudioSegment
+from app.grpc_pool import canales_grpc, GrpcNoDisponible, GRPC_CHUNK_BYTES, GRPC_DEADLINE
+from app.core.inference import transcribir_audio, analizar_con_ia, analizar_lote, cerrar as cerrar_inferencia
+from app.core.transcripcion import transcribir_por_segmentos
+from app.core.veredicto import Veredicto, Diagnostico
+from app.core.cache import cache_veredictos
+from app.core.preclasificador import preclasificador
+from app.core import metricas
+from app.core.sesiones import sesiones
+from app.core.audio import SegmentadorVoz, SAMPLE_RATE_WHISPER
 
 # Cargar variables de entorno desde .env automáticamente
 load_dotenv()
@@ -31,8 +44,14 @@ app = FastAPI(title="FraudWatch AI Service", description="API y gRPC para la det
 # Montar carpeta frontend como estáticos
 app.mount("/static", StaticFiles(directory="frontend", html=True), name="static")
 
-# Configura tu API Key aquí (mejor usar variable de entorno en producción)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
+# El último middleware añadido es el más externo: CORS va al final para que también las
+# respuestas que generan los demás (p. ej. el 413 de LimitarSubidas) lleven sus cabeceras
+
+# Subidas de audio demasiado grandes: 413 antes de leer el cuerpo
+app.add_middleware(LimitarSubidas)
+
+# Duración por ruta y peticiones en curso para GET /metrics
+app.add_middleware(metricas.MedirPeticiones)
 
 app.add_middleware(
     CORSMiddleware,
@@ -40,6 +59,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Siguiente-Cursor"],
 )
 
 # --- Seguridad y JWT ---
@@ -47,21 +67,19 @@ SECRET_KEY = os.getenv("SECRET_KEY", "cambia_esto_en_produccion")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
 # Utilidades de autenticación
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def servicio_saturado(e: HashingSaturado):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.reintentar_en)})
 
 async def authenticate_user(db: AsyncSession, username: str, password: str):
     result = await db.execute(select(models.Usuario).where(models.Usuario.username == username))
     user = result.scalars().first()
-    if user and verify_password(password, user.hashed_password):
+    # Cerrar la transacción de lectura para no retener una conexión del pool mientras se verifica bcrypt
+    await db.commit()
+    if user and await verificar_password(password, user.hashed_password):
         return user
     return None
 
@@ -72,6 +90,10 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    with metricas.medir("auth"):
+        return await principal_desde_token(token, db)
+
+async def principal_desde_token(token, db):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No autorizado",
@@ -80,15 +102,28 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
+        usuario_id = payload.get("uid")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    result = await db.execute(select(models.Usuario).where(models.Usuario.username == username))
-    user = result.scalars().first()
-    if user is None:
+    # Camino habitual: el token lleva el id y el principal está en caché, sin consultar la base de datos
+    principal = cache_principales.get(usuario_id) if usuario_id is not None else None
+    if principal is None:
+        if usuario_id is not None:
+            consulta = select(models.Usuario).where(models.Usuario.id == usuario_id)
+        else:
+            # Tokens emitidos antes de incluir el claim uid
+            consulta = select(models.Usuario).where(models.Usuario.username == username)
+        result = await db.execute(consulta)
+        user = result.scalars().first()
+        if user is None:
+            raise credentials_exception
+        principal = Principal.desde_usuario(user)
+        cache_principales.set(principal.id, principal)
+    if principal.username != username:
         raise credentials_exception
-    return user
+    return principal
 
 # --- Endpoints de autenticación ---
 
@@ -98,7 +133,11 @@ async def register(user_in: schemas.UsuarioCreate, db: AsyncSession = Depends(ge
     existing_user = result.scalars().first()
     if existing_user:
         raise HTTPException(status_code=400, detail="El usuario o email ya existe")
-    hashed_pw = get_password_hash(user_in.password)
+    await db.commit()
+    try:
+        hashed_pw = await hash_password(user_in.password)
+    except HashingSaturado as e:
+        raise servicio_saturado(e)
     user = models.Usuario(username=user_in.username, email=user_in.email, hashed_password=hashed_pw)
     db.add(user)
     await db.commit()
@@ -107,43 +146,218 @@ async def register(user_in: schemas.UsuarioCreate, db: AsyncSession = Depends(ge
 
 @app.post("/login", response_model=schemas.Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
-    user = await authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except HashingSaturado as e:
+        raise servicio_saturado(e)
     if not user:
         raise HTTPException(status_code=400, detail="Credenciales incorrectas")
-    access_token = create_access_token(data={"sub": user.username}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    access_token = create_access_token(data={"sub": user.username, "uid": user.id}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     return {"access_token": access_token, "token_type": "bearer"}
 
 # --- Endpoints de análisis asociados al usuario ---
 
+def _campos_agregado(analisis):
+    return {campo: getattr(analisis, campo) for campo in ("usuario_id", "fecha", "origen", "diagnostico", "riesgo")}
+
 @app.post("/analisis", response_model=schemas.AnalisisOut)
-async def crear_analisis(analisis_in: schemas.AnalisisCreate, db: AsyncSession = Depends(get_db), current_user: models.Usuario = Depends(get_current_user)):
+async def crear_analisis(analisis_in: schemas.AnalisisCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    veredicto = Veredicto(analisis_in.diagnostico, analisis_in.riesgo, analisis_in.explicacion)
+    if analisis_in.diagnostico is None and analisis_in.riesgo is None:
+        veredicto = Veredicto.desde_texto(analisis_in.resultado)
     analisis = models.Analisis(
         usuario_id=current_user.id,
         texto_analizado=analisis_in.texto_analizado,
         resultado=analisis_in.resultado,
-        session_id=analisis_in.session_id
+        **veredicto.a_dict(),
+        session_id=analisis_in.session_id,
+        origen=analisis_in.origen,
+        fecha=datetime.utcnow()
     )
     db.add(analisis)
+    await analitica.registrar(db, [_campos_agregado(analisis)])
     await db.commit()
     await db.refresh(analisis)
     return analisis
 
 import logging
 
+logger = logging.getLogger(__name__)
+
+HISTORIAL_LIMITE_MAX = 200
+RESUMEN_CARACTERES = 200
+
+
+def codificar_cursor(fecha, analisis_id):
+    return base64.urlsafe_b64encode(f"{fecha.isoformat()}|{analisis_id}".encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        fecha, analisis_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(fecha), int(analisis_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
 @app.get("/analisis", response_model=List[schemas.AnalisisOut])
-async def obtener_analisis(db: AsyncSession = Depends(get_db), current_user: models.Usuario = Depends(get_current_user)):
+async def obtener_analisis(
+    response: Response,
+    limite: int = Query(50, ge=1, le=HISTORIAL_LIMITE_MAX),
+    cursor: Optional[str] = Query(None, description="Valor de la cabecera X-Siguiente-Cursor de la página anterior"),
+    campos: str = Query("completo", pattern="^(completo|resumen)$", description="resumen: texto_analizado recortado"),
+    session_id: Optional[str] = None,
+    origen: Optional[str] = None,
+    diagnostico: Optional[Diagnostico] = None,
+    riesgo_min: Optional[int] = Query(None, ge=0, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Historial del usuario, del más reciente al más antiguo, paginado por cursor sobre (fecha, id).
+
+    Cada página cuesta lo mismo sin importar la longitud del historial: se recorre el índice
+    ``ix_analisis_usuario_fecha_id`` desde el cursor. Si hay más resultados, la respuesta
+    incluye la cabecera ``X-Siguiente-Cursor``.
+    """
+    A = models.Analisis
+    texto = A.texto_analizado if campos == "completo" else func.substr(A.texto_analizado, 1, RESUMEN_CARACTERES)
+    consulta = (
+        select(A.id, texto.label("texto_analizado"), A.resultado, A.diagnostico, A.riesgo, A.explicacion,
+               A.session_id, A.origen, A.fecha)
+        .where(A.usuario_id == current_user.id)
+        .order_by(A.fecha.desc(), A.id.desc())
+        .limit(limite + 1)
+    )
+    if cursor:
+        consulta = consulta.where(tuple_(A.fecha, A.id) < decodificar_cursor(cursor))
+    if session_id is not None:
+        consulta = consulta.where(A.session_id == session_id)
+    if origen is not None:
+        consulta = consulta.where(A.origen == origen)
+    if diagnostico is not None:
+        consulta = consulta.where(A.diagnostico == diagnostico.value)
+    if riesgo_min is not None:
+        consulta = consulta.where(A.riesgo >= riesgo_min)
+    # Que el historial incluya los análisis del usuario que aún están en la cola de escritura
+    await escritor_analisis.esperar_usuario(current_user.id)
     try:
-        result = await db.execute(
-            select(models.Analisis)
-            .where(models.Analisis.usuario_id == current_user.id)
-            .order_by(models.Analisis.fecha.desc())
-        )
-        analisis = result.scalars().all()
-        return analisis
+        filas = (await db.execute(consulta)).mappings().all()
     except Exception as e:
         logging.exception("Error al obtener el historial de análisis")
-        # Opcional: puedes devolver el error para depuración
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    if len(filas) > limite:
+        filas = filas[:limite]
+        response.headers["X-Siguiente-Cursor"] = codificar_cursor(filas[-1]["fecha"], filas[-1]["id"])
+    return filas
+
+@app.get("/sesiones", response_model=List[schemas.SesionOut], tags=["Análisis"])
+async def obtener_sesiones(
+    response: Response,
+    limite: int = Query(50, ge=1, le=HISTORIAL_LIMITE_MAX),
+    cursor: Optional[str] = Query(None, description="Valor de la cabecera X-Siguiente-Cursor de la página anterior"),
+    campos: str = Query("completo", pattern="^(completo|resumen)$", description="resumen: transcripción recortada"),
+    origen: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Llamadas en vivo del usuario (una entrada por sesión), de la más reciente a la más antigua.
+
+    Se pagina igual que GET /analisis, con el cursor sobre (fecha_actualizacion, id).
+    """
+    S = models.Sesion
+    transcripcion = S.transcripcion if campos == "completo" else func.substr(S.transcripcion, 1, RESUMEN_CARACTERES)
+    consulta = (
+        select(S.id, S.session_id, S.origen, transcripcion.label("transcripcion"), S.ultimo_resultado,
+               S.diagnostico, S.riesgo, S.explicacion, S.riesgo_max, S.fragmentos, S.fecha_inicio, S.fecha_actualizacion)
+        .where(S.usuario_id == current_user.id)
+        .order_by(S.fecha_actualizacion.desc(), S.id.desc())
+        .limit(limite + 1)
+    )
+    if cursor:
+        consulta = consulta.where(tuple_(S.fecha_actualizacion, S.id) < decodificar_cursor(cursor))
+    if origen is not None:
+        consulta = consulta.where(S.origen == origen)
+    await escritor_analisis.esperar_usuario(current_user.id)
+    filas = (await db.execute(consulta)).mappings().all()
+    if len(filas) > limite:
+        filas = filas[:limite]
+        response.headers["X-Siguiente-Cursor"] = codificar_cursor(filas[-1]["fecha_actualizacion"], filas[-1]["id"])
+    return filas
+
+@app.delete("/sesiones/{session_id}", status_code=204, tags=["Análisis"])
+async def eliminar_sesion(session_id: str, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
+    await escritor_analisis.esperar_usuario(current_user.id)
+    result = await db.execute(select(models.Sesion).where(models.Sesion.usuario_id == current_user.id, models.Sesion.session_id == session_id))
+    sesion = result.scalars().first()
+    if not sesion:
+        raise HTTPException(status_code=404, detail="Sesión no encontrada o no autorizada")
+    await db.delete(sesion)
+    aporte = analitica.aporte_sesion({campo: getattr(sesion, campo) for campo in ("usuario_id", "fecha_inicio", "origen", "diagnostico", "riesgo")})
+    if aporte is not None:
+        await analitica.registrar(db, [aporte], signo=-1)
+    await db.commit()
+    sesiones.cerrar(current_user.id, session_id)
+    return None
+
+# --- Estadísticas de riesgo agregadas en SQL (ver app/analitica.py) ---
+
+def _ventana_estadisticas(desde, hasta):
+    try:
+        return analitica.ventana(desde, hasta)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/estadisticas/resumen", response_model=schemas.EstadisticasResumen, tags=["Estadísticas"])
+async def estadisticas_resumen(
+    desde: Optional[date] = Query(None, description="Primer día (por defecto, hace ANALITICA_DIAS días)"),
+    hasta: Optional[date] = Query(None, description="Último día incluido (por defecto, hoy)"),
+    origen: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Total de análisis, conteo por diagnóstico y riesgo medio del usuario en el intervalo."""
+    desde, hasta = _ventana_estadisticas(desde, hasta)
+    await escritor_analisis.esperar_usuario(current_user.id)
+    return await analitica.resumen(db, current_user.id, desde, hasta, origen)
+
+@app.get("/estadisticas/riesgo", response_model=schemas.EstadisticasRiesgo, tags=["Estadísticas"])
+async def estadisticas_riesgo(
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    origen: Optional[str] = None,
+    diagnostico: Optional[Diagnostico] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Histograma del riesgo en tramos de 10 puntos."""
+    desde, hasta = _ventana_estadisticas(desde, hasta)
+    await escritor_analisis.esperar_usuario(current_user.id)
+    return await analitica.histograma(db, current_user.id, desde, hasta, origen, diagnostico.value if diagnostico else None)
+
+@app.get("/estadisticas/tendencia", response_model=List[schemas.PuntoTendencia], tags=["Estadísticas"])
+async def estadisticas_tendencia(
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    origen: Optional[str] = None,
+    por_origen: bool = Query(False, description="Una serie por origen en lugar de una sola por día"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Análisis, estafas y riesgo medio por día (y por origen si se pide); los días sin análisis no aparecen."""
+    desde, hasta = _ventana_estadisticas(desde, hasta)
+    await escritor_analisis.esperar_usuario(current_user.id)
+    return await analitica.tendencia(db, current_user.id, desde, hasta, origen, por_origen)
+
+@app.get("/estadisticas/sesiones", response_model=List[schemas.SesionRiesgo], tags=["Estadísticas"])
+async def estadisticas_sesiones(
+    limite: int = Query(10, ge=1, le=100),
+    desde: Optional[date] = Query(None, description="Solo sesiones activas desde este día"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """Llamadas en vivo con mayor riesgo máximo, sin la transcripción."""
+    await escritor_analisis.esperar_usuario(current_user.id)
+    return await analitica.sesiones_mas_riesgo(db, current_user.id, limite, desde)
 
 # --- FIN autenticación y endpoints de análisis ---
 
@@ -151,72 +365,28 @@ async def obtener_analisis(db: AsyncSession = Depends(get_db), current_user: mod
 from fastapi import Path
 
 @app.delete("/analisis/{analisis_id}", status_code=204, tags=["Análisis"], dependencies=[Depends(oauth2_scheme)])
-async def eliminar_analisis(analisis_id: int = Path(..., gt=0), db: AsyncSession = Depends(get_db), current_user: models.Usuario = Depends(get_current_user)):
+async def eliminar_analisis(analisis_id: int = Path(..., gt=0), db: AsyncSession = Depends(get_db), current_user: Principal = Depends(get_current_user)):
     from app.models import Analisis
+    await escritor_analisis.esperar_usuario(current_user.id)
     result = await db.execute(select(Analisis).where(Analisis.id == analisis_id, Analisis.usuario_id == current_user.id))
     analisis = result.scalars().first()
     if not analisis:
         raise HTTPException(status_code=404, detail="Análisis no encontrado o no autorizado")
     await db.delete(analisis)
+    await analitica.registrar(db, [_campos_agregado(analisis)], signo=-1)
     await db.commit()
     return None
 
 
-def transcribir_audio(audio_path):
-    try:
-        with open(audio_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="es"
-            )
-        return transcript.text
-    except Exception as e:
-        return f"Error en la transcripción con Whisper: {e}"
-
-# Puedes modificar esta función para guardar automáticamente cada análisis en la base de datos si lo deseas
-
-def analizar_con_ia(texto):
-    prompt = f"""
-Eres un analista de seguridad. Evalúa si el siguiente mensaje es potencialmente una estafa.
-Devuelve tu respuesta SOLO en este formato JSON exacto sin añadir ningún otro texto:
-{{"diagnostico": "Estafa" o "No Estafa", "explicacion": "tu explicación aquí", "riesgo": número entre 0 y 100}}
-
-Mensaje:
-{texto}
-"""
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Eres un analista de seguridad de ciberfraudes que responde solo en formato JSON estructurado."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        respuesta = response.choices[0].message.content.strip()
-        
-        # Intenta parsear como JSON
-        import json
-        try:
-            datos_json = json.loads(respuesta)
-            # Formatea la respuesta en texto legible
-            respuesta_formateada = f"Diagnóstico: {datos_json.get('diagnostico', '?')}\n\n"
-            respuesta_formateada += f"Explicación: {datos_json.get('explicacion', '?')}\n\n"
-            respuesta_formateada += f"Riesgo: {datos_json.get('riesgo', '?')}/100"
-            return respuesta_formateada
-        except json.JSONDecodeError:
-            # Si no se puede parsear como JSON, devuelve la respuesta original
-            return respuesta
-    except Exception as e:
-        return f"Error en el análisis con OpenAI: {e}"
-
 class AnalisisTextoResponse(BaseModel):
     resultado: str
+    veredicto: Optional[schemas.VeredictoOut] = None
     class Config:
         from_attributes = True
         json_schema_extra = {
             "example": {
-                "resultado": "Diagnóstico: Estafa\n\nExplicación: Este mensaje solicita datos personales...\n\nRiesgo: 90/100"
+                "resultado": "Diagnóstico: Estafa\n\nExplicación: Este mensaje solicita datos personales...\n\nRiesgo: 90/100",
+                "veredicto": {"diagnostico": "Estafa", "riesgo": 90, "explicacion": "Este mensaje solicita datos personales..."}
             }
         }
 
@@ -231,10 +401,11 @@ class TranscripcionResponse(BaseModel):
         }
 
 class AnalisisAudioStreamResponse(BaseModel):
-    session_id: str = None
+    session_id: Optional[str] = None
     transcripcion: str
-    diagnostico: str = None
-    ruta_archivo: str = None
+    diagnostico: Optional[str] = None
+    veredicto: Optional[schemas.VeredictoOut] = None
+    ruta_archivo: str = None  # Obsoleto: el audio ya no se escribe en disco
     class Config:
         from_attributes = True
         json_schema_extra = {
@@ -242,128 +413,313 @@ class AnalisisAudioStreamResponse(BaseModel):
                 "session_id": "session-123",
                 "transcripcion": "Has sido seleccionado para recibir un premio...",
                 "diagnostico": "Diagnóstico: Estafa\n\nExplicación: Este mensaje solicita datos personales...\n\nRiesgo: 90/100",
-                "ruta_archivo": "temp_stream_16k.wav"
+                "veredicto": {"diagnostico": "Estafa", "riesgo": 90, "explicacion": "Este mensaje solicita datos personales..."}
             }
         }
 
 @app.post("/analizar-texto", response_model=AnalisisTextoResponse, tags=["Análisis"])
-async def endpoint_analizar_texto(payload: dict, db: AsyncSession = Depends(get_db), current_user: models.Usuario = Depends(get_current_user)):
+async def endpoint_analizar_texto(payload: dict, current_user: Principal = Depends(get_current_user)):
     texto = payload.get("texto", "")
     session_id = payload.get("session_id")
     origen = payload.get("origen", "manual")  # Por defecto 'manual' si no viene
     if not texto:
         raise HTTPException(status_code=400, detail="Texto vacío")
-    resultado = analizar_con_ia(texto)
-    # Guardar en base de datos
-    from app.models import Analisis
-    analisis = Analisis(
+    veredicto = await analizar_con_ia(texto)
+    # Guardar en base de datos sin esperar: el escritor inserta por lotes en segundo plano
+    await escritor_analisis.encolar(
         usuario_id=current_user.id,
         texto_analizado=texto,
-        resultado=resultado,
+        **veredicto.columnas(),
         session_id=session_id,
         origen=origen
     )
-    db.add(analisis)
-    await db.commit()
-    await db.refresh(analisis)
-    return {"resultado": resultado}
+    return {"resultado": veredicto.texto, "veredicto": None if veredicto.es_error else veredicto.a_dict()}
+
+ANALISIS_LOTE_MAX = int(os.getenv("ANALISIS_LOTE_MAX", "500"))  # Mensajes por petición a /analizar-texto/batch
+
+
+class MensajeLote(BaseModel):
+    texto: str
+    id: Optional[str] = None          # Identificador del cliente; se devuelve tal cual
+    session_id: Optional[str] = None
+
+class AnalisisLoteRequest(BaseModel):
+    mensajes: List[MensajeLote] = Field(..., min_length=1, max_length=ANALISIS_LOTE_MAX)
+    origen: str = "lote"
+
+@app.post("/analizar-texto/batch", tags=["Análisis"])
+async def endpoint_analizar_texto_batch(payload: AnalisisLoteRequest, current_user: Principal = Depends(get_current_user)):
+    """
+    Analiza muchos mensajes en una petición y devuelve NDJSON: una línea por mensaje,
+    en el orden en que terminan, con ``indice`` (posición en ``mensajes``), ``id``,
+    ``resultado`` y ``veredicto``. Los repetidos se analizan una sola vez y los cortos
+    se agrupan en una misma llamada al modelo (ver ``analizar_lote``).
+    """
+    mensajes = payload.mensajes
+    posiciones = [i for i, mensaje in enumerate(mensajes) if mensaje.texto.strip()]
+
+    def linea(indice, **campos):
+        return json.dumps({"indice": indice, "id": mensajes[indice].id, **campos}, ensure_ascii=False) + "\n"
+
+    async def lineas():
+        for i, mensaje in enumerate(mensajes):
+            if not mensaje.texto.strip():
+                yield linea(i, error="Texto vacío")
+        async for n, veredicto in analizar_lote([mensajes[i].texto for i in posiciones]):
+            indice = posiciones[n]
+            await escritor_analisis.encolar(
+                usuario_id=current_user.id,
+                texto_analizado=mensajes[indice].texto,
+                **veredicto.columnas(),
+                session_id=mensajes[indice].session_id,
+                origen=payload.origen
+            )
+            yield linea(indice, resultado=veredicto.texto, veredicto=None if veredicto.es_error else veredicto.a_dict())
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson")
 
 @app.post("/transcribir-audio", response_model=TranscripcionResponse, tags=["Transcripción"], dependencies=[Depends(oauth2_scheme)])
-async def endpoint_transcribir_audio(file: UploadFile = File(...), current_user: models.Usuario = Depends(get_current_user)):
+async def endpoint_transcribir_audio(file: UploadFile = File(...), current_user: Principal = Depends(get_current_user)):
     """
     Transcribe un archivo de audio usando OpenAI Whisper.
+    El archivo se lee por bloques y se corta en las pausas; los segmentos se transcriben
+    en paralelo mientras se sigue leyendo y el texto se une en orden.
     """
-    import tempfile
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-        tmp.write(file.file.read())
-        tmp_path = tmp.name
-    transcripcion = transcribir_audio(tmp_path)
+    if not (file.filename or "").lower().endswith(".wav"):
+        raise HTTPException(status_code=400, detail="Solo se aceptan archivos .wav")
+    _, bloques = await abrir_wav(file)
+    transcripcion = await transcribir_por_segmentos(bloques)
     return {"transcripcion": transcripcion}
 
+async def restaurar_sesion(estado, usuario_id, session_id, texto_acumulado=None):
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(models.Sesion).where(models.Sesion.usuario_id == usuario_id, models.Sesion.session_id == session_id)
+        )
+        fila = result.scalars().first()
+    if fila is not None:
+        veredicto = None
+        if fila.diagnostico is not None or fila.riesgo is not None:
+            veredicto = Veredicto(fila.diagnostico, fila.riesgo, fila.explicacion)
+        estado.restaurar(fila.transcripcion, veredicto, fila.riesgo_max, fila.fragmentos)
+    elif texto_acumulado:
+        estado.agregar(texto_acumulado)
+
+async def guardar_sesion(estado, usuario_id, session_id, origen):
+    # Una fila por sesión: se actualiza con el estado acumulado en lugar de insertar cada fragmento
+    await escritor_analisis.encolar_sesion(
+        usuario_id=usuario_id,
+        session_id=session_id,
+        origen=origen,
+        transcripcion=estado.transcripcion(),
+        ultimo_resultado=estado.ultimo_resultado,
+        **(estado.veredicto.a_dict() if estado.veredicto is not None else {}),
+        riesgo_max=estado.riesgo_max,
+        fragmentos=estado.fragmentos
+    )
+
+# Frases que Whisper "oye" en el silencio o el ruido
+FRASES_IRRELEVANTES = [
+    "Subtítulos realizados por la comunidad de Amara.org",
+    "Subtitulado por la comunidad de Amara.org",
+    "¡Gracias por ver el vídeo!",
+    "No olvides suscribirte al canal",
+    "Gracias por ver",
+    "Gracias por ver el video",
+    "¡Suscríbete y activa notificaciones!"
+]
+
+def es_transcripcion_irrelevante(texto):
+    t = texto.strip()
+    return t in FRASES_IRRELEVANTES or len(t.split()) <= 3
+
 @app.post("/analizar-audio-stream", response_model=AnalisisAudioStreamResponse, tags=["Análisis"])
-async def analizar_audio_stream(file: UploadFile = File(...), session_id: str = None, texto_acumulado: str = Form(None), origen: str = Form("audio_stream"), db: AsyncSession = Depends(get_db), current_user: models.Usuario = Depends(get_current_user)):
+async def analizar_audio_stream(file: UploadFile = File(...), session_id: str = None, texto_acumulado: str = Form(None), origen: str = Form("audio_stream"), current_user: Principal = Depends(get_current_user)):
     """
     Endpoint para analizar fragmentos de audio en tiempo real.
     Recibe un fragmento de audio (wav), un session_id opcional y el texto acumulado.
+    Con session_id, el servidor acumula la transcripción y analiza de forma incremental;
+    texto_acumulado solo se usa para reconstruir una sesión que el servidor no conoce.
+    Cada sesión se guarda como una única fila en la tabla sesiones (ver GET /sesiones).
     Devuelve la transcripción y el análisis de fraude.
     """
-    # Guardar archivo temporalmente, sin importar el nombre
-    temp_path = f"temp_stream.wav"
-    with open(temp_path, "wb") as f:
-        f.write(file.file.read())
-    # Validar encabezado RIFF/WAVE
+    # El archivo no se junta en memoria: los bloques pasan por el segmentador de voz y cada
+    # segmento se convierte a 16 kHz mono y se transcribe fuera del event loop, como en
+    # /transcribir-audio. Los tramos en silencio no llegan a Whisper.
+    _, bloques = await abrir_wav(file)
     try:
-        with open(temp_path, "rb") as f:
-            header = f.read(12)
-            if not (header[:4] == b'RIFF' and header[8:12] == b'WAVE'):
-                os.remove(temp_path)
-                raise HTTPException(status_code=400, detail="El archivo no es un WAV válido.")
-    except Exception:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        texto = await transcribir_por_segmentos(bloques)
+    except ValueError:
         raise HTTPException(status_code=400, detail="No se pudo leer el archivo de audio.")
-    # Convertir a 16kHz mono para máxima compatibilidad
-    temp_path_16k = "temp_stream_16k.wav"
-    audio = AudioSegment.from_wav(temp_path)
-    audio = audio.set_frame_rate(16000).set_channels(1)
-    audio.export(temp_path_16k, format="wav")
-    # --- Detección de silencio en el backend ---
-    min_size_bytes = 2000  # Tamaño mínimo para considerar que hay voz (~0.1 seg)
-    min_rms = 10  # Energía mínima (ajustable, ahora más sensible)
-    import os
-    file_size = os.path.getsize(temp_path_16k)
-    rms = audio.rms
-    print(f"[DEBUG] Tamaño archivo recibido: {file_size} bytes | RMS: {rms}")
-    if file_size < min_size_bytes or rms < min_rms:
-        print('[DEBUG] Fragmento ignorado por silencio o archivo vacío (backend)')
+    if not texto:
         return {
             "session_id": session_id,
             "transcripcion": "",
-            "diagnostico": None,
-            "ruta_archivo": temp_path_16k
+            "diagnostico": None
         }
-    texto = transcribir_audio(temp_path_16k)
-    # Filtro de frases irrelevantes
-    FRASES_IRRELEVANTES = [
-        "Subtítulos realizados por la comunidad de Amara.org",
-        "Subtitulado por la comunidad de Amara.org",
-        "¡Gracias por ver el vídeo!",
-        "No olvides suscribirte al canal",
-        "Gracias por ver",
-        "Gracias por ver el video",
-        "¡Suscríbete y activa notificaciones!"
-    ]
-    def es_transcripcion_irrelevante(texto):
-        t = texto.strip()
-        return t in FRASES_IRRELEVANTES or len(t.split()) <= 3
     if es_transcripcion_irrelevante(texto):
-        print('[DEBUG] Transcripción irrelevante detectada, se ignora')
+        logger.debug("Transcripción irrelevante, se ignora: %r", texto)
         texto = ""
-    print(f"[DEBUG] Texto transcrito por Whisper: '{texto}'")
-    # os.remove(temp_path)  # No borrar para inspección manual
-    # os.remove(temp_path_16k)  # No borrar para inspección manual
-    # Usar el texto acumulado si existe para el análisis
-    texto_para_analizar = texto_acumulado if texto_acumulado else texto
-    resultado = analizar_con_ia(texto_para_analizar) if texto_para_analizar and 'Error' not in texto_para_analizar else None
-    # Guardar en base de datos
-    from app.models import Analisis
-    analisis = Analisis(
-        usuario_id=current_user.id,
-        texto_analizado=texto_para_analizar,
-        resultado=resultado,
-        session_id=session_id,
-        origen=origen
-    )
-    db.add(analisis)
-    await db.commit()
-    await db.refresh(analisis)
+    if session_id:
+        # El servidor mantiene el estado de la sesión: solo se reanaliza la ventana reciente
+        # cuando llega suficiente texto nuevo; si no, se reutiliza el veredicto previo.
+        estado, nueva = sesiones.obtener(current_user.id, session_id)
+        async with estado.lock:
+            if nueva:
+                # Sesión desconocida para este proceso (p. ej. tras reiniciarlo): recuperarla de la
+                # base de datos o, si no existe, partir del texto que envía el cliente
+                await restaurar_sesion(estado, current_user.id, session_id, texto_acumulado)
+            if texto and 'Error' not in texto:
+                estado.agregar(texto)
+            if estado.requiere_analisis():
+                veredicto = await analizar_con_ia(estado.ventana())
+                estado.registrar_veredicto(veredicto)
+            else:
+                veredicto = estado.veredicto
+            await guardar_sesion(estado, current_user.id, session_id, origen)
+    else:
+        # Usar el texto acumulado si existe para el análisis
+        texto_para_analizar = texto_acumulado if texto_acumulado else texto
+        analizar = bool(texto_para_analizar) and 'Error' not in texto_para_analizar
+        veredicto = await analizar_con_ia(texto_para_analizar) if analizar else None
+        if analizar:
+            # Fragmento suelto, sin sesión: se guarda como un análisis más (escritura diferida por lotes)
+            await escritor_analisis.encolar(
+                usuario_id=current_user.id,
+                texto_analizado=texto_para_analizar,
+                **veredicto.columnas(),
+                session_id=None,
+                origen=origen
+            )
     return {
         "session_id": session_id,
         "transcripcion": texto,
-        "diagnostico": resultado,
-        "ruta_archivo": temp_path_16k  # Para referencia
+        "diagnostico": veredicto.texto if veredicto is not None else None,
+        "veredicto": veredicto.a_dict() if veredicto is not None and not veredicto.es_error else None
     }
 
+WS_AUDIO_TIMEOUT_INICIO = float(os.getenv("WS_AUDIO_TIMEOUT_INICIO", "10"))  # Segundos para enviar el mensaje inicial
+WS_AUDIO_SEGMENTOS_EN_VUELO = int(os.getenv("WS_AUDIO_SEGMENTOS_EN_VUELO", "4"))  # Segmentos en proceso por conexión
+
+@app.websocket("/ws/analizar-audio")
+async def ws_analizar_audio(websocket: WebSocket):
+    """
+    Audio en vivo por WebSocket: se autentica una vez y recibe PCM de forma continua.
+    Primer mensaje (texto JSON): {"token", "session_id", "origen", "sample_rate"}.
+    Después, mensajes binarios con PCM de 16 bits mono a ese sample_rate, y {"tipo": "fin"}
+    para terminar. El audio se corta en segmentos de voz al detectar silencio y por cada
+    uno se envían los eventos {"tipo": "transcripcion"} y, si se reanaliza, {"tipo": "veredicto"}.
+    Con WS_AUDIO_SEGMENTOS_EN_VUELO segmentos en proceso se deja de leer el socket hasta que
+    termine alguno. Un mensaje de texto que no sea JSON cierra la conexión con 1003.
+    La sesión se guarda en la tabla sesiones igual que con /analizar-audio-stream.
+    """
+    await websocket.accept()
+    try:
+        inicio = await asyncio.wait_for(websocket.receive_json(), WS_AUDIO_TIMEOUT_INICIO)
+        async with SessionLocal() as db:
+            current_user = await get_current_user(str(inicio.get("token") or ""), db)
+        sample_rate = int(inicio.get("sample_rate") or SAMPLE_RATE_WHISPER)
+        if not 8000 <= sample_rate <= 48000:
+            raise ValueError("sample_rate fuera de rango")
+    except WebSocketDisconnect:
+        return
+    except (asyncio.TimeoutError, HTTPException, ValueError, TypeError, KeyError, AttributeError):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    session_id = str(inicio.get("session_id") or uuid.uuid4().hex)
+    origen = inicio.get("origen") or "audio_stream"
+    estado, nueva = sesiones.obtener(current_user.id, session_id)
+    if nueva:
+        async with estado.lock:
+            await restaurar_sesion(estado, current_user.id, session_id)
+    segmentador = SegmentadorVoz(formato=(sample_rate, 1, 2))
+    await websocket.send_json({"tipo": "listo", "session_id": session_id})
+
+    tareas = []
+    anterior = None
+    limite = asyncio.Semaphore(WS_AUDIO_SEGMENTOS_EN_VUELO)
+
+    async def lanzar(segmentos):
+        nonlocal anterior, tareas
+        for segmento in segmentos:
+            # Contrapresión: si Whisper va más lento que el cliente, se espera antes de leer más audio
+            await limite.acquire()
+            anterior = asyncio.ensure_future(
+                procesar_segmento_ws(websocket, segmento, estado, anterior, current_user.id, session_id, origen, limite)
+            )
+            tareas = [t for t in tareas if not t.done()] + [anterior]
+
+    try:
+        while True:
+            mensaje = await websocket.receive()
+            if mensaje["type"] == "websocket.disconnect":
+                break
+            if mensaje.get("bytes"):
+                await lanzar(segmentador.agregar(mensaje["bytes"]))
+            elif mensaje.get("text"):
+                try:
+                    fin = json.loads(mensaje["text"]).get("tipo") == "fin"
+                except (ValueError, AttributeError):
+                    await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                    break
+                if fin:
+                    await lanzar(segmentador.cerrar())
+                    if tareas:
+                        # Cada segmento informa de sus propios errores; aquí solo se espera a que acaben
+                        await asyncio.wait(tareas)
+                    await websocket.send_json({"tipo": "fin", "session_id": session_id, "fragmentos": estado.fragmentos})
+                    await websocket.close()
+                    break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Si el cliente se va, no seguir transcribiendo segmentos que nadie va a leer
+        for tarea in tareas:
+            tarea.cancel()
+
+async def procesar_segmento_ws(websocket, segmento, estado, anterior, usuario_id, session_id, origen, limite):
+    try:
+        await _procesar_segmento_ws(websocket, segmento, estado, anterior, usuario_id, session_id, origen)
+    except Exception:
+        # El fallo de un segmento (envío tras una desconexión, error de la base de datos...)
+        # no se propaga a los siguientes: se registra y se avisa al cliente si sigue conectado
+        logger.exception("Error procesando un segmento de la sesión %s", session_id)
+        try:
+            await websocket.send_json({"tipo": "error", "detalle": "Error en el procesamiento del segmento"})
+        except Exception:
+            pass
+    finally:
+        limite.release()
+
+async def _procesar_segmento_ws(websocket, segmento, estado, anterior, usuario_id, session_id, origen):
+    texto = await transcribir_audio(segmento) or ""
+    # Las transcripciones corren en paralelo, pero los eventos y la sesión avanzan en orden;
+    # se espera al segmento anterior sin heredar su excepción
+    if anterior is not None:
+        await asyncio.wait([anterior])
+    if texto.startswith("Error"):
+        await websocket.send_json({"tipo": "error", "detalle": texto})
+        return
+    if es_transcripcion_irrelevante(texto):
+        return
+    await websocket.send_json({"tipo": "transcripcion", "texto": texto})
+    veredicto = None
+    async with estado.lock:
+        estado.agregar(texto)
+        if estado.requiere_analisis():
+            veredicto = await analizar_con_ia(estado.ventana())
+            estado.registrar_veredicto(veredicto)
+        await guardar_sesion(estado, usuario_id, session_id, origen)
+    if veredicto is not None and veredicto.es_error:
+        await websocket.send_json({"tipo": "error", "detalle": veredicto.error})
+    elif veredicto is not None:
+        await websocket.send_json({
+            "tipo": "veredicto",
+            "diagnostico": veredicto.texto,
+            "veredicto": veredicto.a_dict(),
+            "riesgo_max": estado.riesgo_max
+        })
+
 class AnalisisGRPCResponse(BaseModel):
     transcripcion: str = Field(...)
     diagnostico: str = Field(...)
@@ -387,104 +743,98 @@ async def analizar_audio_grpc(
     session_id: str = Form("rest-session", description="ID de sesión para seguimiento")
 ):
     """Envía el audio al microservicio gRPC y retorna la transcripción, diagnóstico y riesgo."""
-    audio_bytes = await file.read()
-    import os
-    GRPC_SERVER_URL = os.getenv("GRPC_SERVER_URL", "localhost:50051")
-    channel = grpc.insecure_channel(GRPC_SERVER_URL)
-    stub = fraud_detection_pb2_grpc.FraudDetectionStub(channel)
-    def audio_chunks():
-        yield fraud_detection_pb2.AudioChunk(data=audio_bytes, session_id=session_id)
-    responses = stub.StreamAudio(audio_chunks())
-    for response in responses:
-        return AnalisisGRPCResponse(
-            transcripcion=response.transcripcion,
-            diagnostico=response.diagnostico,
-            riesgo=response.riesgo
-        )
-
-@app.post("/analizar-audio-stream", response_model=AnalisisAudioStreamResponse, tags=["Análisis"])
-async def analizar_audio_stream(file: UploadFile = File(...), session_id: str = None, texto_acumulado: str = Form(None), origen: str = Form("audio_stream"), db: AsyncSession = Depends(get_db), current_user: models.Usuario = Depends(get_current_user)):
-    """
-    Endpoint para analizar fragmentos de audio en tiempo real.
-    Recibe un fragmento de audio (wav), un session_id opcional y el texto acumulado.
-    Devuelve la transcripción y el análisis de fraude.
-    """
-    # Guardar archivo temporalmente, sin importar el nombre
-    temp_path = f"temp_stream.wav"
-    with open(temp_path, "wb") as f:
-        f.write(file.file.read())
-    # Validar encabezado RIFF/WAVE
+    # La cabecera se valida antes de abrir la llamada; el resto se lee al ritmo del stream gRPC
+    _, bloques = await abrir_wav(file, tam_bloque=GRPC_CHUNK_BYTES)
     try:
-        with open(temp_path, "rb") as f:
-            header = f.read(12)
-            if not (header[:4] == b'RIFF' and header[8:12] == b'WAVE'):
-                os.remove(temp_path)
-                raise HTTPException(status_code=400, detail="El archivo no es un WAV válido.")
-    except Exception:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        raise HTTPException(status_code=400, detail="No se pudo leer el archivo de audio.")
-    # Convertir a 16kHz mono para máxima compatibilidad
-    temp_path_16k = "temp_stream_16k.wav"
-    audio = AudioSegment.from_wav(temp_path)
-    audio = audio.set_frame_rate(16000).set_channels(1)
-    audio.export(temp_path_16k, format="wav")
-    # --- Detección de silencio en el backend ---
-    min_size_bytes = 2000  # Tamaño mínimo para considerar que hay voz (~0.1 seg)
-    min_rms = 10  # Energía mínima (ajustable, ahora más sensible)
-    import os
-    file_size = os.path.getsize(temp_path_16k)
-    rms = audio.rms
-    print(f"[DEBUG] Tamaño archivo recibido: {file_size} bytes | RMS: {rms}")
-    if file_size < min_size_bytes or rms < min_rms:
-        print('[DEBUG] Fragmento ignorado por silencio o archivo vacío (backend)')
-        return {
-            "session_id": session_id,
-            "transcripcion": "",
-            "diagnostico": None,
-            "ruta_archivo": temp_path_16k
-        }
-    texto = transcribir_audio(temp_path_16k)
-    # Filtro de frases irrelevantes
-    FRASES_IRRELEVANTES = [
-        "Subtítulos realizados por la comunidad de Amara.org",
-        "Subtitulado por la comunidad de Amara.org",
-        "¡Gracias por ver el vídeo!",
-        "No olvides suscribirte al canal",
-        "Gracias por ver",
-        "Gracias por ver el video",
-        "¡Suscríbete y activa notificaciones!"
-    ]
-    def es_transcripcion_irrelevante(texto):
-        t = texto.strip()
-        return t in FRASES_IRRELEVANTES or len(t.split()) <= 3
-    if es_transcripcion_irrelevante(texto):
-        print('[DEBUG] Transcripción irrelevante detectada, se ignora')
-        texto = ""
-    print(f"[DEBUG] Texto transcrito por Whisper: '{texto}'")
-    # os.remove(temp_path)  # No borrar para inspección manual
-    # os.remove(temp_path_16k)  # No borrar para inspección manual
-    # Usar el texto acumulado si existe para el análisis
-    texto_para_analizar = texto_acumulado if texto_acumulado else texto
-    resultado = analizar_con_ia(texto_para_analizar) if texto_para_analizar and 'Error' not in texto_para_analizar else None
-    # Guardar en base de datos
-    from app.models import Analisis
-    analisis = Analisis(
-        usuario_id=current_user.id,
-        texto_analizado=texto_para_analizar,
-        resultado=resultado,
-        session_id=session_id,
-        origen=origen
+        stub = await canales_grpc.stub()
+    except GrpcNoDisponible as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    rechazo = []
+    async def audio_chunks():
+        # El archivo se envía por bloques acotados en lugar de un único AudioChunk gigante
+        try:
+            async for bloque in bloques:
+                yield fraud_detection_pb2.AudioChunk(data=bloque, session_id=session_id)
+        except HTTPException as e:
+            # Audio demasiado largo: al fallar el iterador, grpc.aio cancela la llamada
+            rechazo.append(e)
+            raise
+    # El servicio responde un resultado por segmento de voz: se une la transcripción
+    # y se devuelve el diagnóstico más reciente con el riesgo más alto observado
+    transcripciones = []
+    diagnostico = ""
+    riesgo = 0
+    try:
+        async for response in stub.StreamAudio(audio_chunks(), timeout=GRPC_DEADLINE):
+            if response.transcripcion:
+                transcripciones.append(response.transcripcion)
+            if response.diagnostico:
+                diagnostico = response.diagnostico
+            riesgo = max(riesgo, response.riesgo)
+    except grpc.aio.AioRpcError as e:
+        codigo = 504 if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED else 502
+        raise HTTPException(status_code=codigo, detail=f"Error en el servicio gRPC: {e.details()}")
+    except asyncio.CancelledError:
+        if rechazo:
+            raise rechazo[0]
+        raise
+    return AnalisisGRPCResponse(
+        transcripcion=" ".join(transcripciones),
+        diagnostico=diagnostico,
+        riesgo=riesgo
     )
-    db.add(analisis)
-    await db.commit()
-    await db.refresh(analisis)
-    return {
-        "session_id": session_id,
-        "transcripcion": texto,
-        "diagnostico": resultado,
-        "ruta_archivo": temp_path_16k  # Para referencia
-    }
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Métricas"])
+async def metrics():
+    """Métricas del proceso en formato Prometheus: latencia por etapa y por ruta, trabajo en curso y tokens de OpenAI."""
+    return PlainTextResponse(metricas.formatear(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metricas/cache", tags=["Métricas"])
+async def metricas_cache():
+    """Contadores de aciertos y fallos de la caché de veredictos."""
+    return cache_veredictos.stats()
+
+@app.get("/metricas/preclasificador", tags=["Métricas"])
+async def metricas_preclasificador():
+    """Mensajes resueltos en local (estafa/benigno) y escalados al modelo de OpenAI."""
+    return preclasificador.estado()
+
+@app.get("/salud/grpc", tags=["Métricas"])
+async def salud_grpc():
+    """Estado de conectividad de los canales hacia el microservicio gRPC."""
+    try:
+        await canales_grpc.stub()
+        disponible = True
+    except GrpcNoDisponible:
+        disponible = False
+    return {"disponible": disponible, **canales_grpc.estado()}
+
+@app.get("/metricas/auth", tags=["Métricas"])
+async def metricas_auth():
+    """Cola del pool de procesos que calcula los hashes de contraseñas."""
+    return estado_hashing()
+
+@app.get("/metricas/db", tags=["Métricas"])
+async def metricas_db():
+    """Conexiones en uso, overflow y espera media/máxima para obtener una conexión del pool."""
+    return metricas_pool()
+
+@app.get("/metricas/escritura", tags=["Métricas"])
+async def metricas_escritura():
+    """Filas encoladas, escritas por lotes y desviadas al fichero de respaldo."""
+    return escritor_analisis.estado()
+
+@app.on_event("startup")
+async def iniciar_recursos():
+    iniciar_hashing()
+    await escritor_analisis.iniciar()
+
+@app.on_event("shutdown")
+async def cerrar_recursos():
+    await escritor_analisis.cerrar()
+    cerrar_inferencia()
+    cerrar_hashing()
+    await canales_grpc.cerrar()
 
 @app.get("/", response_class=HTMLResponse)
 def home():
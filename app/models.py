@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -18,7 +18,66 @@ class Analisis(Base):
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
     texto_analizado = Column(Text, nullable=False)
     resultado = Column(Text, nullable=True)  # Permitir valores nulos para evitar errores
+    # Veredicto tipado (ver app/core/veredicto.py); resultado queda como texto legible
+    diagnostico = Column(String(16), nullable=True)
+    riesgo = Column(Integer, nullable=True)
+    explicacion = Column(Text, nullable=True)
     session_id = Column(String, nullable=True)
     origen = Column(String, nullable=True)
     fecha = Column(DateTime, default=datetime.utcnow)
     usuario = relationship("Usuario", back_populates="analisis")
+    __table_args__ = (
+        # Paginación por cursor del historial: WHERE usuario_id = ? AND (fecha, id) < (?, ?) ORDER BY fecha DESC, id DESC
+        Index("ix_analisis_usuario_fecha_id", "usuario_id", "fecha", "id"),
+        # Paneles por ventana de tiempo: WHERE fecha >= ? AND riesgo >= ? sin recorrer resultado
+        Index("ix_analisis_fecha_riesgo", "fecha", "riesgo"),
+        Index("ix_analisis_diagnostico_fecha", "diagnostico", "fecha"),
+    )
+
+class Sesion(Base):
+    """Una fila por llamada en vivo, actualizada en cada fragmento en lugar de insertar uno nuevo."""
+    __tablename__ = "sesiones"
+    id = Column(Integer, primary_key=True, index=True)
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    session_id = Column(String, nullable=False)
+    origen = Column(String, nullable=True)
+    transcripcion = Column(Text, nullable=False, default="")
+    ultimo_resultado = Column(Text, nullable=True)
+    # Último veredicto tipado de la sesión
+    diagnostico = Column(String(16), nullable=True)
+    riesgo = Column(Integer, nullable=True)
+    explicacion = Column(Text, nullable=True)
+    riesgo_max = Column(Integer, nullable=True)
+    fragmentos = Column(Integer, nullable=False, default=0)
+    fecha_inicio = Column(DateTime, default=datetime.utcnow, nullable=False)
+    fecha_actualizacion = Column(DateTime, default=datetime.utcnow, nullable=False)
+    __table_args__ = (
+        UniqueConstraint("usuario_id", "session_id", name="uq_sesiones_usuario_session"),
+        Index("ix_sesiones_usuario_actualizacion_id", "usuario_id", "fecha_actualizacion", "id"),
+        # Sesiones de mayor riesgo del usuario (GET /estadisticas/sesiones)
+        Index("ix_sesiones_usuario_riesgo_max", "usuario_id", "riesgo_max"),
+    )
+
+class AnalisisDiario(Base):
+    """Resumen diario de análisis por usuario, origen, diagnóstico y tramo de riesgo (ver app/analitica.py)."""
+    __tablename__ = "analisis_diarios"
+    usuario_id = Column(Integer, ForeignKey("usuarios.id"), primary_key=True)
+    dia = Column(Date, primary_key=True)
+    origen = Column(String, primary_key=True, default="")           # '' = sin origen
+    diagnostico = Column(String(16), primary_key=True, default="")  # '' = sin diagnóstico
+    tramo_riesgo = Column(Integer, primary_key=True)                # riesgo // 10 (máx. 9); -1 = sin riesgo
+    total = Column(Integer, nullable=False, default=0)
+    suma_riesgo = Column(Integer, nullable=False, default=0)
+
+class VeredictoCache(Base):
+    __tablename__ = "veredictos_cache"
+    clave = Column(String(64), primary_key=True)  # sha256 de modelo + versión de prompt + texto normalizado
+    modelo = Column(String, nullable=False)
+    version_prompt = Column(String, nullable=False)
+    resultado = Column(Text, nullable=False)
+    fecha_creacion = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        # Borrado periódico de los veredictos caducados (app/core/cache.py)
+        Index("ix_veredictos_cache_fecha_creacion", "fecha_creacion"),
+    )
@@ -1,6 +1,8 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from app.core.veredicto import Diagnostico
 
 class UsuarioCreate(BaseModel):
     username: str
@@ -15,9 +17,18 @@ class UsuarioOut(BaseModel):
     class Config:
         from_attributes = True
 
+class VeredictoOut(BaseModel):
+    diagnostico: Optional[Diagnostico] = None
+    riesgo: Optional[int] = Field(None, ge=0, le=100)
+    explicacion: Optional[str] = None
+
 class AnalisisCreate(BaseModel):
     texto_analizado: str
     resultado: str
+    # Si no se envían, se leen del texto de resultado (clientes anteriores a los campos tipados)
+    diagnostico: Optional[Diagnostico] = None
+    riesgo: Optional[int] = Field(None, ge=0, le=100)
+    explicacion: Optional[str] = None
     session_id: Optional[str] = None
     origen: Optional[str] = None
 
@@ -26,13 +37,69 @@ from typing import Optional
 class AnalisisOut(BaseModel):
     id: int
     texto_analizado: str
-    resultado: str
+    resultado: Optional[str] = None
+    diagnostico: Optional[Diagnostico] = None
+    riesgo: Optional[int] = None
+    explicacion: Optional[str] = None
     session_id: Optional[str] = None
     origen: Optional[str] = None
     fecha: datetime
     class Config:
         from_attributes = True
 
+class SesionOut(BaseModel):
+    id: int
+    session_id: str
+    origen: Optional[str] = None
+    transcripcion: str
+    ultimo_resultado: Optional[str] = None
+    diagnostico: Optional[Diagnostico] = None
+    riesgo: Optional[int] = None
+    explicacion: Optional[str] = None
+    riesgo_max: Optional[int] = None
+    fragmentos: int
+    fecha_inicio: datetime
+    fecha_actualizacion: datetime
+    class Config:
+        from_attributes = True
+
+class EstadisticasResumen(BaseModel):
+    desde: date
+    hasta: date
+    total: int
+    por_diagnostico: Dict[str, int]
+    riesgo_alto: int
+    riesgo_medio: Optional[float] = None
+
+class TramoRiesgo(BaseModel):
+    desde: int
+    hasta: int
+    total: int
+
+class EstadisticasRiesgo(BaseModel):
+    desde: date
+    hasta: date
+    tramos: List[TramoRiesgo]
+    sin_riesgo: int
+
+class PuntoTendencia(BaseModel):
+    dia: date
+    origen: Optional[str] = None
+    total: int
+    estafas: int
+    riesgo_medio: Optional[float] = None
+
+class SesionRiesgo(BaseModel):
+    session_id: str
+    origen: Optional[str] = None
+    diagnostico: Optional[Diagnostico] = None
+    riesgo_max: int
+    fragmentos: int
+    fecha_inicio: datetime
+    fecha_actualizacion: datetime
+    class Config:
+        from_attributes = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,123 @@
+"""Subidas de audio por HTTP con memoria acotada.
+
+Los endpoints de audio no leen el archivo completo: ``abrir_wav`` lee solo hasta la
+cabecera WAV (formato y tamaño declarado) y después entrega el audio por bloques de
+``SUBIDA_BLOQUE_BYTES``, cortando con 413 en cuanto supera ``AUDIO_MAX_SEGUNDOS``.
+``LimitarSubidas`` rechaza antes de leer el cuerpo las peticiones de más de
+``AUDIO_MAX_MB``, así que un archivo enorme no llega ni a volcarse al temporal del multipart.
+"""
+import json
+import os
+import struct
+
+from fastapi import HTTPException
+
+from app.core.audio import leer_cabecera_wav
+
+AUDIO_MAX_MB = float(os.getenv("AUDIO_MAX_MB", "25"))                    # Tamaño máximo del archivo subido
+AUDIO_MAX_SEGUNDOS = float(os.getenv("AUDIO_MAX_SEGUNDOS", "600"))       # Duración máxima del audio
+SUBIDA_BLOQUE_BYTES = int(os.getenv("SUBIDA_BLOQUE_BYTES", str(64 * 1024)))
+CABECERA_MAX_BYTES = 64 * 1024   # Chunks previos a 'data' (LIST, bext...) que se aceptan
+MARGEN_MULTIPART = 64 * 1024     # Límites del multipart y campos de formulario junto al archivo
+RUTAS_AUDIO = ("/transcribir-audio", "/analizar-audio-stream", "/analizar-audio-grpc")
+
+WAV_NO_VALIDO = "El archivo no es un WAV válido."
+
+
+def demasiado_grande():
+    return HTTPException(status_code=413, detail=f"El archivo supera el máximo de {AUDIO_MAX_MB:g} MB")
+
+
+def demasiado_largo():
+    return HTTPException(status_code=413, detail=f"El audio supera el máximo de {AUDIO_MAX_SEGUNDOS:g} segundos")
+
+
+async def abrir_wav(archivo, max_segundos=None, tam_bloque=None):
+    """Valida la cabecera de un WAV subido leyendo solo sus primeros bloques.
+
+    Devuelve ``(formato, bloques)``: ``formato`` es ``(sample_rate, canales, ancho)`` y
+    ``bloques`` un generador asíncrono con el archivo completo, cabecera incluida, en
+    bloques de ``tam_bloque`` bytes. Si la cabecera declara más de ``max_segundos`` se
+    responde 413 sin leer el resto; si no (o si declara un tamaño desconocido, como los
+    WAV escritos en streaming), el generador lanza el 413 antes de entregar el bloque
+    que supera el límite.
+    """
+    max_segundos = AUDIO_MAX_SEGUNDOS if max_segundos is None else max_segundos
+    tam_bloque = tam_bloque or SUBIDA_BLOQUE_BYTES
+    inicio = bytearray()
+    while True:
+        bloque = await archivo.read(tam_bloque)
+        inicio += bloque
+        try:
+            cabecera = leer_cabecera_wav(inicio)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=WAV_NO_VALIDO)
+        if cabecera is not None:
+            break
+        if not bloque or len(inicio) > CABECERA_MAX_BYTES:
+            raise HTTPException(status_code=400, detail=WAV_NO_VALIDO)
+    sample_rate, canales, ancho, offset = cabecera
+    bytes_por_segundo = sample_rate * canales * ancho
+    if not bytes_por_segundo:
+        raise HTTPException(status_code=400, detail=WAV_NO_VALIDO)
+    max_datos = int(max_segundos * bytes_por_segundo)
+    declarado = struct.unpack_from('<I', inicio, offset - 4)[0]
+    if 0 < declarado < 0xFFFFFFFF and declarado > max_datos:
+        raise demasiado_largo()
+
+    async def bloques():
+        bloque = bytes(inicio)
+        datos = len(bloque) - offset
+        while bloque:
+            if datos > max_datos:
+                raise demasiado_largo()
+            yield bloque
+            bloque = await archivo.read(tam_bloque)
+            datos += len(bloque)
+
+    return cabecera[:3], bloques()
+
+
+class LimitarSubidas:
+    """Middleware ASGI: responde 413 a las subidas de audio de más de ``max_bytes``.
+
+    Con ``Content-Length`` se rechaza sin leer el cuerpo; sin él (transferencia por
+    chunks) se cuentan los bytes recibidos y se corta al superar el límite.
+    """
+
+    def __init__(self, app, rutas=RUTAS_AUDIO, max_bytes=None):
+        self.app = app
+        self.rutas = frozenset(rutas)
+        self.max_bytes = max_bytes or int(AUDIO_MAX_MB * 1024 * 1024) + MARGEN_MULTIPART
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.rutas:
+            await self.app(scope, receive, send)
+            return
+        longitud = dict(scope["headers"]).get(b"content-length", b"")
+        if longitud.isdigit() and int(longitud) > self.max_bytes:
+            await _responder_413(send)
+            return
+        recibidos = 0
+
+        async def recibir():
+            nonlocal recibidos
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                recibidos += len(mensaje.get("body", b""))
+                if recibidos > self.max_bytes:
+                    # FastAPI propaga las HTTPException lanzadas al leer el cuerpo
+                    raise demasiado_grande()
+            return mensaje
+
+        await self.app(scope, recibir, send)
+
+
+async def _responder_413(send):
+    cuerpo = json.dumps({"detail": demasiado_grande().detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode()), (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
@@ -0,0 +1,73 @@
+"""Micro-benchmark del preprocesado de audio: ruta pydub anterior vs. módulo NumPy.
+
+Ejecuta con python benchmarks/bench_audio.py [repeticiones]
+
+Ambas rutas reciben el mismo fragmento WAV de 5 s (como los que envía el micrófono
+del frontend) y producen un WAV de 16 kHz mono más la decisión de voz/silencio.
+"""
+import sys
+import os
+import io
+import time
+import warnings
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+warnings.filterwarnings("ignore", category=RuntimeWarning)
+from pydub import AudioSegment
+
+from app.core.audio import pcm_a_wav, float_a_pcm16, preparar_para_whisper
+
+REPETICIONES = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+
+def fragmento_sintetico(sample_rate, segundos=5.0, con_voz=True):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sample_rate * segundos)) / sample_rate
+    muestras = rng.standard_normal(len(t)) * 0.002
+    if con_voz:
+        # Tono modulado en amplitud (sílabas de ~4 Hz) entre 0.5 s y 4 s
+        envolvente = (np.sin(2 * np.pi * 4 * t) > 0) * ((t > 0.5) & (t < 4.0))
+        muestras += 0.3 * np.sin(2 * np.pi * 180 * t) * envolvente
+    return pcm_a_wav(float_a_pcm16(muestras.astype(np.float32)), sample_rate)
+
+
+def ruta_pydub(datos):
+    audio = AudioSegment.from_file(io.BytesIO(datos), format="wav")
+    audio = audio.set_frame_rate(16000).set_channels(1)
+    salida = io.BytesIO()
+    audio.export(salida, format="wav")
+    return salida.getvalue(), audio.rms >= 10
+
+
+def ruta_numpy(datos):
+    wav_16k, segmentos = preparar_para_whisper(datos)
+    return wav_16k, bool(segmentos)
+
+
+def medir(funcion, datos):
+    funcion(datos)  # calentamiento (caché del filtro, imports perezosos)
+    inicio = time.perf_counter()
+    for _ in range(REPETICIONES):
+        funcion(datos)
+    cpu = time.perf_counter() - inicio
+    return cpu / REPETICIONES * 1000
+
+
+def main():
+    print(f"{'escenario':<28}{'pydub (ms)':>12}{'numpy (ms)':>12}{'ratio':>8}  voz pydub/numpy")
+    for sample_rate in (44100, 48000):
+        for con_voz in (True, False):
+            datos = fragmento_sintetico(sample_rate, con_voz=con_voz)
+            t_pydub = medir(ruta_pydub, datos)
+            t_numpy = medir(ruta_numpy, datos)
+            nombre = f"{sample_rate} Hz {'voz' if con_voz else 'silencio'}"
+            print(f"{nombre:<28}{t_pydub:>12.2f}{t_numpy:>12.2f}{t_numpy / t_pydub:>8.2f}  "
+                  f"{ruta_pydub(datos)[1]}/{ruta_numpy(datos)[1]}")
+
+
+if __name__ == "__main__":
+    main()
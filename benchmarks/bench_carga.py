@@ -0,0 +1,188 @@
+"""Pruebas de carga reproducibles y sin red: peticiones por segundo y latencias p50/p95/p99.
+
+Ejecuta con python benchmarks/bench_carga.py [--escenarios texto,audio-stream,audio-grpc,grpc-stream]
+    [--peticiones 100] [--concurrencia 20] [--latencia-chat 0.3] [--latencia-audio 0.5] [--db URL]
+
+Arranca el OpenAI simulado de benchmarks/openai_falso.py y la app FastAPI en proceso
+(httpx ASGITransport) sobre una base SQLite temporal, o sobre ``--db`` (por ejemplo
+``postgresql+asyncpg://...``). Los escenarios gRPC lanzan ``python -m app.grpc_server``
+en un subproceso que usa el mismo OpenAI simulado. Cada petición lleva un texto o un
+audio distinto (benchmarks/wav_sinteticos.py) para no medir la caché de veredictos.
+Tras cada escenario se muestra el tiempo medio por etapa de app/core/metricas.py.
+"""
+import sys
+import os
+import argparse
+import asyncio
+import socket
+import subprocess
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ESCENARIOS = ("texto", "audio-stream", "audio-grpc", "grpc-stream")
+
+parser = argparse.ArgumentParser(description="Pruebas de carga con OpenAI simulado")
+parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+parser.add_argument("--peticiones", type=int, default=100)
+parser.add_argument("--concurrencia", type=int, default=20)
+parser.add_argument("--latencia-chat", type=float, default=0.3)
+parser.add_argument("--latencia-audio", type=float, default=0.5)
+parser.add_argument("--ms-por-token", type=float, default=0.0)
+parser.add_argument("--segundos-audio", type=float, default=3.0)
+parser.add_argument("--db", default=None, help="URL async de la base de datos (por defecto, SQLite temporal)")
+args = parser.parse_args()
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+import openai_falso
+import wav_sinteticos
+
+servidor_openai, url_openai = openai_falso.iniciar(
+    latencia_chat=args.latencia_chat, latencia_audio=args.latencia_audio, ms_por_token=args.ms_por_token
+)
+PUERTO_GRPC = _puerto_libre()
+os.environ["OPENAI_BASE_URL"] = url_openai
+os.environ["OPENAI_API_KEY"] = "sk-falsa"
+os.environ["GRPC_SERVER_URL"] = f"127.0.0.1:{PUERTO_GRPC}"
+os.environ["DATABASE_URL"] = args.db or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_carga.db')}"
+
+import logging
+logging.disable(logging.WARNING)
+
+import grpc
+import httpx
+
+import app.proto.fraud_detection_pb2 as fraud_detection_pb2
+import app.proto.fraud_detection_pb2_grpc as fraud_detection_pb2_grpc
+from app.core import metricas
+from app.database import Base, engine
+from app.escritura import escritor_analisis
+from app.main import app
+
+USUARIO = {"username": "carga", "email": "carga@example.com", "password": "clave-de-prueba"}
+
+
+def percentil(valores, q):
+    return valores[min(len(valores) - 1, int(q * (len(valores) - 1) + 0.5))]
+
+
+def _etapas():
+    return {clave[0]: (sum(serie[0]), serie[1]) for clave, serie in metricas.ETAPAS.instantanea()["series"].items()}
+
+
+async def escenario(nombre, peticion, n, concurrencia):
+    limite = asyncio.Semaphore(concurrencia)
+    latencias, errores = [], []
+
+    async def una(i):
+        async with limite:
+            inicio = time.perf_counter()
+            try:
+                await peticion(i)
+            except Exception as e:
+                errores.append(e)
+                return
+            latencias.append(time.perf_counter() - inicio)
+
+    servidor_openai.reiniciar_stats()
+    etapas_antes = _etapas()
+    inicio = time.perf_counter()
+    await asyncio.gather(*(una(i) for i in range(n)))
+    duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+    stats = servidor_openai.stats
+    if latencias:
+        p50, p95, p99 = (percentil(latencias, q) * 1000 for q in (0.5, 0.95, 0.99))
+    else:
+        p50 = p95 = p99 = float("nan")
+    print(f"{nombre:<14} {n:>6} {len(errores):>7} {len(latencias) / duracion:>8.1f} {p50:>8.0f} {p95:>8.0f} {p99:>8.0f}"
+          f" {stats['chat']:>6} {stats['transcripciones']:>7} {stats['tokens_entrada'] + stats['tokens_salida']:>8}")
+    if errores:
+        print(f"{'':<14} primer error: {errores[0]!r}")
+    desglose = []
+    for etapa, (cuenta, suma) in sorted(_etapas().items()):
+        cuenta_antes, suma_antes = etapas_antes.get(etapa, (0, 0.0))
+        if cuenta > cuenta_antes:
+            desglose.append(f"{etapa} {(suma - suma_antes) / (cuenta - cuenta_antes) * 1000:.1f} ms")
+    if desglose:
+        print(f"{'':<14} media por etapa (API): " + ", ".join(desglose))
+
+
+def arrancar_grpc():
+    entorno = {**os.environ, "GRPC_PUERTO": str(PUERTO_GRPC)}
+    raiz = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    return subprocess.Popen([sys.executable, "-m", "app.grpc_server"], cwd=raiz, env=entorno,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def main():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    proceso_grpc = None
+    canal = None
+    if any(e in ("audio-grpc", "grpc-stream") for e in escenarios):
+        proceso_grpc = arrancar_grpc()
+        canal = grpc.aio.insecure_channel(os.environ["GRPC_SERVER_URL"])
+        await asyncio.wait_for(canal.channel_ready(), 60)
+        stub = fraud_detection_pb2_grpc.FraudDetectionStub(canal)
+
+    segundos = args.segundos_audio
+    transporte = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=300) as cliente:
+            await cliente.post("/register", json=USUARIO)
+            r = await cliente.post("/login", data={"username": USUARIO["username"], "password": USUARIO["password"]})
+            cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+            async def texto(i):
+                r = await cliente.post("/analizar-texto", json={"texto": f"Su cuenta del banco ha sido bloqueada, referencia {i} {time.time()}"}, headers=cabeceras)
+                r.raise_for_status()
+
+            async def audio_stream(i):
+                wav = wav_sinteticos.voz(segundos, semilla=i)
+                r = await cliente.post(f"/analizar-audio-stream?session_id=carga-{i}", files={"file": ("audio.wav", wav, "audio/wav")},
+                                       data={"origen": "carga"}, headers=cabeceras)
+                r.raise_for_status()
+
+            async def audio_grpc(i):
+                wav = wav_sinteticos.voz(segundos, semilla=10000 + i)
+                r = await cliente.post("/analizar-audio-grpc", files={"file": ("audio.wav", wav, "audio/wav")})
+                r.raise_for_status()
+
+            async def grpc_stream(i):
+                # Dos frases con una pausa: el servidor responde un resultado por frase
+                pcm = wav_sinteticos.pcm(wav_sinteticos.conversacion(frases=2, segundos_frase=segundos / 2, semilla=20000 + i))
+                fragmentos = (fraud_detection_pb2.AudioChunk(data=pcm[j:j + 8000], session_id=f"carga-{i}") for j in range(0, len(pcm), 8000))
+                resultados = [res async for res in stub.StreamAudio(fragmentos)]
+                if not any(res.transcripcion for res in resultados):
+                    raise RuntimeError("StreamAudio sin transcripción")
+
+            funciones = {"texto": texto, "audio-stream": audio_stream, "audio-grpc": audio_grpc, "grpc-stream": grpc_stream}
+            print(f"OpenAI simulado: {args.latencia_chat * 1000:.0f} ms por análisis, {args.latencia_audio * 1000:.0f} ms por transcripción; "
+                  f"{args.peticiones} peticiones con concurrencia {args.concurrencia}; base {engine.dialect.name}\n")
+            print(f"{'escenario':<14} {'total':>6} {'errores':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'chat':>6} {'whisper':>7} {'tokens':>8}")
+            for nombre in escenarios:
+                await escenario(nombre, funciones[nombre], args.peticiones, args.concurrencia)
+    finally:
+        await escritor_analisis.cerrar()
+        if canal is not None:
+            await canal.close()
+        if proceso_grpc is not None:
+            proceso_grpc.terminate()
+            proceso_grpc.wait(10)
+        await engine.dispose()
+        servidor_openai.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""Tiempo de arranque de los puntos de entrada a partir de ``python -X importtime``.
+
+Ejecuta con python benchmarks/bench_importtime.py [repeticiones]
+
+Para cada módulo importa en un intérprete limpio, suma el tiempo acumulado de los
+imports (mediana de las repeticiones), lista los imports directos más caros y
+comprueba que el servidor gRPC no arrastra dependencias del backend web. Al final
+mide el tiempo real hasta que el servidor gRPC acepta conexiones en su puerto.
+"""
+import sys
+import os
+import socket
+import statistics
+import subprocess
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+REPETICIONES = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+PUNTOS_DE_ENTRADA = ["app.grpc_server", "app.core.inference", "app.main"]
+# Dependencias que el servidor gRPC no debe cargar al arrancar
+PROHIBIDOS_GRPC = ["fastapi", "starlette", "sqlalchemy", "passlib", "jose", "pydub", "speech_recognition", "openai"]
+PUERTO_PRUEBA = 50199
+
+
+def _entorno():
+    entorno = dict(os.environ, PYTHONPATH=RAIZ, PYTHONDONTWRITEBYTECODE="1")
+    entorno.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+    return entorno
+
+
+def medir_imports(modulo):
+    """Devuelve ``(total_us, {hijo: acumulado_us})`` del import de ``modulo`` en un proceso nuevo."""
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True, text=True, env=_entorno(), cwd=RAIZ,
+    )
+    if salida.returncode != 0:
+        raise RuntimeError(salida.stderr.strip().splitlines()[-1])
+    # La salida va en post-orden: los hijos directos (nivel 1) aparecen antes que su padre (nivel 0)
+    hijos, total = {}, 0
+    for linea in salida.stderr.splitlines():
+        partes = linea.split("|")
+        if not linea.startswith("import time:") or len(partes) != 3 or "cumulative" in linea:
+            continue
+        acumulado, nombre = int(partes[1]), partes[2]
+        nivel = (len(nombre) - len(nombre.lstrip()) - 1) // 2
+        if nivel == 1:
+            hijos[nombre.strip()] = acumulado
+        elif nivel == 0:
+            if nombre.strip() == modulo:
+                total = acumulado
+                break
+            hijos = {}
+    return total, hijos
+
+
+def modulos_cargados(modulo):
+    salida = subprocess.run(
+        [sys.executable, "-c", f"import sys, {modulo}; print(' '.join(sys.modules))"],
+        capture_output=True, text=True, env=_entorno(), cwd=RAIZ,
+    )
+    return set(salida.stdout.split())
+
+
+def tiempo_hasta_puerto(timeout=30):
+    entorno = _entorno()
+    entorno["GRPC_PUERTO"] = str(PUERTO_PRUEBA)
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "app", "grpc_server.py")],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=entorno,
+    )
+    try:
+        while time.perf_counter() - inicio < timeout:
+            try:
+                with socket.create_connection(("127.0.0.1", PUERTO_PRUEBA), timeout=0.05):
+                    return time.perf_counter() - inicio
+            except OSError:
+                time.sleep(0.005)
+        return None
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def main():
+    print(f"Tiempo de import (mediana de {REPETICIONES} procesos nuevos)\n")
+    for modulo in PUNTOS_DE_ENTRADA:
+        try:
+            mediciones = [medir_imports(modulo) for _ in range(REPETICIONES)]
+        except RuntimeError as e:
+            print(f"{modulo:<22} no se pudo importar: {e}\n")
+            continue
+        total = statistics.median(m[0] for m in mediciones)
+        print(f"{modulo:<22} {total / 1000:8.1f} ms")
+        mas_caros = sorted(mediciones[-1][1].items(), key=lambda x: x[1], reverse=True)[:8]
+        for nombre, us in mas_caros:
+            print(f"    {nombre:<30} {us / 1000:8.1f} ms")
+        print()
+
+    cargados = modulos_cargados("app.grpc_server")
+    prohibidos = [m for m in PROHIBIDOS_GRPC if m in cargados]
+    print("Dependencias del backend web cargadas por app.grpc_server:", ", ".join(prohibidos) or "ninguna")
+
+    arranques = [t for t in (tiempo_hasta_puerto() for _ in range(REPETICIONES)) if t is not None]
+    if arranques:
+        print(f"Arranque de app/grpc_server.py hasta aceptar conexiones: {statistics.median(arranques) * 1000:.0f} ms")
+    else:
+        print("El servidor gRPC no abrió el puerto a tiempo")
+    if prohibidos:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Latencia de /analizar-texto durante una ráfaga de logins.
+
+Ejecuta con python benchmarks/bench_login.py [logins] [concurrencia]
+
+Levanta la app en proceso sobre una base SQLite temporal y mide la latencia de
+/analizar-texto (con la llamada a OpenAI sustituida por una espera de 50 ms que no
+consume CPU) en tres escenarios: sin logins, con una ráfaga de logins calculando
+bcrypt en el event loop (como antes) y con la misma ráfaga usando el pool de
+procesos de app/hashing.py.
+"""
+import sys
+import os
+import asyncio
+import statistics
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_db = os.path.join(tempfile.mkdtemp(), "bench_login.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db}"
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+import logging
+logging.disable(logging.WARNING)
+
+import httpx
+
+from app import hashing
+from app.core import inference
+from app.core.veredicto import Veredicto
+from app.database import Base, engine
+from app.main import app
+
+LOGINS = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+CONCURRENCIA = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+INTERVALO_SONDA = 0.02
+USUARIO = {"username": "bench", "email": "bench@example.com", "password": "clave-de-prueba"}
+
+
+def analizar_falso(texto):
+    time.sleep(0.05)
+    return Veredicto("No Estafa", 5, "prueba")
+
+
+async def _en_el_loop(funcion, *args):
+    # Comportamiento anterior: bcrypt directamente dentro del handler async
+    return funcion(*args)
+
+
+async def sonda(cliente, token, parar, latencias):
+    cabeceras = {"Authorization": f"Bearer {token}"}
+    i = 0
+    while not parar.is_set():
+        i += 1
+        inicio = time.perf_counter()
+        # Texto distinto en cada petición para no acertar en la caché de veredictos
+        r = await cliente.post("/analizar-texto", json={"texto": f"mensaje de prueba {time.time()} {i}"}, headers=cabeceras)
+        r.raise_for_status()
+        latencias.append(time.perf_counter() - inicio)
+        await asyncio.sleep(INTERVALO_SONDA)
+
+
+async def rafaga_logins(cliente, n, concurrencia):
+    limite = asyncio.Semaphore(concurrencia)
+    codigos = {}
+
+    async def login():
+        async with limite:
+            r = await cliente.post("/login", data={"username": USUARIO["username"], "password": USUARIO["password"]})
+            codigos[r.status_code] = codigos.get(r.status_code, 0) + 1
+
+    await asyncio.gather(*(login() for _ in range(n)))
+    return codigos
+
+
+async def escenario(cliente, token, con_logins):
+    parar = asyncio.Event()
+    latencias = []
+    tarea = asyncio.ensure_future(sonda(cliente, token, parar, latencias))
+    inicio = time.perf_counter()
+    if con_logins:
+        codigos = await rafaga_logins(cliente, LOGINS, CONCURRENCIA)
+    else:
+        codigos = {}
+        await asyncio.sleep(2)
+    duracion = time.perf_counter() - inicio
+    parar.set()
+    await tarea
+    return latencias, codigos, duracion
+
+
+def resumen(nombre, latencias, codigos, duracion):
+    ms = sorted(l * 1000 for l in latencias)
+    p95 = ms[int(len(ms) * 0.95) - 1] if len(ms) >= 20 else ms[-1]
+    logins = ", ".join(f"{c}: {n}" for c, n in sorted(codigos.items())) or "-"
+    print(f"{nombre:<28} {len(ms):>5} {statistics.median(ms):>9.1f} {p95:>9.1f} {ms[-1]:>9.1f} {duracion:>9.2f}   {logins}")
+
+
+async def main():
+    inference._analizar = analizar_falso
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=120) as cliente:
+        await cliente.post("/register", json=USUARIO)
+        r = await cliente.post("/login", data={"username": USUARIO["username"], "password": USUARIO["password"]})
+        token = r.json()["access_token"]
+
+        print(f"{LOGINS} logins con concurrencia {CONCURRENCIA}; sonda /analizar-texto cada {INTERVALO_SONDA * 1000:.0f} ms\n")
+        print(f"{'escenario':<28} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'ráfaga s':>9}   logins")
+        resumen("sin logins", *await escenario(cliente, token, False))
+
+        ejecutar_pool = hashing._ejecutar
+        hashing._ejecutar = _en_el_loop
+        resumen("bcrypt en el event loop", *await escenario(cliente, token, True))
+        hashing._ejecutar = ejecutar_pool
+        # Equivale al evento startup de la app, que ASGITransport no lanza
+        hashing.iniciar()
+        await asyncio.sleep(3)
+        resumen(f"pool de {hashing.HASH_PROCESOS} procesos", *await escenario(cliente, token, True))
+
+    hashing.cerrar()
+    inference.cerrar()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""Mensajes por llamada al modelo y por petición HTTP: /analizar-texto frente a /analizar-texto/batch.
+
+Ejecuta con python benchmarks/bench_lote.py [mensajes] [concurrencia]
+
+Levanta la app en proceso sobre una base SQLite temporal y sustituye la llamada a
+OpenAI por una espera de 300 ms (más 5 ms por mensaje en las llamadas agrupadas) que
+no consume CPU. Un 20 % de los mensajes son repetidos, como en los envíos masivos de
+SMS. Se envían primero uno por petición con la concurrencia indicada y después todos
+en una sola petición por lotes.
+"""
+import sys
+import os
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+_db = os.path.join(tempfile.mkdtemp(), "bench_lote.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db}"
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+import logging
+logging.disable(logging.WARNING)
+
+import httpx
+
+from app.core import inference
+from app.database import Base, engine
+from app.main import app
+
+MENSAJES = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+CONCURRENCIA = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+LATENCIA_MODELO = 0.3
+USUARIO = {"username": "bench", "email": "bench@example.com", "password": "clave-de-prueba"}
+
+llamadas = []
+
+
+def completar_falso(prompt):
+    if "Mensajes (lista JSON)" in prompt:
+        mensajes = json.loads(prompt.split("Mensajes (lista JSON):", 1)[1])
+        llamadas.append(len(mensajes))
+        time.sleep(LATENCIA_MODELO + 0.005 * len(mensajes))
+        return json.dumps({"resultados": [{"id": m["id"], "diagnostico": "No Estafa", "explicacion": "prueba", "riesgo": 5} for m in mensajes]})
+    llamadas.append(1)
+    time.sleep(LATENCIA_MODELO)
+    return json.dumps({"diagnostico": "No Estafa", "explicacion": "prueba", "riesgo": 5})
+
+
+def generar_mensajes(n, semilla):
+    aleatorio = random.Random(semilla)
+    unicos = [f"SMS {semilla}-{i}: su paquete está retenido, pague la tasa en este enlace {aleatorio.random()}" for i in range(int(n * 0.8))]
+    return unicos + [aleatorio.choice(unicos) for _ in range(n - len(unicos))]
+
+
+async def uno_por_peticion(cliente, cabeceras, textos):
+    limite = asyncio.Semaphore(CONCURRENCIA)
+
+    async def enviar(texto):
+        async with limite:
+            r = await cliente.post("/analizar-texto", json={"texto": texto}, headers=cabeceras)
+            r.raise_for_status()
+
+    await asyncio.gather(*(enviar(t) for t in textos))
+    return len(textos)
+
+
+async def por_lotes(cliente, cabeceras, textos):
+    r = await cliente.post("/analizar-texto/batch", json={"mensajes": [{"texto": t} for t in textos]}, headers=cabeceras)
+    r.raise_for_status()
+    assert len(r.text.splitlines()) == len(textos)
+    return 1
+
+
+async def escenario(nombre, funcion, cliente, cabeceras, textos):
+    llamadas.clear()
+    inicio = time.perf_counter()
+    peticiones = await funcion(cliente, cabeceras, textos)
+    duracion = time.perf_counter() - inicio
+    print(f"{nombre:<26} {peticiones:>10} {len(llamadas):>9} {len(textos) / len(llamadas):>12.1f} {len(textos) / peticiones:>12.1f} {duracion:>9.2f}")
+
+
+async def main():
+    inference._completar = completar_falso
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=300) as cliente:
+        await cliente.post("/register", json=USUARIO)
+        r = await cliente.post("/login", data={"username": USUARIO["username"], "password": USUARIO["password"]})
+        cabeceras = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        print(f"{MENSAJES} mensajes (20 % repetidos); modelo simulado con {LATENCIA_MODELO * 1000:.0f} ms por llamada\n")
+        print(f"{'escenario':<26} {'peticiones':>10} {'llamadas':>9} {'msj/llamada':>12} {'msj/petición':>12} {'total s':>9}")
+        # Textos distintos en cada escenario para no acertar en la caché de veredictos
+        await escenario(f"uno por petición (x{CONCURRENCIA})", uno_por_peticion, cliente, cabeceras, generar_mensajes(MENSAJES, 1))
+        await escenario("/analizar-texto/batch", por_lotes, cliente, cabeceras, generar_mensajes(MENSAJES, 2))
+
+    inference.cerrar()
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
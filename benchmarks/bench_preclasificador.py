@@ -0,0 +1,115 @@
+"""Cobertura, precisión y latencia del preclasificador local (app/core/preclasificador.py).
+
+Ejecuta con python benchmarks/bench_preclasificador.py [mensajes]
+
+Genera mensajes sintéticos en español a partir de plantillas de estafas habituales
+(banco, paquetería, hijo con número nuevo, premios, inversión) y de mensajes normales,
+con un 15 % de casos ambiguos que mezclan ambos (avisos reales del banco, pagos entre
+amigos...) y cuya etiqueta varía, como varía la respuesta del modelo. Entrena con el 80 % y sobre el resto mide qué parte se resuelve en local,
+la precisión de esas decisiones y la latencia de ``clasificar`` por mensaje.
+"""
+import sys
+import os
+import random
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.preclasificador import (
+    Preclasificador, ModeloLineal, entrenar, evaluar,
+    PRECLASIFICADOR_UMBRAL_ESTAFA, PRECLASIFICADOR_UMBRAL_BENIGNO,
+)
+
+MENSAJES = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+ESTAFAS = [
+    "{banco}: su cuenta ha sido bloqueada por seguridad. Verifique sus datos en {url} antes de 24 horas",
+    "Aviso urgente de {banco}: introduzca su clave y el código de verificación en {url}",
+    "{paqueteria}: su paquete está retenido en aduana. Pague la tasa de {importe} € en {url}",
+    "Hola mamá, se me ha roto el móvil y este es mi número nuevo. ¿Me haces un bizum de {importe} euros?",
+    "Hola papá, este es mi nuevo número, necesito que me hagas una transferencia urgente",
+    "Enhorabuena, ha ganado un premio de {importe} €. Reclame su regalo en {url}",
+    "Hacienda: tiene un reembolso pendiente de {importe} euros. Acceda a {url} con su número de tarjeta",
+    "Inversión en bitcoin con rentabilidad garantizada, duplica tu dinero en una semana: {url}",
+    "Le llamamos de soporte técnico, su ordenador tiene un virus, necesitamos el código de acceso",
+]
+NORMALES = [
+    "¿Quedamos a las {hora} en la puerta del cine?",
+    "Te dejo la compra en la cocina, acuérdate de sacar la basura",
+    "La reunión de mañana se pasa a las {hora}, avisa al resto del equipo",
+    "Feliz cumpleaños {nombre}! A ver si nos vemos pronto",
+    "He llegado bien a casa, gracias por la cena",
+    "¿Puedes recoger a los niños del colegio hoy? Salgo tarde del trabajo",
+    "Mañana hay partido a las {hora}, llevo yo el balón",
+    "Su cita en el centro de salud es el día {dia} a las {hora}",
+    "El fontanero viene el {dia} por la mañana, estaré en casa",
+]
+# Plantilla y probabilidad de que el modelo la etiquete como estafa
+AMBIGUOS = [
+    ("{banco}: se ha realizado un pago de {importe} € con su tarjeta. Si no lo reconoce llame a su oficina", 0.3),
+    ("Te hago el bizum de {importe} euros de la cena esta noche", 0.1),
+    ("{paqueteria}: su envío llegará el {dia}, siga el pedido en la app", 0.2),
+    ("Te paso el enlace de las fotos: {url}", 0.4),
+    ("Su pedido está pendiente de pago, complete la compra en {url}", 0.7),
+    ("Necesito que me ayudes con una transferencia, luego te cuento", 0.6),
+]
+RELLENO = {
+    "banco": ["BBVA", "Santander", "CaixaBank", "Banco Sabadell", "ING"],
+    "paqueteria": ["Correos", "SEUR", "DHL", "GLS"],
+    "url": ["https://bit.ly/x9k2", "www.seguridad-clientes.com", "http://verifica-cuenta.xyz", "correos-envios.info"],
+    "importe": ["1,99", "2,50", "150", "300", "1.200"],
+    "hora": ["8", "10:30", "17:00", "21h"],
+    "nombre": ["Lucía", "Carlos", "Marta", "Javi"],
+    "dia": ["lunes", "martes", "15", "3 de mayo"],
+}
+
+
+def generar(n, semilla=0):
+    aleatorio = random.Random(semilla)
+    relleno = lambda plantilla: plantilla.format(**{k: aleatorio.choice(v) for k, v in RELLENO.items()})
+    ejemplos = []
+    for _ in range(n):
+        tirada = aleatorio.random()
+        if tirada < 0.15:
+            plantilla, probabilidad = aleatorio.choice(AMBIGUOS)
+            es_estafa = aleatorio.random() < probabilidad
+        elif tirada < 0.5:
+            plantilla, es_estafa = aleatorio.choice(ESTAFAS), True
+        else:
+            plantilla, es_estafa = aleatorio.choice(NORMALES), False
+        ejemplos.append((relleno(plantilla), es_estafa))
+    return ejemplos
+
+
+def latencias(clasificador, textos):
+    tiempos = []
+    for texto in textos:
+        inicio = time.perf_counter()
+        clasificador.clasificar(texto)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return tiempos[len(tiempos) // 2] * 1000, tiempos[int(len(tiempos) * 0.99)] * 1000
+
+
+def main():
+    ejemplos = generar(MENSAJES)
+    corte = int(len(ejemplos) * 0.8)
+    entrenamiento, validacion = ejemplos[:corte], ejemplos[corte:]
+
+    inicio = time.perf_counter()
+    modelo = entrenar(entrenamiento)
+    duracion = time.perf_counter() - inicio
+
+    print(f"{len(entrenamiento)} mensajes de entrenamiento, {len(validacion)} de validación; entrenado en {duracion:.2f} s")
+    print(f"Umbrales: estafa >= {PRECLASIFICADOR_UMBRAL_ESTAFA}, benigno <= {PRECLASIFICADOR_UMBRAL_BENIGNO}\n")
+    print(f"{'modelo':<24} {'cobertura':>10} {'prec. estafa':>13} {'prec. benigno':>14} {'p50 ms':>8} {'p99 ms':>8}")
+    for nombre, m in (("solo indicios (inicial)", ModeloLineal.inicial()), ("entrenado", modelo)):
+        resultado = evaluar(m, validacion)
+        p50, p99 = latencias(Preclasificador(m, activo=True), [t for t, _ in validacion])
+        formato = lambda v: "-" if v is None else f"{v:.2%}"
+        print(f"{nombre:<24} {resultado['cobertura']:>10.1%} {formato(resultado['precision_estafa']):>13} "
+              f"{formato(resultado['precision_benigno']):>14} {p50:>8.3f} {p99:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Grabación larga: una sola petición a Whisper frente a segmentos en paralelo.
+
+Ejecuta con python benchmarks/bench_transcripcion_larga.py [--minutos 30] [--paralelo 8]
+    [--latencia-audio 0.5] [--ms-por-segundo-audio 10]
+
+Genera una llamada sintética (frases de 2 a 12 s separadas por pausas, con algún tramo
+de más de un minuto sin pausa que obliga a cortes forzados con solape) y la transcribe
+contra el OpenAI simulado de benchmarks/openai_falso.py, cuya transcripción tarda la
+latencia base más un coste por segundo de audio, como la API real. Se compara
+``transcribir_audio`` con el archivo entero y ``transcribir_por_segmentos`` leyendo el
+archivo por bloques de 64 KiB.
+"""
+import sys
+import os
+import argparse
+import asyncio
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+parser = argparse.ArgumentParser(description="Transcripción de grabaciones largas")
+parser.add_argument("--minutos", type=float, default=30)
+parser.add_argument("--paralelo", type=int, default=8)
+parser.add_argument("--latencia-audio", type=float, default=0.5)
+parser.add_argument("--ms-por-segundo-audio", type=float, default=10)
+args = parser.parse_args()
+
+import numpy as np
+
+import openai_falso
+import wav_sinteticos
+
+servidor_openai, url_openai = openai_falso.iniciar(
+    latencia_audio=args.latencia_audio, ms_por_segundo_audio=args.ms_por_segundo_audio
+)
+os.environ["OPENAI_BASE_URL"] = url_openai
+os.environ["OPENAI_API_KEY"] = "sk-falsa"
+# El pool de Whisper del proceso no debe ser el cuello de botella de la comparación
+os.environ["WHISPER_MAX_CONCURRENCIA"] = str(max(args.paralelo, 8))
+# Con una sola petición, 30 minutos superan los timeouts por defecto (ese es el problema que se mide)
+os.environ.setdefault("INFERENCIA_TIMEOUT", "600")
+os.environ.setdefault("OPENAI_TIMEOUT", "600")
+
+from app.core import transcripcion
+from app.core.audio import pcm_a_wav, leer_cabecera_wav
+from app.core.inference import transcribir_audio, cerrar
+
+BLOQUE = 64 * 1024
+
+
+def grabacion(minutos, semilla=0):
+    aleatorio = np.random.default_rng(semilla)
+    partes, total, i = [], 0.0, 0
+    while total < minutos * 60:
+        # Uno de cada quince tramos es un monólogo sin pausas de 70-90 s
+        segundos = aleatorio.uniform(70, 90) if i % 15 == 7 else aleatorio.uniform(2, 12)
+        pausa = aleatorio.uniform(0.6, 1.5)
+        partes.append(wav_sinteticos.pcm(wav_sinteticos.voz(segundos, semilla=semilla * 10000 + i)))
+        partes.append(bytes(int(pausa * 16000) * 2))
+        total += segundos + pausa
+        i += 1
+    return pcm_a_wav(b"".join(partes), 16000), total
+
+
+def segundos_wav(wav):
+    sample_rate, canales, ancho, offset = leer_cabecera_wav(wav)
+    return (len(wav) - offset) / (sample_rate * canales * ancho)
+
+
+async def por_bloques(wav):
+    for inicio in range(0, len(wav), BLOQUE):
+        yield wav[inicio:inicio + BLOQUE]
+
+
+async def main():
+    wav, segundos = grabacion(args.minutos)
+    print(f"Grabación de {segundos / 60:.1f} min ({len(wav) / 1e6:.0f} MB); Whisper simulado: "
+          f"{args.latencia_audio * 1000:.0f} ms + {args.ms_por_segundo_audio:.0f} ms por segundo de audio\n")
+    print(f"{'modo':<26} {'llamadas':>9} {'total s':>8} {'segmento más largo s':>21}")
+
+    servidor_openai.reiniciar_stats()
+    inicio = time.perf_counter()
+    texto = await transcribir_audio(wav)
+    duracion = time.perf_counter() - inicio
+    assert not texto.startswith("Error"), texto
+    print(f"{'una petición':<26} {servidor_openai.stats['transcripciones']:>9} {duracion:>8.2f} {segundos:>21.0f}")
+
+    # Duración de cada segmento tal como se corta, para estimar el más lento
+    duraciones = []
+    original = transcripcion._transcribir_segmento
+
+    async def medido(segmento):
+        duraciones.append(segundos_wav(segmento))
+        return await original(segmento)
+
+    transcripcion._transcribir_segmento = medido
+    servidor_openai.reiniciar_stats()
+    inicio = time.perf_counter()
+    texto = await transcripcion.transcribir_por_segmentos(por_bloques(wav), paralelo=args.paralelo)
+    duracion = time.perf_counter() - inicio
+    assert not texto.startswith("Error"), texto
+    mas_largo = max(duraciones)
+    print(f"{f'segmentos (paralelo {args.paralelo})':<26} {servidor_openai.stats['transcripciones']:>9} {duracion:>8.2f} {mas_largo:>21.0f}")
+    esperado = args.latencia_audio + mas_largo * args.ms_por_segundo_audio / 1000
+    print(f"\n{len(duraciones)} segmentos de {min(duraciones):.0f} a {mas_largo:.0f} s; "
+          f"transcribir solo el más largo tarda {esperado:.2f} s")
+
+    cerrar()
+    servidor_openai.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
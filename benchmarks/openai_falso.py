@@ -0,0 +1,149 @@
+"""Servidor local que imita la API de OpenAI para medir sin red ni coste.
+
+Ejecuta con python benchmarks/openai_falso.py [--puerto 8090] [--latencia-chat 0.3] [--latencia-audio 0.5]
+y arranca la app con OPENAI_BASE_URL=http://127.0.0.1:8090/v1.
+
+Atiende ``/v1/chat/completions`` (un mensaje o la lista JSON del análisis por lotes)
+y ``/v1/audio/transcriptions``. Cada respuesta tarda la latencia base más un coste
+por token generado (o por segundo de audio) y devuelve ``usage`` como la API real.
+Los veredictos son deterministas: "Estafa" si el mensaje contiene palabras típicas de
+estafa, "No Estafa" en otro caso. La transcripción depende del contenido del audio,
+así que audios distintos no aciertan en la caché de veredictos.
+
+También se puede usar en proceso: ``servidor, url = iniciar(latencia_chat=0.05)``.
+"""
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PALABRAS_ESTAFA = ("clave", "banco", "premio", "bizum", "tasa", "urgente", "tarjeta", "enlace", "bloquead")
+FRASES = (
+    "le llamo de su banco porque hemos detectado un cargo sospechoso en su tarjeta necesito que me confirme la clave",
+    "hola soy yo te llamo para decirte que llegaré un poco tarde a la cena de esta noche",
+    "ha ganado un premio de mil euros solo tiene que pagar una pequeña tasa por bizum hoy mismo",
+    "buenos días le llamamos del centro de salud para confirmar su cita del próximo martes",
+)
+
+
+def _tokens(texto):
+    # Aproximación habitual: unos 4 caracteres por token
+    return max(1, len(texto) // 4)
+
+
+def _veredicto(texto):
+    texto = texto.lower()
+    estafa = any(palabra in texto for palabra in PALABRAS_ESTAFA)
+    return {
+        "diagnostico": "Estafa" if estafa else "No Estafa",
+        "explicacion": "Respuesta simulada por benchmarks/openai_falso.py",
+        "riesgo": 90 if estafa else 10,
+    }
+
+
+def _respuesta_chat(prompt):
+    if "Mensajes (lista JSON):" in prompt:
+        mensajes = json.loads(prompt.split("Mensajes (lista JSON):", 1)[1])
+        return json.dumps({"resultados": [{"id": m["id"], **_veredicto(m["texto"])} for m in mensajes]}, ensure_ascii=False)
+    return json.dumps(_veredicto(prompt.rsplit("Mensaje:", 1)[-1]), ensure_ascii=False)
+
+
+class OpenAIFalso(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, latencia_chat=0.3, latencia_audio=0.5, ms_por_token=0.0, ms_por_segundo_audio=0.0):
+        super().__init__(direccion, _Handler)
+        self.latencia_chat = latencia_chat
+        self.latencia_audio = latencia_audio
+        self.ms_por_token = ms_por_token
+        self.ms_por_segundo_audio = ms_por_segundo_audio
+        self.stats = {"chat": 0, "transcripciones": 0, "tokens_entrada": 0, "tokens_salida": 0}
+        self._lock = threading.Lock()
+
+    def contar(self, **incrementos):
+        with self._lock:
+            for clave, valor in incrementos.items():
+                self.stats[clave] += valor
+
+    def reiniciar_stats(self):
+        with self._lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/chat/completions"):
+            self._chat(json.loads(cuerpo))
+        elif self.path.endswith("/audio/transcriptions"):
+            self._transcripcion(cuerpo)
+        else:
+            self._responder(404, {"error": {"message": f"Ruta no simulada: {self.path}"}})
+
+    def _chat(self, peticion):
+        prompt = "\n".join(m.get("content", "") for m in peticion.get("messages", []))
+        contenido = _respuesta_chat(prompt)
+        entrada, salida = _tokens(prompt), _tokens(contenido)
+        self.server.contar(chat=1, tokens_entrada=entrada, tokens_salida=salida)
+        time.sleep(self.server.latencia_chat + salida * self.server.ms_por_token / 1000)
+        self._responder(200, {
+            "id": "chatcmpl-falso",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": peticion.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": contenido}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": entrada, "completion_tokens": salida, "total_tokens": entrada + salida},
+        })
+
+    def _transcripcion(self, cuerpo):
+        # Sin decodificar el multipart: WAV de 16 bits a 16 kHz, unos 32 000 bytes por segundo
+        segundos = len(cuerpo) / 32000
+        huella = zlib.crc32(cuerpo)
+        texto = f"{FRASES[huella % len(FRASES)]} referencia {huella % 100000}"
+        self.server.contar(transcripciones=1)
+        time.sleep(self.server.latencia_audio + segundos * self.server.ms_por_segundo_audio / 1000)
+        self._responder(200, {"text": texto})
+
+    def _responder(self, estado, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar(puerto=0, **opciones):
+    """Arranca el servidor en un hilo; devuelve ``(servidor, base_url)``."""
+    servidor = OpenAIFalso(("127.0.0.1", puerto), **opciones)
+    threading.Thread(target=servidor.serve_forever, daemon=True, name="openai-falso").start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--puerto", type=int, default=8090)
+    parser.add_argument("--latencia-chat", type=float, default=0.3, help="segundos por llamada de análisis")
+    parser.add_argument("--latencia-audio", type=float, default=0.5, help="segundos por transcripción")
+    parser.add_argument("--ms-por-token", type=float, default=0.0, help="coste añadido por token generado")
+    parser.add_argument("--ms-por-segundo-audio", type=float, default=0.0, help="coste añadido por segundo de audio")
+    args = parser.parse_args()
+    servidor = OpenAIFalso(
+        ("127.0.0.1", args.puerto), args.latencia_chat, args.latencia_audio, args.ms_por_token, args.ms_por_segundo_audio
+    )
+    print(f"OpenAI simulado en http://127.0.0.1:{args.puerto}/v1")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
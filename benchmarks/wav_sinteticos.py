@@ -0,0 +1,59 @@
+"""Audios WAV sintéticos para tests y benchmarks, sin ficheros de muestra.
+
+``voz`` genera un tono armónico con la envolvente de las sílabas (unos 4 Hz), que el
+detector de voz de app/core/audio.py clasifica como habla; ``conversacion`` alterna
+frases y pausas para que el audio en streaming se corte en varios segmentos.
+La ``semilla`` cambia la entonación, así que cada semilla da un audio distinto.
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from app.core.audio import pcm_a_wav, float_a_pcm16
+
+
+def _muestras_voz(segundos, sample_rate, semilla):
+    aleatorio = np.random.default_rng(semilla)
+    t = np.arange(int(segundos * sample_rate)) / sample_rate
+    f0 = aleatorio.uniform(110, 220) * (1 + 0.05 * np.sin(2 * np.pi * aleatorio.uniform(0.5, 2) * t))
+    fase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    senal = sum(np.sin(k * fase) / k for k in range(1, 6))
+    silabas = 0.5 * (1 + np.sin(2 * np.pi * aleatorio.uniform(3.5, 5) * t))
+    return (0.25 * senal * (0.3 + 0.7 * silabas)).astype(np.float32)
+
+
+def _wav(muestras, sample_rate, canales):
+    pcm = float_a_pcm16(muestras)
+    if canales > 1:
+        pcm = np.repeat(np.frombuffer(pcm, dtype='<i2'), canales).tobytes()
+    return pcm_a_wav(pcm, sample_rate, canales)
+
+
+def voz(segundos=3.0, sample_rate=16000, canales=1, semilla=0):
+    return _wav(_muestras_voz(segundos, sample_rate, semilla), sample_rate, canales)
+
+
+def silencio(segundos=1.0, sample_rate=16000, canales=1):
+    return _wav(np.zeros(int(segundos * sample_rate), np.float32), sample_rate, canales)
+
+
+def ruido(segundos=1.0, sample_rate=16000, canales=1, nivel=0.05, semilla=0):
+    muestras = np.random.default_rng(semilla).normal(0, nivel, int(segundos * sample_rate)).astype(np.float32)
+    return _wav(muestras, sample_rate, canales)
+
+
+def conversacion(frases=3, segundos_frase=2.0, pausa=1.0, sample_rate=16000, semilla=0):
+    """Frases de voz separadas por silencios de ``pausa`` segundos."""
+    partes = []
+    for i in range(frases):
+        partes.append(_muestras_voz(segundos_frase, sample_rate, semilla * 1000 + i))
+        partes.append(np.zeros(int(pausa * sample_rate), np.float32))
+    return _wav(np.concatenate(partes), sample_rate, 1)
+
+
+def pcm(wav):
+    """PCM sin cabecera de un WAV generado aquí (para enviarlo por gRPC o WebSocket)."""
+    return wav[44:]
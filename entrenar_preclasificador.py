@@ -0,0 +1,61 @@
+"""Entrena el preclasificador local con los análisis guardados y lo evalúa antes de guardarlo.
+
+Uso: python entrenar_preclasificador.py [ruta_del_modelo]
+
+Usa las filas de ``analisis`` con diagnóstico (las que ya resolvió el modelo de OpenAI;
+las del propio preclasificador se excluyen para que no se entrene con sus decisiones).
+Una de cada cinco filas, elegida por id, se reserva para medir la precisión.
+"""
+import asyncio
+import sys
+
+from sqlalchemy import or_
+from sqlalchemy.future import select
+
+from app.database import SessionLocal, engine
+from app.models import Analisis
+from app.core.preclasificador import PRECLASIFICADOR_MODELO, entrenar, evaluar
+from app.core.veredicto import Diagnostico
+
+LOTE = 5000
+MIN_EJEMPLOS = 200
+
+
+async def cargar_ejemplos():
+    entrenamiento, validacion = [], []
+    ultimo = 0
+    async with SessionLocal() as db:
+        while True:
+            consulta = (
+                select(Analisis.id, Analisis.texto_analizado, Analisis.diagnostico)
+                .where(Analisis.id > ultimo, Analisis.diagnostico.isnot(None))
+                .where(or_(Analisis.explicacion.is_(None), Analisis.explicacion.notlike("Clasificación local:%")))
+                .order_by(Analisis.id)
+                .limit(LOTE)
+            )
+            filas = (await db.execute(consulta)).all()
+            if not filas:
+                break
+            for fila in filas:
+                ejemplo = (fila.texto_analizado, fila.diagnostico == Diagnostico.ESTAFA.value)
+                (validacion if fila.id % 5 == 0 else entrenamiento).append(ejemplo)
+            ultimo = filas[-1].id
+    await engine.dispose()
+    return entrenamiento, validacion
+
+
+def main(ruta):
+    entrenamiento, validacion = asyncio.run(cargar_ejemplos())
+    if len(entrenamiento) < MIN_EJEMPLOS:
+        print(f"Solo hay {len(entrenamiento)} análisis con diagnóstico; se necesitan al menos {MIN_EJEMPLOS}")
+        sys.exit(1)
+    estafas = sum(1 for _, es_estafa in entrenamiento if es_estafa)
+    print(f"Entrenando con {len(entrenamiento)} análisis ({estafas} estafas); validación: {len(validacion)}")
+    modelo = entrenar(entrenamiento)
+    print("Validación:", evaluar(modelo, validacion))
+    modelo.guardar(ruta)
+    print(f"Modelo guardado en {ruta} ({len(modelo.pesos)} pesos)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else PRECLASIFICADOR_MODELO)
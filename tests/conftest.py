@@ -0,0 +1,32 @@
+"""Configuración común de los tests: base de datos y OpenAI locales.
+
+Sin DATABASE_URL se usa una base SQLite temporal; con DATABASE_URL=postgresql+asyncpg://...
+los mismos tests corren contra PostgreSQL. Sin OPENAI_BASE_URL las llamadas a OpenAI van al
+servidor simulado de benchmarks/openai_falso.py, así que los tests no salen a la red.
+"""
+import sys
+import os
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'tests.db')}"
+if not os.getenv("OPENAI_BASE_URL"):
+    from benchmarks.openai_falso import iniciar
+    _openai_falso, os.environ["OPENAI_BASE_URL"] = iniciar(latencia_chat=0, latencia_audio=0)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+def pytest_sessionstart(session):
+    from app.database import Base, engine
+    from app import models  # noqa: F401  (registra las tablas en Base.metadata)
+
+    async def crear_tablas():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        # Las conexiones pertenecen a este event loop; los tests abren las suyas
+        await engine.dispose()
+
+    asyncio.run(crear_tablas())
@@ -0,0 +1,81 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from app.core.audio import (
+    SegmentadorVoz, decodificar_wav, detectar_voz, float_a_pcm16, pcm_a_wav, preparar_para_whisper, resamplear
+)
+
+SR = 16000
+
+
+def voz_sintetica(segundos, sample_rate=SR):
+    t = np.arange(int(sample_rate * segundos)) / sample_rate
+    return (0.3 * np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+
+
+def silencio(segundos, sample_rate=SR):
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal(int(sample_rate * segundos)) * 0.001).astype(np.float32)
+
+
+def test_decodificar_wav_ida_y_vuelta():
+    muestras = voz_sintetica(0.5)
+    decodificadas, sample_rate = decodificar_wav(pcm_a_wav(float_a_pcm16(muestras), SR))
+    assert sample_rate == SR
+    assert np.max(np.abs(decodificadas - muestras)) < 1e-3
+
+
+def test_resamplear_conserva_duracion_y_tono():
+    muestras = voz_sintetica(1.0, 48000)
+    salida = resamplear(muestras, 48000, SR)
+    assert len(salida) == SR
+    # La amplitud del tono de 200 Hz no se altera al bajar a 16 kHz
+    assert abs(np.max(np.abs(salida[1000:-1000])) - 0.3) < 0.01
+
+
+def test_detectar_voz_devuelve_segmentos():
+    muestras = np.concatenate([silencio(1), voz_sintetica(1), silencio(1)])
+    segmentos = detectar_voz(muestras, SR)
+    assert len(segmentos) == 1
+    inicio, fin = segmentos[0]
+    assert abs(inicio - SR) < 0.05 * SR and abs(fin - 2 * SR) < 0.05 * SR
+    assert detectar_voz(silencio(2), SR) == []
+
+
+def test_preparar_para_whisper_descarta_silencio():
+    wav_silencio = pcm_a_wav(float_a_pcm16(silencio(2, 44100)), 44100)
+    assert preparar_para_whisper(wav_silencio) == (None, [])
+    wav_voz = pcm_a_wav(float_a_pcm16(voz_sintetica(1, 44100)), 44100)
+    wav_16k, segmentos = preparar_para_whisper(wav_voz)
+    assert decodificar_wav(wav_16k)[1] == SR
+    assert segmentos
+
+
+def test_segmentador_corta_en_silencios():
+    muestras = np.concatenate([voz_sintetica(1), silencio(1), voz_sintetica(1), silencio(0.2)])
+    wav = pcm_a_wav(float_a_pcm16(muestras), SR)
+    segmentador = SegmentadorVoz()
+    segmentos = []
+    for i in range(0, len(wav), 3000):
+        segmentos += segmentador.agregar(wav[i:i + 3000])
+    assert len(segmentos) == 1
+    segmentos += segmentador.cerrar()
+    assert len(segmentos) == 2
+    # Cortes en pausas: ningún segmento repite audio del anterior
+    assert [s.solapa for s in segmentos] == [False, False]
+
+
+def test_segmentador_solapa_los_cortes_sin_pausa():
+    # Voz continua: los cortes son forzados y repiten el final del segmento anterior
+    wav = pcm_a_wav(float_a_pcm16(voz_sintetica(7)), SR)
+    segmentador = SegmentadorVoz(max_segundos=3, solape_ms=600)
+    segmentos = segmentador.agregar(wav) + segmentador.cerrar()
+    duraciones = [decodificar_wav(s)[0].size / SR for s in segmentos]
+    assert abs(duraciones[0] - 3) < 0.05
+    assert [s.solapa for s in segmentos] == [False] + [True] * (len(segmentos) - 1)
+    assert sum(duraciones) > 7 + 0.6 * (len(segmentos) - 1) - 0.1
+    assert decodificar_wav(segmentos[1])[0][:SR // 2].tobytes() == decodificar_wav(segmentos[0])[0][-int(0.6 * SR):][:SR // 2].tobytes()
@@ -0,0 +1,54 @@
+import sys
+import os
+import asyncio
+from datetime import timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+from jose import jwt
+from sqlalchemy.future import select
+
+from app.main import app, create_access_token, get_current_user, SECRET_KEY, ALGORITHM
+from app.auth import Principal, cache_principales
+from app.database import SessionLocal
+from app import models, hashing
+
+client = TestClient(app)
+
+
+class SesionSinConsultas:
+    async def execute(self, *args, **kwargs):
+        raise AssertionError("get_current_user no debería consultar la base de datos")
+
+
+def test_principal_en_cache_evita_la_consulta():
+    cache_principales.set(4242, Principal(4242, "cacheado", "cacheado@example.com"))
+    token = create_access_token({"sub": "cacheado", "uid": 4242}, timedelta(minutes=5))
+    principal = asyncio.run(get_current_user(token, SesionSinConsultas()))
+    assert principal.id == 4242
+
+
+def test_modificar_usuario_invalida_el_principal():
+    user = {"username": "authcache", "email": "authcache@example.com", "password": "testpass123"}
+    client.post("/register", json=user)
+    token = client.post("/login", data={"username": user["username"], "password": user["password"]}).json()["access_token"]
+    usuario_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])["uid"]
+    assert client.get("/analisis", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert cache_principales.get(usuario_id) is not None
+
+    async def cambiar_email():
+        async with SessionLocal() as db:
+            usuario = (await db.execute(select(models.Usuario).where(models.Usuario.id == usuario_id))).scalars().first()
+            usuario.email = f"authcache{usuario_id}@example.com"
+            await db.commit()
+
+    asyncio.run(cambiar_email())
+    assert cache_principales.get(usuario_id) is None
+
+
+def test_login_con_cola_de_hash_llena_devuelve_503(monkeypatch):
+    monkeypatch.setattr(hashing, "_pendientes", hashing.HASH_MAX_COLA)
+    response = client.post("/login", data={"username": "authcache", "password": "testpass123"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
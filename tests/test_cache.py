@@ -0,0 +1,84 @@
+import sys
+import os
+import asyncio
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.cache import CacheTTL, clave_veredicto
+from app.core import inference
+from app.core.veredicto import Veredicto
+
+
+def test_cache_lru_expulsa_la_entrada_menos_usada():
+    cache = CacheTTL(max_entradas=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_cache_ttl_expira():
+    cache = CacheTTL(max_entradas=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.misses == 1
+
+
+def test_clave_veredicto_normaliza_texto():
+    clave = clave_veredicto("Has GANADO  un premio\n", "gpt-4o-mini", "v1")
+    assert clave == clave_veredicto("has ganado un premio", "gpt-4o-mini", "v1")
+    assert clave != clave_veredicto("has ganado un premio", "gpt-4o-mini", "v2")
+
+
+def test_analizar_con_ia_reutiliza_veredicto(monkeypatch):
+    llamadas = []
+
+    def analizar_falso(texto):
+        llamadas.append(texto)
+        return Veredicto("Estafa", 90, "prueba")
+
+    monkeypatch.setattr(inference, "_analizar", analizar_falso)
+    inference.cache_veredictos.memoria.limpiar()
+
+    async def escenario():
+        return await asyncio.gather(*(inference.analizar_con_ia("Envíe su clave ya") for _ in range(5)))
+
+    resultados = asyncio.run(escenario())
+    assert len(set(resultados)) == 1
+    assert resultados[0].riesgo == 90
+    assert inference.analizar_con_ia_sync("envíe su CLAVE ya") == resultados[0]
+    assert len(llamadas) == 1
+
+
+def test_cache_db_borra_los_veredictos_caducados_al_escribir():
+    from datetime import datetime, timedelta
+    from sqlalchemy import select
+    from app.core.cache import CacheVeredictos
+    from app.database import SessionLocal
+    from app.models import VeredictoCache
+
+    cache = CacheVeredictos(max_entradas=10, ttl=60, usar_db=True)
+
+    async def escenario():
+        async with SessionLocal() as db:
+            db.add(VeredictoCache(clave="caducado-limpieza", modelo="m", version_prompt="v", resultado="{}",
+                                  fecha_creacion=datetime.utcnow() - timedelta(seconds=120)))
+            await db.commit()
+        await cache.set_async("vigente-limpieza-1", "{}", "m", "v")
+        # Dentro de VEREDICTO_CACHE_LIMPIEZA la siguiente escritura no repite el borrado
+        async with SessionLocal() as db:
+            db.add(VeredictoCache(clave="caducado-limpieza-2", modelo="m", version_prompt="v", resultado="{}",
+                                  fecha_creacion=datetime.utcnow() - timedelta(seconds=120)))
+            await db.commit()
+        await cache.set_async("vigente-limpieza-2", "{}", "m", "v")
+        async with SessionLocal() as db:
+            return set((await db.execute(select(VeredictoCache.clave).where(VeredictoCache.clave.like("%limpieza%")))).scalars())
+
+    claves = asyncio.run(escenario())
+    assert claves == {"vigente-limpieza-1", "vigente-limpieza-2", "caducado-limpieza-2"}
+    assert cache.stats()["borrados_db"] == 1
@@ -0,0 +1,50 @@
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import DATABASE_URL, PoolMedido
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_pool_medido_cuenta_esperas_y_timeouts():
+    engine = create_async_engine(DATABASE_URL, poolclass=PoolMedido, pool_size=1, max_overflow=0, pool_timeout=0.2)
+    # dispose() sustituye el pool por uno nuevo: se guarda el que se mide
+    pool = engine.pool
+
+    async def escenario():
+        try:
+            async with engine.connect() as conexion:
+                await conexion.execute(text("SELECT 1"))
+                # Con la única conexión prestada, el siguiente checkout agota pool_timeout
+                with pytest.raises(exc.TimeoutError):
+                    async with engine.connect():
+                        pass
+            async with engine.connect() as conexion:
+                await conexion.execute(text("SELECT 1"))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(escenario())
+    assert pool.checkouts == 3
+    assert pool.timeouts == 1
+    assert pool.espera_max >= 0.2
+    assert pool.espera_total >= pool.espera_max
+
+
+def test_metricas_db_expone_el_pool_de_la_app():
+    # Una petición que usa la base de datos hace al menos un checkout
+    client.post("/register", json={"username": "pooldb", "email": "pooldb@example.com", "password": "testpass123"})
+    metricas = client.get("/metricas/db").json()
+    assert metricas["pool"] == "PoolMedido"
+    assert metricas["checkouts"] >= 1 and metricas["timeouts"] == 0
+    assert metricas["espera_media_ms"] >= 0 and metricas["espera_max_ms"] >= metricas["espera_media_ms"]
+    assert {"tamano", "libres", "overflow", "max_overflow"} <= metricas.keys()
@@ -0,0 +1,110 @@
+import sys
+import os
+import asyncio
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from app import escritura, models
+from app.database import SessionLocal
+
+
+async def _usuario(nombre):
+    async with SessionLocal() as db:
+        usuario = (await db.execute(select(models.Usuario).where(models.Usuario.username == nombre))).scalars().first()
+        if usuario is None:
+            usuario = models.Usuario(username=nombre, email=f"{nombre}@example.com", hashed_password="x")
+            db.add(usuario)
+            await db.commit()
+        return usuario.id
+
+
+async def _contar(usuario_id):
+    async with SessionLocal() as db:
+        return (await db.execute(select(func.count()).where(models.Analisis.usuario_id == usuario_id))).scalar()
+
+
+def test_escritor_inserta_por_lotes(monkeypatch):
+    monkeypatch.setattr(escritura, "ESCRITURA_LOTE_MAX", 20)
+    escritor = escritura.EscritorAnalisis()
+
+    async def escenario():
+        usuario_id = await _usuario("escritor_lotes")
+        antes = await _contar(usuario_id)
+        for i in range(50):
+            await escritor.encolar(usuario_id=usuario_id, texto_analizado=f"fragmento {i}", resultado="Riesgo: 1/100", origen="audio_stream")
+        await escritor.esperar_usuario(usuario_id, timeout=5)
+        return await _contar(usuario_id) - antes
+
+    assert asyncio.run(escenario()) == 50
+    assert escritor.stats["lotes"] <= 3
+
+
+def test_cola_llena_pasa_al_spool_y_se_reinserta(monkeypatch, tmp_path):
+    monkeypatch.setattr(escritura, "ESCRITURA_SPOOL", str(tmp_path / "pendientes.jsonl"))
+    monkeypatch.setattr(escritura, "ESCRITURA_ESPERA_MAX", 0.01)
+    escritor = escritura.EscritorAnalisis()
+
+    async def escenario():
+        usuario_id = await _usuario("escritor_spool")
+        antes = await _contar(usuario_id)
+        monkeypatch.setattr(escritura, "ESCRITURA_COLA_MAX", 0)
+        for i in range(3):
+            await escritor.encolar(usuario_id=usuario_id, texto_analizado=f"desbordado {i}", resultado="Riesgo: 1/100")
+        monkeypatch.setattr(escritura, "ESCRITURA_COLA_MAX", 100)
+        assert escritor.stats["a_spool"] == 3
+        await escritor.iniciar()
+        await escritor.esperar_usuario(usuario_id, timeout=5)
+        await escritor.cerrar()
+        return await _contar(usuario_id) - antes
+
+    assert asyncio.run(escenario()) == 3
+    assert not os.listdir(tmp_path)
+
+
+def test_sesion_se_guarda_como_una_sola_fila():
+    escritor = escritura.EscritorAnalisis()
+
+    async def escenario():
+        usuario_id = await _usuario("escritor_sesion")
+        for fragmento, riesgo in enumerate([20, 85, 40], start=1):
+            await escritor.encolar_sesion(usuario_id=usuario_id, session_id="llamada-1", origen="audio_stream",
+                                          transcripcion="hola " * fragmento, ultimo_resultado=f"Riesgo: {riesgo}/100",
+                                          riesgo_max=riesgo, fragmentos=fragmento)
+            await escritor.esperar_usuario(usuario_id, timeout=5)
+        async with SessionLocal() as db:
+            return (await db.execute(select(models.Sesion).where(models.Sesion.usuario_id == usuario_id))).scalars().all()
+
+    filas = asyncio.run(escenario())
+    assert len(filas) == 1
+    assert filas[0].fragmentos == 3
+    assert filas[0].riesgo_max == 85
+    assert filas[0].ultimo_resultado == "Riesgo: 40/100"
+
+
+def test_lote_rechazado_separa_la_fila_invalida_en_descartes(monkeypatch, tmp_path):
+    monkeypatch.setattr(escritura, "ESCRITURA_SPOOL", str(tmp_path / "pendientes.jsonl"))
+    monkeypatch.setattr(escritura, "ESCRITURA_DESCARTES", str(tmp_path / "descartados.jsonl"))
+    monkeypatch.setattr(escritura, "ESCRITURA_REINTENTOS", 1)
+    escritor = escritura.EscritorAnalisis()
+
+    async def escenario():
+        usuario_id = await _usuario("escritor_descartes")
+        antes = await _contar(usuario_id)
+        await escritor.encolar(usuario_id=usuario_id, texto_analizado="válido 1", resultado="Riesgo: 1/100")
+        # texto_analizado es NOT NULL: la fila hace fallar el lote entero en cada reintento
+        await escritor.encolar(usuario_id=usuario_id, texto_analizado=None, resultado="Riesgo: 1/100")
+        await escritor.encolar(usuario_id=usuario_id, texto_analizado="válido 2", resultado="Riesgo: 1/100")
+        await escritor.esperar_usuario(usuario_id, timeout=5)
+        await escritor.cerrar()
+        return await _contar(usuario_id) - antes
+
+    assert asyncio.run(escenario()) == 2
+    assert escritor.stats["descartadas"] == 1 and escritor.stats["a_spool"] == 0
+    assert os.listdir(tmp_path) == ["descartados.jsonl"]
+    with open(tmp_path / "descartados.jsonl", encoding="utf-8") as f:
+        descartadas = [json.loads(linea) for linea in f]
+    assert [(d["tabla"], d["texto_analizado"]) for d in descartadas] == [("analisis", None)]
@@ -0,0 +1,86 @@
+import sys
+import os
+import asyncio
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+from sqlalchemy.future import select
+
+from app import escritura, models
+from app.database import SessionLocal
+from app.main import app
+
+client = TestClient(app)
+
+
+def _token(username):
+    client.post("/register", json={"username": username, "email": f"{username}@example.com", "password": "testpass123"})
+    response = client.post("/login", data={"username": username, "password": "testpass123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_estadisticas_se_mantienen_al_crear_y_borrar():
+    headers = _token("estadisticas")
+    creados = []
+    for diagnostico, riesgo, origen in [("Estafa", 95, "manual"), ("Estafa", 100, "audio"), ("No Estafa", 10, "manual"), ("No Estafa", 12, "manual")]:
+        analisis = {"texto_analizado": "x", "resultado": "-", "diagnostico": diagnostico, "riesgo": riesgo, "origen": origen}
+        creados.append(client.post("/analisis", json=analisis, headers=headers).json()["id"])
+    assert client.delete(f"/analisis/{creados[-1]}", headers=headers).status_code == 204
+
+    resumen = client.get("/estadisticas/resumen", headers=headers).json()
+    assert resumen["total"] == 3
+    assert resumen["por_diagnostico"] == {"Estafa": 2, "No Estafa": 1}
+    assert resumen["riesgo_alto"] == 2
+    assert resumen["riesgo_medio"] == round((95 + 100 + 10) / 3, 1)
+
+    tramos = client.get("/estadisticas/riesgo", headers=headers).json()["tramos"]
+    assert [t["total"] for t in tramos] == [0, 1, 0, 0, 0, 0, 0, 0, 0, 2]
+
+    hoy = datetime.utcnow().date().isoformat()
+    tendencia = client.get("/estadisticas/tendencia", params={"por_origen": True}, headers=headers).json()
+    assert {(p["dia"], p["origen"], p["total"], p["estafas"]) for p in tendencia} == {(hoy, "audio", 1, 1), (hoy, "manual", 2, 1)}
+    assert client.get("/estadisticas/resumen", params={"desde": "2026-02-01", "hasta": "2026-01-01"}, headers=headers).status_code == 400
+
+
+def test_sesiones_en_vivo_cuentan_en_las_estadisticas():
+    headers = _token("estadisticas_sesiones")
+    escritor = escritura.EscritorAnalisis()
+
+    async def escenario():
+        async with SessionLocal() as db:
+            uid = (await db.execute(select(models.Usuario.id).where(models.Usuario.username == "estadisticas_sesiones"))).scalar()
+        # Sin veredicto no cuenta; después cambia de "No Estafa" a "Estafa" y solo cuenta el último
+        for diagnostico, riesgo in [(None, None), ("No Estafa", 10), ("Estafa", 90), (None, None)]:
+            await escritor.encolar_sesion(usuario_id=uid, session_id="llamada-estadisticas", origen="audio_stream",
+                                          transcripcion="hola", diagnostico=diagnostico, riesgo=riesgo, riesgo_max=riesgo, fragmentos=1)
+            await escritor.esperar_usuario(uid, timeout=5)
+        await escritor.cerrar()
+
+    asyncio.run(escenario())
+    resumen = client.get("/estadisticas/resumen", params={"origen": "audio_stream"}, headers=headers).json()
+    assert resumen["total"] == 1
+    assert resumen["por_diagnostico"] == {"Estafa": 1}
+    assert resumen["riesgo_medio"] == 90.0
+
+    assert client.delete("/sesiones/llamada-estadisticas", headers=headers).status_code == 204
+    assert client.get("/estadisticas/resumen", params={"origen": "audio_stream"}, headers=headers).json()["total"] == 0
+
+
+def test_primera_escritura_concurrente_de_una_sesion_cuenta_una_vez():
+    headers = _token("estadisticas_concurrentes")
+
+    async def escenario():
+        async with SessionLocal() as db:
+            uid = (await db.execute(select(models.Usuario.id).where(models.Usuario.username == "estadisticas_concurrentes"))).scalar()
+        ahora = datetime.utcnow()
+        estado = {"usuario_id": uid, "session_id": "llamada-concurrente", "origen": "audio_stream", "transcripcion": "hola",
+                  "diagnostico": "Estafa", "riesgo": 90, "explicacion": None, "ultimo_resultado": None, "riesgo_max": 90,
+                  "fragmentos": 1, "fecha_inicio": ahora, "fecha_actualizacion": ahora}
+        # Dos workers escriben a la vez el primer estado de la misma sesión
+        await asyncio.gather(*(escritura.EscritorAnalisis()._escribir([], [dict(estado)]) for _ in range(2)))
+
+    asyncio.run(escenario())
+    resumen = client.get("/estadisticas/resumen", params={"origen": "audio_stream"}, headers=headers).json()
+    assert resumen["total"] == 1
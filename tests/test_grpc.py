@@ -0,0 +1,340 @@
+import sys
+import os
+import asyncio
+import json
+import queue
+import signal
+import socket
+import subprocess
+import threading
+import time
+import urllib.request
+from concurrent import futures
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import grpc
+
+from app import grpc_server, grpc_supervisor
+import app.proto.fraud_detection_pb2 as fraud_detection_pb2
+import app.proto.fraud_detection_pb2_grpc as fraud_detection_pb2_grpc
+from app.core import metricas as registro_metricas
+from app.core.veredicto import Veredicto
+from benchmarks import openai_falso
+from benchmarks.wav_sinteticos import conversacion
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Tres frases de 2 s con pausas de 1 s: el segmentador cierra un segmento por frase
+WAV = conversacion(frases=3)
+CORTE = 44 + 2 * 3 * 32000    # Cabecera y las dos primeras frases con sus pausas
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _fragmentos(desde, hasta):
+    for inicio in range(desde, hasta, 8000):
+        yield fraud_detection_pb2.AudioChunk(data=WAV[inicio:min(inicio + 8000, hasta)])
+
+
+def _transcripcion_desordenada():
+    """Whisper falso en el que cada segmento tarda menos que el anterior."""
+    llamadas = []
+
+    def texto(segmento):
+        n = len(llamadas)
+        llamadas.append(n)
+        return n, f"frase{n} le llamo de su banco"
+
+    async def transcribir(segmento):
+        n, resultado = texto(segmento)
+        await asyncio.sleep(0.3 - 0.1 * n)
+        return resultado
+
+    def transcribir_sync(segmento):
+        n, resultado = texto(segmento)
+        time.sleep(0.3 - 0.1 * n)
+        return resultado
+
+    return transcribir, transcribir_sync
+
+
+def test_servidor_aio_responde_por_segmento_y_en_orden(monkeypatch):
+    transcribir, _ = _transcripcion_desordenada()
+
+    async def analizar(texto):
+        return Veredicto("Estafa", 90, "Pide datos bancarios")
+
+    monkeypatch.setattr(grpc_server, "transcribir_audio", transcribir)
+    monkeypatch.setattr(grpc_server, "analizar_con_ia", analizar)
+
+    async def escenario():
+        server = grpc.aio.server()
+        fraud_detection_pb2_grpc.add_FraudDetectionServicer_to_server(grpc_server.AsyncFraudDetectionServicer(), server)
+        puerto = server.add_insecure_port("127.0.0.1:0")
+        await server.start()
+        primero = asyncio.Event()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{puerto}") as canal:
+                stub = fraud_detection_pb2_grpc.FraudDetectionStub(canal)
+
+                async def peticiones():
+                    for fragmento in _fragmentos(0, CORTE):
+                        yield fragmento
+                    # El primer resultado llega sin que el cliente envíe nada más
+                    await asyncio.wait_for(primero.wait(), 5)
+                    for fragmento in _fragmentos(CORTE, len(WAV)):
+                        yield fragmento
+
+                resultados = []
+                async for resultado in stub.StreamAudio(peticiones()):
+                    resultados.append(resultado)
+                    primero.set()
+                return resultados
+        finally:
+            await server.stop(0)
+
+    resultados = asyncio.run(escenario())
+    assert [r.transcripcion.split()[0] for r in resultados] == ["frase0", "frase1", "frase2"]
+    assert all(r.riesgo == 90 and r.diagnostico.startswith("Diagnóstico: Estafa") for r in resultados)
+
+
+def test_servidor_aio_omite_el_segmento_fallido_sin_perder_los_siguientes(monkeypatch):
+    transcribir, _ = _transcripcion_desordenada()
+    analisis = []
+
+    async def analizar(texto):
+        analisis.append(texto)
+        if len(analisis) == 1:
+            raise RuntimeError("fallo puntual del análisis")
+        return Veredicto("Estafa", 90, "Pide datos bancarios")
+
+    monkeypatch.setattr(grpc_server, "transcribir_audio", transcribir)
+    monkeypatch.setattr(grpc_server, "analizar_con_ia", analizar)
+
+    async def escenario():
+        server = grpc.aio.server()
+        fraud_detection_pb2_grpc.add_FraudDetectionServicer_to_server(grpc_server.AsyncFraudDetectionServicer(), server)
+        puerto = server.add_insecure_port("127.0.0.1:0")
+        await server.start()
+        try:
+            async with grpc.aio.insecure_channel(f"127.0.0.1:{puerto}") as canal:
+                stub = fraud_detection_pb2_grpc.FraudDetectionStub(canal)
+                return [resultado async for resultado in stub.StreamAudio(_fragmentos(0, len(WAV)))]
+        finally:
+            await server.stop(0)
+
+    resultados = asyncio.run(escenario())
+    # El primer segmento falla; los siguientes no heredan su excepción
+    assert [r.transcripcion.split()[0] for r in resultados] == ["frase1", "frase2"]
+
+
+def test_servidor_hilos_responde_por_segmento_y_en_orden(monkeypatch):
+    _, transcribir_sync = _transcripcion_desordenada()
+    monkeypatch.setattr(grpc_server, "transcribir_audio_sync", transcribir_sync)
+    monkeypatch.setattr(grpc_server, "analizar_con_ia_sync", lambda texto: Veredicto("No Estafa", 10, "Conversación normal"))
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    fraud_detection_pb2_grpc.add_FraudDetectionServicer_to_server(grpc_server.FraudDetectionServicer(), server)
+    puerto = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    primero = threading.Event()
+
+    def peticiones():
+        yield from _fragmentos(0, CORTE)
+        assert primero.wait(5)
+        yield from _fragmentos(CORTE, len(WAV))
+
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{puerto}") as canal:
+            resultados = []
+            for resultado in fraud_detection_pb2_grpc.FraudDetectionStub(canal).StreamAudio(peticiones()):
+                resultados.append(resultado)
+                primero.set()
+    finally:
+        server.stop(0)
+    assert [r.transcripcion.split()[0] for r in resultados] == ["frase0", "frase1", "frase2"]
+    assert [r.riesgo for r in resultados] == [10, 10, 10]
+
+
+def test_servidor_hilos_omite_el_segmento_fallido_sin_perder_los_siguientes(monkeypatch):
+    _, transcribir_sync = _transcripcion_desordenada()
+    analisis = []
+
+    def analizar_sync(texto):
+        analisis.append(texto)
+        if len(analisis) == 1:
+            raise RuntimeError("fallo puntual del análisis")
+        return Veredicto("No Estafa", 10, "Conversación normal")
+
+    monkeypatch.setattr(grpc_server, "transcribir_audio_sync", transcribir_sync)
+    monkeypatch.setattr(grpc_server, "analizar_con_ia_sync", analizar_sync)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    fraud_detection_pb2_grpc.add_FraudDetectionServicer_to_server(grpc_server.FraudDetectionServicer(), server)
+    puerto = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{puerto}") as canal:
+            resultados = list(fraud_detection_pb2_grpc.FraudDetectionStub(canal).StreamAudio(_fragmentos(0, len(WAV))))
+    finally:
+        server.stop(0)
+    # El primer segmento falla; los siguientes no heredan su excepción
+    assert [r.transcripcion.split()[0] for r in resultados] == ["frase1", "frase2"]
+
+
+def _entorno(**variables):
+    entorno = {**os.environ, "PYTHONPATH": RAIZ, "OPENAI_API_KEY": "sk-test", **variables}
+    return {clave: str(valor) for clave, valor in entorno.items()}
+
+
+def test_sigterm_drena_los_streams_activos():
+    servidor_openai, url = openai_falso.iniciar(latencia_chat=0, latencia_audio=1.0)
+    puerto = _puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "app", "grpc_server.py")],
+        env=_entorno(GRPC_PUERTO=puerto, GRPC_GRACIA=10, OPENAI_BASE_URL=url),
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    enviado = threading.Event()
+
+    def peticiones():
+        yield from _fragmentos(0, len(WAV))
+        enviado.set()
+
+    try:
+        with grpc.insecure_channel(f"127.0.0.1:{puerto}") as canal:
+            grpc.channel_ready_future(canal).result(timeout=30)
+            respuestas = fraud_detection_pb2_grpc.FraudDetectionStub(canal).StreamAudio(peticiones())
+            hilo = threading.Thread(target=lambda: enviado.wait(10) and time.sleep(0.3) or proceso.send_signal(signal.SIGTERM))
+            hilo.start()
+            # Las transcripciones siguen en curso al llegar SIGTERM: el stream termina igualmente
+            resultados = list(respuestas)
+            hilo.join()
+        assert len(resultados) == 3 and all(r.transcripcion for r in resultados)
+        assert proceso.wait(timeout=15) == 0
+        assert "Servidor gRPC detenido" in proceso.stdout.read()
+    finally:
+        if proceso.poll() is None:
+            proceso.kill()
+        servidor_openai.shutdown()
+
+
+class _ProcesoFalso:
+    def __init__(self, vivo=True, pid=1000, exitcode=None):
+        self.vivo, self.pid, self.exitcode = vivo, pid, exitcode
+
+    def is_alive(self):
+        return self.vivo
+
+
+def test_vigilar_no_espera_a_los_workers(monkeypatch):
+    supervisor = grpc_supervisor.Supervisor(workers=2)
+    arrancados = []
+    monkeypatch.setattr(supervisor, "arrancar", lambda indice: arrancados.append(indice))
+    sin_calentar, caido = threading.Event(), threading.Event()
+    ahora = time.monotonic()
+    supervisor.procesos = {
+        0: (_ProcesoFalso(), ahora, sin_calentar),
+        1: (_ProcesoFalso(vivo=False, exitcode=1), ahora, caido),
+    }
+    inicio = time.monotonic()
+    supervisor.vigilar()
+    # El worker sin calentar no bloquea y el caído se relanza en la siguiente pasada (primer fallo: sin espera)
+    assert time.monotonic() - inicio < 0.5
+    supervisor.vigilar()
+    assert arrancados == [1]
+    assert supervisor.reinicios == {1: 1}
+    sin_calentar.set()
+    supervisor.vigilar()
+    assert supervisor.listos == {0}
+
+
+def test_supervisor_agrega_las_metricas_de_los_workers():
+    supervisor = grpc_supervisor.Supervisor(workers=2)
+    instantanea = registro_metricas.instantanea()
+    for indice, pid in ((0, 101), (1, 102)):
+        metricas = {"streams_totales": 3 + indice, "streams_activos": 1, "cache_ratio_aciertos": 0.5}
+        supervisor.cola_metricas.put((indice, pid, metricas, instantanea))
+    time.sleep(0.2)
+    resumen = supervisor.resumen()
+    assert resumen["total"] == {"streams_totales": 7, "streams_activos": 2}
+    assert resumen["por_worker"][1]["pid"] == 102
+    assert f"{registro_metricas.PREFIJO}grpc_streams_totales 7" in supervisor.prometheus()
+
+
+def test_resumen_admite_scrapes_concurrentes_con_el_bucle_principal(monkeypatch):
+    supervisor = grpc_supervisor.Supervisor(workers=50)
+    monkeypatch.setattr(supervisor, "arrancar", lambda indice: None)
+    supervisor.cola_metricas = queue.Queue()
+    supervisor.procesos = {i: (_ProcesoFalso(vivo=False, exitcode=1), 0, threading.Event()) for i in range(50)}
+    instantanea = registro_metricas.instantanea()
+    errores, fin = [], threading.Event()
+
+    def scrape():
+        # Lo que hace cada hilo del servidor de métricas al atender /metricas y /metrics
+        while not fin.is_set():
+            try:
+                json.dumps(supervisor.resumen())
+                supervisor.prometheus()
+            except Exception as e:
+                errores.append(e)
+
+    hilos = [threading.Thread(target=scrape) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    try:
+        # Bucle principal: llegan métricas de todos los workers y después se caen todos
+        for _ in range(100):
+            for indice in range(50):
+                supervisor.cola_metricas.put((indice, 1000 + indice, {"streams_totales": 1}, instantanea))
+            supervisor.recoger_metricas()
+            supervisor.reinicio_en.clear()
+            supervisor.vigilar()
+    finally:
+        fin.set()
+        for hilo in hilos:
+            hilo.join()
+    assert errores == []
+    assert supervisor.resumen()["por_worker"] is not supervisor.metricas
+
+
+def test_supervisor_reinicia_workers_y_reenvia_sigterm():
+    servidor_openai, url = openai_falso.iniciar(latencia_chat=0, latencia_audio=0)
+    puerto_metricas = _puerto_libre()
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(RAIZ, "app", "grpc_supervisor.py")],
+        env=_entorno(GRPC_WORKERS=2, GRPC_PUERTO=_puerto_libre(), GRPC_METRICAS_PUERTO=puerto_metricas,
+                     GRPC_METRICAS_INTERVALO=0.2, GRPC_GRACIA=2, OPENAI_BASE_URL=url),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    def esperar_resumen(condicion, limite=60):
+        fin = time.monotonic() + limite
+        while time.monotonic() < fin:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{puerto_metricas}/metricas", timeout=2) as respuesta:
+                    resumen = json.load(respuesta)
+                if condicion(resumen):
+                    return resumen
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise AssertionError("el supervisor no llegó al estado esperado")
+
+    try:
+        resumen = esperar_resumen(lambda r: r["listos"] == 2 and len(r["por_worker"]) == 2)
+        assert resumen["total"]["streams_totales"] == 0
+        caido = resumen["por_worker"]["0"]["pid"]
+        os.kill(caido, signal.SIGKILL)
+        resumen = esperar_resumen(lambda r: r["reinicios"] == 1 and r["listos"] == 2
+                                  and r["por_worker"].get("0", {}).get("pid") not in (None, caido))
+        assert resumen["vivos"] == 2
+        proceso.send_signal(signal.SIGTERM)
+        assert proceso.wait(timeout=15) == 0
+    finally:
+        if proceso.poll() is None:
+            proceso.kill()
+        servidor_openai.shutdown()
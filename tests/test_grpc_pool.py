@@ -0,0 +1,116 @@
+import sys
+import os
+import asyncio
+import socket
+import time
+from concurrent import futures
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import grpc
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main, grpc_pool
+from app.grpc_pool import PoolCanales, GrpcNoDisponible
+from app.main import app
+import app.proto.fraud_detection_pb2 as fraud_detection_pb2
+import app.proto.fraud_detection_pb2_grpc as fraud_detection_pb2_grpc
+from benchmarks.wav_sinteticos import voz
+
+client = TestClient(app)
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServicerFalso(fraud_detection_pb2_grpc.FraudDetectionServicer):
+    """Servicio gRPC de prueba: ``modo`` decide si responde, falla o se pasa del deadline."""
+
+    def __init__(self):
+        self.modo = "ok"
+
+    def StreamAudio(self, request_iterator, context):
+        recibidos = sum(len(chunk.data) for chunk in request_iterator)
+        if self.modo == "error":
+            context.abort(grpc.StatusCode.INTERNAL, "fallo del modelo")
+        if self.modo == "lento":
+            time.sleep(1)
+        yield fraud_detection_pb2.TranscriptionResult(transcripcion="le llamo", diagnostico="", riesgo=20)
+        yield fraud_detection_pb2.TranscriptionResult(transcripcion=f"de su banco {recibidos}", diagnostico="Diagnóstico: Estafa", riesgo=85)
+
+
+@pytest.fixture
+def servidor():
+    servicer = ServicerFalso()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    fraud_detection_pb2_grpc.add_FraudDetectionServicer_to_server(servicer, server)
+    puerto = server.add_insecure_port("127.0.0.1:0")
+    server.start()
+    yield servicer, f"127.0.0.1:{puerto}"
+    server.stop(0)
+
+
+def test_pool_reparte_canales_y_cierra_los_del_loop_anterior(servidor):
+    _, destino = servidor
+    pool = PoolCanales(destino=destino, tamano=2)
+
+    async def dos_stubs():
+        await pool.stub()
+        await asyncio.gather(*(canal.channel_ready() for canal in pool._canales))
+        return await pool.stub(), await pool.stub(), list(pool._canales)
+
+    primero, segundo, canales = asyncio.run(dos_stubs())
+    # Con los dos canales conectados, round-robin entre ellos
+    assert primero is not segundo
+    assert all(canal.get_state() == grpc.ChannelConnectivity.READY for canal in canales)
+    # Otro event loop (reinicio de la app en el mismo proceso): canales nuevos y los viejos cerrados
+    _, _, nuevos = asyncio.run(dos_stubs())
+    assert not set(nuevos) & set(canales)
+    assert all(canal.get_state() == grpc.ChannelConnectivity.SHUTDOWN for canal in canales)
+    asyncio.run(pool.cerrar())
+
+
+def test_pool_sin_servidor_lanza_grpc_no_disponible(monkeypatch):
+    monkeypatch.setattr(grpc_pool, "GRPC_TIMEOUT_CONEXION", 0.3)
+    pool = PoolCanales(destino=f"127.0.0.1:{_puerto_libre()}", tamano=2)
+
+    async def escenario():
+        try:
+            with pytest.raises(GrpcNoDisponible):
+                await pool.stub()
+        finally:
+            await pool.cerrar()
+
+    asyncio.run(escenario())
+
+
+def _analizar():
+    return client.post("/analizar-audio-grpc", files={"file": ("llamada.wav", voz(1.0), "audio/wav")})
+
+
+def test_analizar_audio_grpc_une_resultados_y_traduce_errores(servidor, monkeypatch):
+    servicer, destino = servidor
+    monkeypatch.setattr(main, "canales_grpc", PoolCanales(destino=destino, tamano=1))
+
+    response = _analizar()
+    assert response.status_code == 200
+    datos = response.json()
+    assert datos["transcripcion"].startswith("le llamo de su banco")
+    assert datos["diagnostico"] == "Diagnóstico: Estafa" and datos["riesgo"] == 85
+    # El audio llega completo aunque se envíe por bloques de GRPC_CHUNK_BYTES
+    assert int(datos["transcripcion"].split()[-1]) == len(voz(1.0))
+
+    servicer.modo = "error"
+    assert _analizar().status_code == 502
+
+    servicer.modo = "lento"
+    monkeypatch.setattr(main, "GRPC_DEADLINE", 0.3)
+    assert _analizar().status_code == 504
+
+    monkeypatch.setattr(grpc_pool, "GRPC_TIMEOUT_CONEXION", 0.3)
+    monkeypatch.setattr(main, "canales_grpc", PoolCanales(destino=f"127.0.0.1:{_puerto_libre()}", tamano=1))
+    assert _analizar().status_code == 503
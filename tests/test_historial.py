@@ -0,0 +1,63 @@
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from app import models
+from app.database import SessionLocal
+from app.main import app, RESUMEN_CARACTERES
+
+client = TestClient(app)
+
+
+def _token(username):
+    client.post("/register", json={"username": username, "email": f"{username}@example.com", "password": "testpass123"})
+    response = client.post("/login", data={"username": username, "password": "testpass123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_historial_paginado_por_cursor():
+    headers = _token("historial")
+    creados = []
+    for i in range(5):
+        analisis = {"texto_analizado": f"mensaje {i} " + "x" * 300, "resultado": "Riesgo: 10/100", "origen": "manual" if i % 2 else "audio"}
+        creados.append(client.post("/analisis", json=analisis, headers=headers).json()["id"])
+
+    vistos, cursor = [], None
+    while True:
+        params = {"limite": 2, "campos": "resumen", **({"cursor": cursor} if cursor else {})}
+        response = client.get("/analisis", params=params, headers=headers)
+        assert response.status_code == 200
+        pagina = response.json()
+        assert len(pagina) <= 2
+        assert all(len(item["texto_analizado"]) <= RESUMEN_CARACTERES for item in pagina)
+        vistos += [item["id"] for item in pagina]
+        cursor = response.headers.get("X-Siguiente-Cursor")
+        if not cursor:
+            break
+    assert vistos[:5] == sorted(creados, reverse=True)
+
+    manuales = client.get("/analisis", params={"origen": "manual"}, headers=headers).json()
+    assert {item["origen"] for item in manuales} == {"manual"}
+    assert client.get("/analisis", params={"cursor": "no-es-un-cursor"}, headers=headers).status_code == 400
+
+
+def test_borrar_un_analisis_recien_encolado():
+    headers = _token("historial_borrado")
+    # Vacía lo pendiente de este usuario antes de calcular el id que tendrá la fila nueva
+    client.get("/analisis", headers=headers)
+
+    async def ultimo_id():
+        async with SessionLocal() as db:
+            return (await db.execute(select(func.max(models.Analisis.id)))).scalar() or 0
+
+    siguiente = asyncio.run(ultimo_id()) + 1
+    assert client.post("/analizar-texto", json={"texto": "Mensaje para borrar enseguida"}, headers=headers).status_code == 200
+    # La fila va por el escritor diferido: el DELETE espera a que esté escrita en lugar de responder 404
+    assert client.delete(f"/analisis/{siguiente}", headers=headers).status_code == 204
+    assert client.get("/analisis", headers=headers).json() == []
@@ -0,0 +1,39 @@
+import sys
+import os
+import asyncio
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from openai import OpenAI
+
+from app.core import inference
+from benchmarks import openai_falso
+from benchmarks.wav_sinteticos import voz
+
+
+def _transcripciones_en_curso():
+    return inference.INFERENCIAS_EN_CURSO.instantanea()["series"].get((inference.MODELO_TRANSCRIPCION,), 0)
+
+
+def test_el_timeout_total_tambien_corta_la_llamada_a_openai(monkeypatch):
+    servidor, url = openai_falso.iniciar(latencia_chat=0, latencia_audio=2.0)
+    monkeypatch.setattr(inference, "_client", OpenAI(api_key="sk-test", base_url=url, timeout=30, max_retries=2))
+    monkeypatch.setattr(inference, "INFERENCIA_TIMEOUT", 0.5)
+    try:
+        antes = _transcripciones_en_curso()
+        texto = asyncio.run(inference.transcribir_audio(voz(0.5)))
+        assert texto == "Error en la transcripción con Whisper: tiempo de espera agotado"
+        # El hilo del pool queda libre justo después del timeout, no cuando OpenAI responde (2 s)
+        fin = time.monotonic() + 0.8
+        while _transcripciones_en_curso() > antes and time.monotonic() < fin:
+            time.sleep(0.02)
+        assert _transcripciones_en_curso() == antes
+        assert servidor.stats["transcripciones"] == 1
+
+        # Una petición que agotó el timeout esperando en la cola ya no llama a OpenAI
+        vencido = inference._con_limite(time.monotonic() - 1, inference._transcribir, voz(0.5))
+        assert vencido.endswith("tiempo de espera agotado")
+        assert servidor.stats["transcripciones"] == 1
+    finally:
+        servidor.shutdown()
@@ -0,0 +1,113 @@
+import sys
+import os
+import json
+import asyncio
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core import inference
+
+client = TestClient(app)
+
+
+def _token(username):
+    client.post("/register", json={"username": username, "email": f"{username}@example.com", "password": "testpass123"})
+    response = client.post("/login", data={"username": username, "password": "testpass123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_lote_agrupa_deduplica_y_devuelve_ndjson(monkeypatch):
+    llamadas = []
+
+    def completar_falso(prompt):
+        if "Mensajes (lista JSON)" not in prompt:
+            llamadas.append(1)
+            return json.dumps({"diagnostico": "No Estafa", "explicacion": "suelto", "riesgo": 3})
+        mensajes = json.loads(prompt.split("Mensajes (lista JSON):", 1)[1])
+        llamadas.append(len(mensajes))
+        # El modelo se salta el último mensaje del paquete: ese se repite por separado
+        return json.dumps({"resultados": [
+            {"id": m["id"], "diagnostico": "Estafa" if "clave" in m["texto"].lower() else "No Estafa", "explicacion": "lote", "riesgo": 90 if "clave" in m["texto"].lower() else 5}
+            for m in mensajes[:-1]
+        ]})
+
+    monkeypatch.setattr(inference, "_completar", completar_falso)
+    monkeypatch.setattr(inference, "ANALISIS_LOTE_MENSAJES", 10)
+    inference.cache_veredictos.memoria.limpiar()
+
+    textos = ["Envíe su CLAVE", "envíe su clave"] + [f"lote mensaje {i}" for i in range(18)] + ["", "x" * (inference.ANALISIS_LOTE_MENSAJE_MAX + 1)]
+    response = client.post("/analizar-texto/batch", json={"mensajes": [{"texto": t, "id": f"m{i}"} for i, t in enumerate(textos)]}, headers=_token("lote"))
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lineas = [json.loads(l) for l in response.text.splitlines()]
+
+    assert sorted(l["indice"] for l in lineas) == list(range(len(textos)))
+    por_indice = {l["indice"]: l for l in lineas}
+    assert por_indice[20]["error"] == "Texto vacío"
+    assert por_indice[0]["veredicto"] == por_indice[1]["veredicto"] == {"diagnostico": "Estafa", "riesgo": 90, "explicacion": "lote"}
+    assert por_indice[5]["id"] == "m5"
+    # 19 textos distintos: 2 paquetes de 10 y 9, los 2 omitidos y el largo por separado
+    assert sorted(llamadas) == [1, 1, 1, 9, 10]
+
+
+def _lote(textos):
+    async def escenario():
+        return dict([par async for par in inference.analizar_lote(textos)])
+    return asyncio.run(escenario())
+
+
+def test_lote_repite_por_separado_si_falla_o_expira_la_llamada_empaquetada(monkeypatch):
+    llamadas = []
+
+    def completar_falso(prompt):
+        if "Mensajes (lista JSON)" in prompt:
+            llamadas.append("paquete")
+            if modo == "error":
+                raise RuntimeError("respuesta truncada")
+            time.sleep(0.3)
+        llamadas.append("suelto")
+        return json.dumps({"diagnostico": "No Estafa", "explicacion": "suelto", "riesgo": 4})
+
+    monkeypatch.setattr(inference, "_completar", completar_falso)
+    monkeypatch.setattr(inference, "INFERENCIA_TIMEOUT", 0.2)
+    for modo in ("error", "timeout"):
+        inference.cache_veredictos.memoria.limpiar()
+        llamadas.clear()
+        veredictos = _lote([f"{modo} paquete fallido {i}" for i in range(3)])
+        # Ningún mensaje hereda el error del paquete: cada uno tiene su veredicto
+        assert sorted(veredictos) == [0, 1, 2]
+        assert all(v.diagnostico == "No Estafa" and not v.es_error for v in veredictos.values())
+        assert llamadas.count("paquete") == 1
+
+
+def test_lote_consulta_la_cache_de_la_base_en_una_sola_lectura(monkeypatch):
+    from app.core.cache import clave_veredicto
+    from app.core.veredicto import Veredicto
+
+    cache = inference.cache_veredictos
+    monkeypatch.setattr(cache, "usar_db", True)
+    textos = [f"mensaje cacheado en base {i}" for i in range(5)]
+
+    async def guardar():
+        for texto in textos:
+            clave = clave_veredicto(texto, inference.MODELO_ANALISIS, inference.VERSION_PROMPT)
+            await cache.set_async(clave, Veredicto("No Estafa", 7, "base").a_json(), inference.MODELO_ANALISIS, inference.VERSION_PROMPT)
+    asyncio.run(guardar())
+    cache.memoria.limpiar()
+
+    lecturas = []
+    original = cache._leer_varios_db
+
+    async def leer_varios_contado(claves):
+        lecturas.append(len(claves))
+        return await original(claves)
+
+    monkeypatch.setattr(cache, "_leer_varios_db", leer_varios_contado)
+    monkeypatch.setattr(inference, "_completar", lambda prompt: (_ for _ in ()).throw(AssertionError("no debe llamar al modelo")))
+    veredictos = _lote(textos)
+    assert lecturas == [5]
+    assert all(v.explicacion == "base" for v in veredictos.values())
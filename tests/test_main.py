@@ -74,12 +74,15 @@ def test_transcribir_audio_wav():
 #     assert "transcripcion" in data
 #     assert "diagnostico" in data
 #     assert "riesgo" in data
-#
-# def test_analizar_audio_stream():
-#     with open("tests/audio_test.wav", "rb") as audio:
-#         response = client.post("/analizar-audio-stream", files={"file": ("audio_test.wav", audio, "audio/wav")})
-#     assert response.status_code == 200
-#     data = response.json()
-#     assert "transcripcion" in data
-#     assert "diagnostico" in data
-#     assert "session_id" in data
+
+def test_analizar_audio_stream():
+    # Audio sintético y OpenAI simulado (tests/conftest.py): no hace falta un .wav ni red
+    from benchmarks.wav_sinteticos import voz
+    token = test_register_and_login()
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post("/analizar-audio-stream?session_id=smoke-1", files={"file": ("audio.wav", voz(2.0), "audio/wav")}, headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["transcripcion"]
+    assert "diagnostico" in data
+    assert data["session_id"] == "smoke-1"
@@ -0,0 +1,36 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core import metricas
+
+client = TestClient(app)
+
+
+def test_histograma_acumula_cubos_y_combina_procesos():
+    histograma = metricas.Histograma("prueba_segundos", "Prueba", ("etapa",), limites=(0.1, 1.0))
+    for valor in (0.05, 0.5, 5.0):
+        histograma.observar(valor, "x")
+    datos = {histograma.nombre: histograma.instantanea()}
+    texto = metricas.formatear(metricas.combinar([datos, datos]))
+    assert 'fraudwatch_prueba_segundos_bucket{etapa="x",le="0.1"} 2' in texto
+    assert 'fraudwatch_prueba_segundos_bucket{etapa="x",le="1.0"} 4' in texto
+    assert 'fraudwatch_prueba_segundos_bucket{etapa="x",le="+Inf"} 6' in texto
+    assert 'fraudwatch_prueba_segundos_count{etapa="x"} 6' in texto
+
+
+def test_metrics_expone_etapas_y_rutas():
+    client.post("/register", json={"username": "metricas", "email": "metricas@example.com", "password": "testpass123"})
+    token = client.post("/login", data={"username": "metricas", "password": "testpass123"}).json()["access_token"]
+    client.get("/sesiones", headers={"Authorization": f"Bearer {token}"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'fraudwatch_etapa_segundos_count{etapa="auth"}' in response.text
+    assert 'fraudwatch_etapa_segundos_count{etapa="hash"}' in response.text
+    assert 'fraudwatch_http_segundos_count{metodo="GET",ruta="/sesiones",estado="200"}' in response.text
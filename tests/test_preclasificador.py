@@ -0,0 +1,48 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.preclasificador import Preclasificador, ModeloLineal, entrenar, evaluar, indicios, normalizar
+from app.core.veredicto import Diagnostico
+
+ESTAFAS = [
+    "Su cuenta ha sido bloqueada, introduzca su clave en https://banco-seguro.xyz",
+    "Hola mamá, se me ha roto el móvil y este es mi número nuevo, hazme un bizum",
+    "Su paquete está retenido en aduana, pague la tasa de 2 € en www.envios-correos.info",
+    "Ha ganado un premio, reclame su regalo urgente",
+]
+NORMALES = [
+    "¿Quedamos a las ocho en la puerta del cine?",
+    "Te dejo la compra en la cocina",
+    "La reunión de mañana se pasa a las diez",
+    "Feliz cumpleaños, a ver si nos vemos pronto",
+]
+
+
+def _ejemplos():
+    return [(t, True) for t in ESTAFAS] * 20 + [(t, False) for t in NORMALES] * 20
+
+
+def test_indicios_sin_tildes():
+    encontrados = indicios(normalizar("URGENTE: su contraseña y el código de verificación en http://x.xyz"))
+    assert {"urgencia", "datos_sensibles", "enlace"} <= encontrados
+
+
+def test_resuelve_casos_claros_y_escala_los_dudosos(tmp_path):
+    ruta = tmp_path / "modelo.json"
+    entrenar(_ejemplos()).guardar(str(ruta))
+    clasificador = Preclasificador(ModeloLineal.cargar(str(ruta)), activo=True)
+
+    estafa = clasificador.clasificar(ESTAFAS[0])
+    assert estafa.diagnostico == Diagnostico.ESTAFA and estafa.riesgo >= 97
+    assert clasificador.clasificar(NORMALES[0]).diagnostico == Diagnostico.NO_ESTAFA
+    assert clasificador.clasificar("Mensaje") is None
+
+    estado = clasificador.estado()
+    assert (estado["estafa"], estado["benigno"], estado["escalados"]) == (1, 1, 1)
+    assert evaluar(clasificador.modelo, _ejemplos())["precision_estafa"] == 1.0
+
+
+def test_inactivo_no_clasifica():
+    assert Preclasificador(activo=False).clasificar(ESTAFAS[0]) is None
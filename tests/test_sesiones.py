@@ -0,0 +1,66 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core import sesiones
+from app.core.sesiones import EstadoSesion, GestorSesiones
+from app.core.veredicto import Veredicto
+
+
+def test_ventana_conserva_las_ultimas_palabras(monkeypatch):
+    monkeypatch.setattr(sesiones, "SESION_VENTANA_PALABRAS", 5)
+    estado = EstadoSesion()
+    estado.agregar("uno dos tres")
+    estado.agregar("cuatro cinco seis siete")
+    assert estado.ventana() == "tres cuatro cinco seis siete"
+    # La transcripción completa no se recorta
+    assert estado.transcripcion() == "uno dos tres cuatro cinco seis siete"
+    assert estado.fragmentos == 2
+
+
+def test_solo_reanaliza_con_suficiente_texto_nuevo(monkeypatch):
+    monkeypatch.setattr(sesiones, "SESION_UMBRAL_PALABRAS", 4)
+    estado = EstadoSesion()
+    assert not estado.requiere_analisis()
+    # Sin veredicto previo basta con una palabra
+    estado.agregar("hola")
+    assert estado.requiere_analisis()
+    estado.registrar_veredicto(Veredicto("No Estafa", 10, "saludo"))
+    estado.agregar("le llamo")
+    assert not estado.requiere_analisis()
+    estado.agregar("de su banco")
+    assert estado.requiere_analisis()
+
+
+def test_reutiliza_el_veredicto_previo_si_el_nuevo_falla(monkeypatch):
+    monkeypatch.setattr(sesiones, "SESION_UMBRAL_PALABRAS", 4)
+    estado = EstadoSesion()
+    estado.agregar("le llamo de su banco")
+    estado.registrar_veredicto(Veredicto("Estafa", 80, "pide datos"))
+    estado.agregar("necesito su clave ahora")
+    assert estado.requiere_analisis()
+    estado.registrar_veredicto(Veredicto.de_error("Error en el análisis con OpenAI: tiempo de espera agotado"))
+    # El error no sustituye al veredicto anterior y el texto sigue pendiente: se reintenta en el próximo fragmento
+    assert estado.veredicto.riesgo == 80
+    assert estado.ultimo_resultado == estado.veredicto.texto
+    assert estado.requiere_analisis()
+    estado.registrar_veredicto(Veredicto("Estafa", 60, "insiste"))
+    assert estado.veredicto.riesgo == 60 and estado.riesgo_max == 80
+    assert estado.palabras_pendientes == 0
+
+
+def test_gestor_reutiliza_la_sesion_y_la_expira_por_inactividad():
+    gestor = GestorSesiones(max_sesiones=10, ttl=0.05)
+    estado, nueva = gestor.obtener(1, "s1")
+    assert nueva
+    estado.agregar("hola")
+    assert gestor.obtener(1, "s1") == (estado, False)
+    # Mismo session_id de otro usuario: sesión distinta
+    assert gestor.obtener(2, "s1")[1]
+    time.sleep(0.06)
+    otra, nueva = gestor.obtener(1, "s1")
+    assert nueva and otra is not estado
+    gestor.cerrar(1, "s1")
+    assert gestor.obtener(1, "s1")[1]
@@ -0,0 +1,113 @@
+import sys
+import os
+import asyncio
+import io
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.subidas import abrir_wav, LimitarSubidas
+from app.main import app
+from benchmarks.wav_sinteticos import voz
+
+client = TestClient(app)
+
+
+def _leer(wav, max_segundos, tam_bloque=4096):
+    async def escenario():
+        formato, bloques = await abrir_wav(UploadFile(io.BytesIO(wav)), max_segundos=max_segundos, tam_bloque=tam_bloque)
+        return formato, [bloque async for bloque in bloques]
+    return asyncio.run(escenario())
+
+
+def test_abrir_wav_entrega_el_archivo_por_bloques_acotados():
+    wav = voz(1.0)
+    formato, bloques = _leer(wav, max_segundos=5)
+    assert formato == (16000, 1, 2)
+    assert b"".join(bloques) == wav
+    assert max(len(b) for b in bloques) <= 4096
+
+
+def test_abrir_wav_rechaza_audio_demasiado_largo():
+    wav = voz(3.0)
+    # Tamaño declarado en la cabecera: se rechaza sin leer el resto
+    with pytest.raises(HTTPException) as error:
+        _leer(wav, max_segundos=2)
+    assert error.value.status_code == 413
+    # Tamaño desconocido (WAV escrito en streaming): se corta al superar el límite
+    sin_tamano = bytearray(wav)
+    sin_tamano[40:44] = b"\xff\xff\xff\xff"
+    with pytest.raises(HTTPException) as error:
+        _leer(bytes(sin_tamano), max_segundos=2)
+    assert error.value.status_code == 413
+    with pytest.raises(HTTPException) as error:
+        _leer(b"ID3 no es un wav", max_segundos=2)
+    assert error.value.status_code == 400
+
+
+def test_limitar_subidas_responde_413_sin_llegar_al_endpoint():
+    llamadas = []
+
+    async def endpoint(request):
+        llamadas.append(len(await request.body()))
+        return PlainTextResponse("ok")
+
+    pequena = Starlette(routes=[Route("/transcribir-audio", endpoint, methods=["POST"])])
+    limitada = TestClient(LimitarSubidas(pequena, max_bytes=1000))
+    assert limitada.post("/transcribir-audio", content=b"x" * 500).status_code == 200
+    response = limitada.post("/transcribir-audio", content=b"x" * 5000)
+    assert response.status_code == 413
+    assert llamadas == [500]
+
+
+def test_transcribir_audio_lee_el_wav_por_bloques():
+    client.post("/register", json={"username": "subidas", "email": "subidas@example.com", "password": "testpass123"})
+    token = client.post("/login", data={"username": "subidas", "password": "testpass123"}).json()["access_token"]
+    response = client.post("/transcribir-audio", files={"file": ("llamada.wav", voz(1.0), "audio/wav")},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.json()["transcripcion"]
+
+
+def test_analizar_audio_stream_transcribe_por_segmentos_acotados(monkeypatch):
+    from app.core import transcripcion
+    from app.core.audio import leer_cabecera_wav
+    monkeypatch.setattr(transcripcion, "TRANSCRIPCION_MAX_SEGUNDOS", 5)
+    duraciones = []
+
+    async def transcribir_falso(wav):
+        sample_rate, canales, ancho, offset = leer_cabecera_wav(wav)
+        duraciones.append((len(wav) - offset) / (sample_rate * canales * ancho))
+        return "le llamo de su banco para confirmar un cargo"
+
+    monkeypatch.setattr(transcripcion, "transcribir_audio", transcribir_falso)
+    client.post("/register", json={"username": "subidas2", "email": "subidas2@example.com", "password": "testpass123"})
+    token = client.post("/login", data={"username": "subidas2", "password": "testpass123"}).json()["access_token"]
+    response = client.post("/analizar-audio-stream", files={"file": ("fragmento.wav", voz(12.0), "audio/wav")},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    # El fragmento nunca se reúne entero: Whisper recibe segmentos de como mucho 5 s
+    assert len(duraciones) >= 3 and max(duraciones) <= 5.1
+    assert response.json()["transcripcion"]
+
+
+def test_el_413_de_la_app_lleva_cabeceras_cors(monkeypatch):
+    from app import subidas
+    # El tamaño máximo se fija al crear la pila de middlewares: una app nueva con un límite pequeño
+    monkeypatch.setattr(subidas, "AUDIO_MAX_MB", 0.01)
+    monkeypatch.setattr(subidas, "MARGEN_MULTIPART", 0)
+    app.middleware_stack = None
+    try:
+        response = TestClient(app).post("/transcribir-audio", content=b"x" * 50000, headers={"Origin": "https://fraudwatch.example"})
+    finally:
+        app.middleware_stack = None
+    assert response.status_code == 413
+    # Sin la cabecera el navegador oculta el 413 al frontend y solo ve un error de red
+    assert response.headers["access-control-allow-origin"] == "*"
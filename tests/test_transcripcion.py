@@ -0,0 +1,80 @@
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core import transcripcion
+from app.core.transcripcion import transcribir_por_segmentos, unir_transcripciones
+from benchmarks.wav_sinteticos import conversacion, pcm
+
+
+def test_unir_transcripciones_quita_las_palabras_del_solape():
+    partes = [
+        ("Le llamo de su banco.", False),
+        ("De su banco, para confirmar una compra", True),
+        # La palabra cortada aparece a medias al final del segmento anterior
+        ("y luego con su tarj", False),
+        ("con su tarjeta de crédito", True),
+    ]
+    assert unir_transcripciones(partes) == "Le llamo de su banco. para confirmar una compra y luego con su tarjeta de crédito"
+    # Sin solape (corte en una pausa) no se toca el texto aunque se repita
+    assert unir_transcripciones([("vale vale", False), ("vale", False)]) == "vale vale vale"
+
+
+def test_transcribe_segmentos_en_paralelo_y_une_en_orden(monkeypatch):
+    monkeypatch.setattr(transcripcion, "TRANSCRIPCION_MIN_SEGUNDOS", 1)
+    monkeypatch.setattr(transcripcion, "TRANSCRIPCION_SILENCIO_MS", 500)
+    en_curso = [0, 0]  # [actual, máximo]
+    llamadas = []
+
+    # Se sustituye el segmento completo (no solo Whisper): las tareas empiezan en el orden
+    # en que se cortan, mientras que el remuestreo previo en el executor puede reordenarlas
+    async def transcribir_falso(segmento):
+        indice = len(llamadas)
+        llamadas.append(indice)
+        en_curso[0] += 1
+        en_curso[1] = max(en_curso[1], en_curso[0])
+        # Los primeros segmentos terminan los últimos
+        await asyncio.sleep(0.05 * (4 - indice))
+        en_curso[0] -= 1
+        return f"frase{indice}"
+
+    monkeypatch.setattr(transcripcion, "_transcribir_segmento", transcribir_falso)
+    wav = conversacion(frases=4, segundos_frase=1.5, pausa=1.0)
+
+    async def bloques():
+        for i in range(0, len(wav), 4096):
+            yield wav[i:i + 4096]
+
+    texto = asyncio.run(transcribir_por_segmentos(bloques(), paralelo=3))
+    assert texto == "frase0 frase1 frase2 frase3"
+    assert en_curso[1] == 3
+
+
+def test_marca_el_solape_de_los_cortes_forzados(monkeypatch):
+    monkeypatch.setattr(transcripcion, "TRANSCRIPCION_MIN_SEGUNDOS", 1)
+    monkeypatch.setattr(transcripcion, "TRANSCRIPCION_MAX_SEGUNDOS", 2)
+    monkeypatch.setattr(transcripcion, "TRANSCRIPCION_SOLAPE_MS", 500)
+    partes = []
+
+    async def transcribir_falso(segmento):
+        return f"segmento{len(partes)}"
+
+    def unir_falso(pares):
+        partes.extend(pares)
+        return ""
+
+    monkeypatch.setattr(transcripcion, "_transcribir_segmento", transcribir_falso)
+    monkeypatch.setattr(transcripcion, "unir_transcripciones", unir_falso)
+    # Una frase de 5 s sin pausa (cortes forzados) y, tras una pausa, otra corta
+    wav = conversacion(frases=1, segundos_frase=5.0, pausa=1.0) + pcm(conversacion(frases=1, segundos_frase=1.5, pausa=1.0, semilla=1))
+
+    async def bloques():
+        yield wav
+
+    asyncio.run(transcribir_por_segmentos(bloques()))
+    solapas = [solapa for _, solapa in partes]
+    # Solo los segmentos que siguen a un corte forzado (aunque el último dure menos del máximo)
+    assert solapas[0] is False and all(solapas[1:-1]) and solapas[-1] is False
+    assert len(solapas) >= 4
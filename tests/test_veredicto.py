@@ -0,0 +1,25 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.veredicto import Veredicto, Diagnostico
+
+
+def test_respuesta_del_modelo_se_normaliza():
+    veredicto = Veredicto.desde_respuesta('{"diagnostico": "no es estafa", "explicacion": "saludo", "riesgo": "140"}')
+    assert veredicto.diagnostico is Diagnostico.NO_ESTAFA
+    assert veredicto.riesgo == 100
+    assert veredicto.a_dict() == {"diagnostico": "No Estafa", "riesgo": 100, "explicacion": "saludo"}
+
+    sin_formato = Veredicto.desde_respuesta("Parece una estafa, riesgo 80%")
+    assert not sin_formato.estructurado
+    assert sin_formato.texto == "Parece una estafa, riesgo 80%"
+
+
+def test_texto_legible_ida_y_vuelta():
+    veredicto = Veredicto("Estafa", 90, "Pide la clave\ndel banco")
+    assert veredicto.texto == "Diagnóstico: Estafa\n\nExplicación: Pide la clave\ndel banco\n\nRiesgo: 90/100"
+    assert Veredicto.desde_texto(veredicto.texto) == veredicto
+    assert Veredicto.desde_json(veredicto.a_json()) == veredicto
+    assert Veredicto.de_error("Error en el análisis con OpenAI: x").texto.startswith("Error en el análisis")
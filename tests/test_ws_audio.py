@@ -0,0 +1,115 @@
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import main
+from app.main import app
+from app.core.veredicto import Veredicto
+
+client = TestClient(app)
+
+
+def _token(username):
+    client.post("/register", json={"username": username, "email": f"{username}@example.com", "password": "testpass123"})
+    response = client.post("/login", data={"username": username, "password": "testpass123"})
+    return response.json()["access_token"]
+
+
+def _pcm(segundos, frecuencia=None, sample_rate=16000):
+    t = np.arange(int(segundos * sample_rate)) / sample_rate
+    muestras = 0.3 * np.sin(2 * np.pi * frecuencia * t) if frecuencia else np.zeros_like(t)
+    return (muestras * 32767).astype('<i2').tobytes()
+
+
+def test_ws_envia_transcripcion_y_veredicto_al_terminar_la_voz(monkeypatch):
+    async def transcribir_falso(segmento):
+        return "le llamo del banco necesito su clave"
+
+    async def analizar_falso(texto):
+        return Veredicto("Estafa", 90, "Pide la clave")
+
+    monkeypatch.setattr(main, "transcribir_audio", transcribir_falso)
+    monkeypatch.setattr(main, "analizar_con_ia", analizar_falso)
+    token = _token("wsuser")
+
+    with client.websocket_connect("/ws/analizar-audio") as ws:
+        ws.send_json({"token": token, "session_id": "ws-1", "origen": "microfono", "sample_rate": 16000})
+        assert ws.receive_json() == {"tipo": "listo", "session_id": "ws-1"}
+        # Voz y después silencio, en frames de 250 ms: el segmento se cierra sin esperar a "fin"
+        audio = _pcm(1.0, 220) + _pcm(1.0)
+        for inicio in range(0, len(audio), 8000):
+            ws.send_bytes(audio[inicio:inicio + 8000])
+        assert ws.receive_json() == {"tipo": "transcripcion", "texto": "le llamo del banco necesito su clave"}
+        evento = ws.receive_json()
+        assert evento["tipo"] == "veredicto"
+        assert evento["veredicto"] == {"diagnostico": "Estafa", "riesgo": 90, "explicacion": "Pide la clave"}
+        ws.send_json({"tipo": "fin"})
+        assert ws.receive_json() == {"tipo": "fin", "session_id": "ws-1", "fragmentos": 1}
+
+
+def test_ws_rechaza_token_invalido():
+    with client.websocket_connect("/ws/analizar-audio") as ws:
+        ws.send_json({"token": "no-es-un-token", "sample_rate": 16000})
+        with pytest.raises(WebSocketDisconnect) as error:
+            ws.receive_json()
+    assert error.value.code == 1008
+
+
+def test_ws_acota_segmentos_en_vuelo_y_aisla_los_fallos(monkeypatch):
+    en_curso = [0, 0]  # [actual, máximo]
+
+    async def transcribir_falso(segmento):
+        en_curso[0] += 1
+        en_curso[1] = max(en_curso[1], en_curso[0])
+        await asyncio.sleep(0.05)
+        en_curso[0] -= 1
+        return "hola te llamo para la cena"
+
+    async def analizar_falso(texto):
+        return Veredicto("No Estafa", 5, "Conversación normal")
+
+    guardados = []
+
+    async def guardar_falso(estado, usuario_id, session_id, origen):
+        guardados.append(estado.fragmentos)
+        if len(guardados) == 1:
+            raise RuntimeError("base de datos caída")
+
+    monkeypatch.setattr(main, "WS_AUDIO_SEGMENTOS_EN_VUELO", 2)
+    monkeypatch.setattr(main, "transcribir_audio", transcribir_falso)
+    monkeypatch.setattr(main, "analizar_con_ia", analizar_falso)
+    monkeypatch.setattr(main, "guardar_sesion", guardar_falso)
+    token = _token("wsuser2")
+
+    with client.websocket_connect("/ws/analizar-audio") as ws:
+        ws.send_json({"token": token, "session_id": "ws-2", "sample_rate": 16000})
+        ws.receive_json()
+        ws.send_bytes((_pcm(0.5, 220) + _pcm(1.0)) * 5)
+        ws.send_json({"tipo": "fin"})
+        eventos = []
+        while not eventos or eventos[-1]["tipo"] != "fin":
+            eventos.append(ws.receive_json())
+    tipos = [e["tipo"] for e in eventos]
+    # El fallo al guardar el primer segmento no impide procesar los siguientes
+    assert tipos.count("error") == 1
+    assert tipos.count("transcripcion") == 5
+    assert eventos[-1]["fragmentos"] == 5
+    assert en_curso[1] == 2
+
+
+def test_ws_cierra_con_texto_que_no_es_json():
+    token = _token("wsuser3")
+    with client.websocket_connect("/ws/analizar-audio") as ws:
+        ws.send_json({"token": token, "sample_rate": 16000})
+        ws.receive_json()
+        ws.send_text("esto no es json")
+        with pytest.raises(WebSocketDisconnect) as error:
+            ws.receive_json()
+    assert error.value.code == 1003